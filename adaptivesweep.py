@@ -0,0 +1,124 @@
+MEGA = 1_000_000
+
+
+def refine(freqs, measure_fn, key, tol, max_points, f_step_min=MEGA):
+    # measure_fn(f) -> point dict, or None if the sweep was cancelled
+    return drive(refine_steps(freqs, key, tol, max_points, f_step_min), measure_fn)
+
+
+def refine_steps(freqs, key, tol, max_points, f_step_min=MEGA):
+    # the refinement plan without the measurement: yields a frequency, receives its point via send()
+    points = dict()
+    for f in freqs:
+        points[f] = yield f
+
+    while len(points) < max_points:
+        fs = sorted(points)
+        ys = [points[f][key] for f in fs]
+
+        candidates = [
+            (score, lo, hi)
+            for score, lo, hi in _interval_scores(fs, ys)
+            if score > tol and hi - lo >= 2 * f_step_min
+        ]
+        if not candidates:
+            break
+
+        _, lo, hi = max(candidates)
+        f = round((lo + hi) / 2 / f_step_min) * f_step_min
+        if f in points:
+            break
+
+        points[f] = yield f
+
+    return [points[f] for f in sorted(points)]
+
+
+def sweep_steps(task, params, adaptive=True):
+    # the whole sweep plan: yields task rows, receives measured points via send();
+    # repeats either run the sweep N times over or N times in each point, adaptive rows
+    # get intermediate frequencies with corrections interpolated from the neighbouring task points
+    repeats = max(int(params.get('repeat', 1)), 1)
+    per_point = repeats > 1 and params.get('repeat_point', 0)
+    adapt_tol = params.get('adapt_tol', 0) if adaptive else 0
+
+    def point_steps(row, k):
+        # refinement sees the last of the repeats
+        if repeats == 1:
+            return (yield row)
+        if not per_point:
+            return (yield {**row, 'repeat': k})
+        point = None
+        for j in range(repeats):
+            point = yield {**row, 'repeat': j}
+        return point
+
+    for k in range(1 if per_point else repeats):
+        if adapt_tol <= 0:
+            for row in task:
+                yield from point_steps(row, k)
+            continue
+
+        for row in group_rows(task):
+            steps = refine_steps([t['f'] for t in row], 'adjusted_pow', adapt_tol, params.get('adapt_points', len(row)))
+            point = None
+            while True:
+                try:
+                    f = steps.send(point)
+                except StopIteration:
+                    break
+                point = yield from point_steps(interpolate_point(row, f), k)
+    return True
+
+
+def drive(steps, measure_fn):
+    # runs a plan, returns its result, or None if measure_fn returned None (cancelled or aborted)
+    point = None
+    try:
+        while True:
+            point = measure_fn(steps.send(point))
+            if point is None:
+                return None
+    except StopIteration as stop:
+        return stop.value
+
+
+def interpolate_point(row, f):
+    # row -- task points for one power level, sorted by 'f'
+    fs = [r['f'] for r in row]
+    for r in row:
+        if r['f'] == f:
+            return dict(r)
+
+    right = next((i for i, x in enumerate(fs) if x > f), len(fs) - 1)
+    right = max(right, 1)
+    left = right - 1
+
+    lo, hi = row[left], row[right]
+    k = (f - lo['f']) / (hi['f'] - lo['f'])
+    point = {
+        key: (lo[key] + (hi[key] - lo[key]) * k) if key != 'p_ref' else lo[key]
+        for key in lo.keys()
+    }
+    point['f'] = f
+    return point
+
+
+def group_rows(task, key='p_ref'):
+    rows = dict()
+    for point in task:
+        rows.setdefault(point[key], []).append(point)
+    return [sorted(row, key=lambda r: r['f']) for row in rows.values()]
+
+
+def _interval_scores(fs, ys):
+    # how far the middle node of each triple deviates from a straight line through its neighbours
+    curvature = [0.0] * len(fs)
+    for i in range(1, len(fs) - 1):
+        k = (fs[i] - fs[i - 1]) / (fs[i + 1] - fs[i - 1])
+        curvature[i] = abs(ys[i] - (ys[i - 1] + (ys[i + 1] - ys[i - 1]) * k))
+
+    return [
+        (max(abs(ys[i + 1] - ys[i]), curvature[i], curvature[i + 1]), fs[i], fs[i + 1])
+        for i in range(len(fs) - 1)
+    ]
@@ -0,0 +1,321 @@
+import ast
+import asyncio
+
+from collections import defaultdict
+from functools import partial
+
+from forgot_again.file import pprint_to_file
+
+from adaptivesweep import refine_steps, sweep_steps
+from asyncinstrument import AsyncInstrument, sleep
+from cancellation import Cancelled
+from instr.instrumentfactory import mock_enabled
+from instrumentcontroller import GIGA
+from limitmask import LimitMask, LimitChecker
+
+
+class AsyncInstrumentController:
+    # корутинные версии калибровки и измерений поверх обычного контроллера:
+    # настройки, подключение и профили приборов берутся у него
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._async = dict()
+
+    def __getattr__(self, item):
+        return getattr(self._controller, item)
+
+    def __str__(self):
+        return f'{self._controller}'
+
+    def _instrument(self, name):
+        inst = self._controller._instruments[name]
+        wrapper = self._async.get(name)
+        if wrapper is None or wrapper.inst is not inst:
+            # сессию заменили (переподключение, журнал SCPI) -- поток старой обёртки больше не нужен
+            if wrapper is not None:
+                wrapper.close()
+            wrapper = self._async[name] = AsyncInstrument(inst)
+        return wrapper
+
+    async def _init(self, profile, register=0):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self._controller._init, profile, register=register))
+
+    async def _checkSessions(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._controller._checkSessions)
+
+    async def _fetch(self, meter, src, currents=None):
+        if currents is None:
+            read_pow, read_curr = await asyncio.gather(meter.query('FETCH?'), src.query('MEAS:CURR?'))
+            return float(read_pow.strip()), float(read_curr.strip())
+        # значение придёт из буфера после окончания развёртки
+        read_pow, _ = await asyncio.gather(meter.query('FETCH?'), src.call(currents.trigger))
+        return float(read_pow.strip()), float('nan')
+
+    async def calibrateIn(self, **kwargs):
+        report_fn = kwargs.pop('report_fn')
+        token = kwargs.pop('token')
+        params = kwargs.pop('params')
+        print(f'call async calibrate in with {report_fn} {token} {params}')
+
+        ok, msg = await self._checkSessions()
+        if not ok:
+            return ok, msg
+
+        import numpy as np
+
+        gen = self._instrument('Генератор')
+        meter = self._instrument('Изм. мощности')
+
+        accuracy = 0.05
+
+        pows = [round(x, 1) for x in np.arange(start=params['p_min'], stop=params['p_max'] + 0.000001, step=params['p_delta'])]
+        freqs = [round(x) for x in np.arange(start=params['f_min'] * GIGA, stop=params['f_max'] * GIGA + 0.000001, step=params['f_delta'] * GIGA)]
+
+        mocked_raw_data = _load_mock('./mock_data/cal_in_res.txt')
+        result = []
+
+        async def measure_point(p, f):
+            if token.cancelled:
+                return None
+
+            await asyncio.gather(gen.send(f'POW {p}dbm'), gen.send(f'FREQ {f}'), meter.send(f'SENS1:FREQ {f}'))
+            await gen.send('OUTP ON')
+            await meter.send('ABORT')
+            await meter.send('INIT')
+
+            if not mock_enabled:
+                await sleep(token, 0.5)
+
+            new_pow = p
+            read_pow = float((await meter.query('FETCH?')).strip())
+            diff = p - read_pow
+            prev = diff
+
+            if not mock_enabled:
+                while abs(diff) > accuracy:
+                    prev = diff
+                    if token.cancelled:
+                        return None
+
+                    new_pow = new_pow + diff
+                    await gen.send(f'POW {new_pow}dbm')
+                    await meter.send('ABORT')
+                    await meter.send('INIT')
+
+                    await sleep(token, 0.5)
+
+                    read_pow = float((await meter.query('FETCH?')).strip())
+                    diff = p - read_pow
+
+            raw_point = {
+                'f': f,
+                'p': p,
+                'read_pow': read_pow,
+                'delta': prev,
+            }
+
+            if mocked_raw_data:
+                raw_point = mocked_raw_data[len(result)]
+
+            print(raw_point)
+            report_fn(raw_point)
+            result.append(raw_point)
+            return raw_point
+
+        try:
+            if await self._init(self._controller._continuousProfile(params)):
+                await self._warmup(gen, meter, pows[0], freqs[0], token, 0.2)
+
+            # сетка по первому уровню мощности, как в обычной калибровке
+            adapt_tol = params.get('adapt_tol', 0)
+            if adapt_tol > 0 and not mock_enabled:
+                p = pows[0]
+                points = await _drive(
+                    refine_steps(freqs, 'delta', adapt_tol, params.get('adapt_points', len(freqs))),
+                    lambda f: measure_point(p, f),
+                )
+                if points is None:
+                    return False, 'calibrate in cancel'
+                result.sort(key=lambda point: point['f'])
+                freqs = [point['f'] for point in points]
+                pows = pows[1:]
+
+            for p in pows:
+                for f in freqs:
+                    if await measure_point(p, f) is None:
+                        return False, 'calibrate in cancel'
+        except Cancelled:
+            return False, 'calibrate in cancel'
+        except asyncio.TimeoutError:
+            return False, 'calibrate in instrument timeout'
+        finally:
+            await self._safeState(gen)
+
+        pprint_to_file('cal_in_res.txt', result)
+        return True, 'calibrate in done'
+
+    async def measure(self, **kwargs):
+        return await self._measureTask(pulse=False, **kwargs)
+
+    async def measurePulse(self, **kwargs):
+        return await self._measureTask(pulse=True, **kwargs)
+
+    async def _measureTask(self, pulse, **kwargs):
+        report_fn = kwargs.pop('report_fn')
+        token = kwargs.pop('token')
+        params = kwargs.pop('params')
+        task = kwargs.pop('task')
+        dut = kwargs.pop('dut', '')
+        mode = 'pulse' if pulse else 'continuous'
+        print(f'call async {mode} measure with {report_fn} {token} {params} {task}')
+
+        ok, msg = await self._checkSessions()
+        if not ok:
+            return ok, msg
+
+        gen = self._instrument('Генератор')
+        meter = self._instrument('Изм. мощности')
+        src = self._instrument('Источник')
+
+        if pulse:
+            profile = self._controller._pulseProfile(params)
+            register = int(params.get('rcl_reg', 0))
+            settle = 0.5
+        else:
+            profile = self._controller._continuousProfile(params)
+            register = 0
+            settle = 0.1
+
+        mocked_raw_data = _load_mock('./mock_data/pulse1.txt' if pulse else './mock_data/measure_res.txt')
+        mock_index = defaultdict(int)
+
+        result = []
+        currents = None
+        limits = LimitChecker(LimitMask.from_file('limits.ini'), params.get('fail_after', 0))
+
+        async def measure_point(row):
+            if token.cancelled:
+                return None
+
+            f = row['f']
+            p = row['p']
+            p_ref = row['p_ref']
+
+            await asyncio.gather(gen.send(f'POW {p + row["delta_in"]}dbm'), gen.send(f'FREQ {f}'), meter.send(f'SENS1:FREQ {f}'))
+            await gen.send('OUTP ON')
+            if not pulse:
+                await meter.send('ABORT')
+                await meter.send('INIT')
+
+            if not mock_enabled:
+                await sleep(token, settle)
+
+            read_pow, read_curr = await self._fetch(meter, src, currents)
+
+            point = {
+                'f': f,
+                'p': p_ref if pulse else p,
+                'read_pow': read_pow,
+                'adjusted_pow': read_pow + row['delta_out'],
+                'p_ref': p_ref,
+                'read_curr': read_curr,
+            }
+
+            if mocked_raw_data:
+                k = row.get('repeat', 0)
+                point = dict(mocked_raw_data[mock_index[k] % len(mocked_raw_data)])
+                mock_index[k] += 1
+                # при буфере ток -- только из имитатора источника, как у обычного контроллера
+                if currents is not None:
+                    point['read_curr'] = read_curr
+
+            point['repeat'] = row.get('repeat', 0)
+            point['limit_ok'] = limits.check(point)
+
+            result.append(point)
+            report_fn(point)
+            if limits.abort:
+                return None
+            return point
+
+        try:
+            if await self._init(profile, register=register):
+                await self._warmup(gen, meter, task[0]['p'], task[0]['f'], token, 1 if pulse else 0.2, pulse=pulse)
+
+            # буфер тока, повторы и адаптивная сетка -- те же, что у обычного контроллера
+            currents = await src.call(partial(self._controller._currentBuffer, src.inst, params, task, pulse))
+
+            if await _drive(sweep_steps(task, params, adaptive=not mock_enabled), measure_point) is None:
+                if limits.abort:
+                    if currents is not None:
+                        await src.call(partial(self._controller._fillCurrents, currents, result, report_fn, limits))
+                    pprint_to_file(f'out_{mode}.txt', result)
+                    await self._storeRun(mode, params, task, result, dut, f'out_{mode}.txt', status='aborted')
+                    return False, f'measure {mode} limit abort: {limits.summary()}'
+                return False, f'measure {mode} cancel'
+
+            if currents is not None:
+                await src.call(partial(self._controller._fillCurrents, currents, result, report_fn, limits))
+        except Cancelled:
+            return False, f'measure {mode} cancel'
+        except asyncio.TimeoutError:
+            return False, f'measure {mode} instrument timeout'
+        finally:
+            await self._safeState(gen)
+
+        pprint_to_file(f'out_{mode}.txt', result)
+        await self._storeRun(mode, params, task, result, dut, f'out_{mode}.txt')
+        if not limits.passed:
+            return False, f'measure {mode} limits {limits.summary()}'
+        return True, 'measure success'
+
+    async def _storeRun(self, mode, params, task, result, dut, out_file, status='complete'):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self._controller._storeRun, mode, params, task, result, dut, out_file, status))
+
+    async def _safeState(self, gen):
+        # ВЧ снимается при любом выходе: таймаут, исключение, отмена задачи через AsyncRunner.cancelAll
+        try:
+            await gen.send('OUTP OFF')
+        except Exception as ex:
+            print(f'safe state error: {ex!r}')
+
+    async def _warmup(self, gen, meter, p, f, token, delay, pulse=False):
+        # автоматическое измерение ошибается в первой точке, измеряем пустышку
+        await gen.send(f'POW {p}dbm')
+        await gen.send(f'FREQ {f}')
+        await meter.send(f'SENS1:FREQ {f}')
+        if pulse:
+            if not mock_enabled:
+                await sleep(token, delay)
+            await gen.send('OUTP ON')
+            if not mock_enabled:
+                await sleep(token, delay)
+        else:
+            await gen.send('OUTP ON')
+            await meter.send('ABORT')
+            await meter.send('INIT')
+            await sleep(token, delay)
+        await meter.query('FETCH?')
+
+
+async def _drive(steps, measure_fn):
+    # план развёртки тот же, что у обычного контроллера (adaptivesweep.drive), точки меряет корутина
+    point = None
+    try:
+        while True:
+            point = await measure_fn(steps.send(point))
+            if point is None:
+                return None
+    except StopIteration as stop:
+        return stop.value
+
+
+def _load_mock(file_name):
+    if not mock_enabled:
+        return None
+    with open(file_name, mode='rt', encoding='utf-8') as f:
+        return ast.literal_eval(''.join(f.readlines()))
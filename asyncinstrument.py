@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import Cancelled, abandon
+
+QUERY_TIMEOUT = 10
+
+_qt_loop = None
+_runner = None
+
+
+class AsyncInstrument:
+    # VISA блокирующий, поэтому у каждого прибора свой поток-исполнитель:
+    # команды одному прибору идут строго по очереди, разные приборы работают параллельно
+
+    def __init__(self, inst, timeout=QUERY_TIMEOUT):
+        self._inst = inst
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'visa-{getattr(inst, "addr", "")}')
+
+    def __str__(self):
+        return f'Async({self._inst})'
+
+    @property
+    def inst(self):
+        return self._inst
+
+    async def call(self, fn, *args, timeout=None):
+        loop = asyncio.get_running_loop()
+        # по таймауту или отмене ожидание прерывается, но сам вызов VISA завершится только по своему таймауту,
+        # поэтому за ним сессия очищается, как у cancellation.query
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, fn, *args), timeout or self._timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            abandon(self._inst, self._executor)
+            raise
+
+    async def send(self, cmd, timeout=None):
+        return await self.call(self._inst.send, cmd, timeout=timeout)
+
+    async def query(self, question, timeout=None):
+        return await self.call(self._inst.query, question, timeout=timeout)
+
+    def close(self):
+        # начатый вызов и очистка сессии за брошенным запросом доработают, потом поток завершится
+        self._executor.shutdown(wait=False)
+
+
+class AsyncRunner:
+    # тот же контракт, что у BackgroundWorker.runTask: fn_finished получает кортеж (ok, msg)
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._thread = None
+        self._tasks = set()
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='asyncio', daemon=True)
+            self._thread.start()
+
+    def runTask(self, fn, fn_finished, **kwargs):
+        if self._thread is None:
+            task = self._loop.create_task(fn(**kwargs))
+        else:
+            task = asyncio.run_coroutine_threadsafe(fn(**kwargs), self._loop)
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._finished(t, fn_finished))
+        return task
+
+    def _finished(self, task, fn_finished):
+        self._tasks.discard(task)
+        if task.cancelled():
+            fn_finished((False, 'task cancelled'))
+            return
+        ex = task.exception()
+        if ex is not None:
+            fn_finished((False, f'task error: {ex!r}'))
+            return
+        fn_finished(task.result())
+
+    def cancelAll(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+
+def install_qt_loop(app):
+    # с qasync корутины крутятся прямо в цикле событий Qt, без отдельного потока
+    global _qt_loop
+    try:
+        import qasync
+    except ImportError:
+        print('qasync not found, asyncio loop will run in a background thread')
+        return None
+
+    _qt_loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(_qt_loop)
+    return _qt_loop
+
+
+def runner():
+    global _runner
+    if _runner is None:
+        _runner = AsyncRunner(loop=_qt_loop)
+    return _runner
+
+
+async def sleep(token, delay, step=0.05):
+    # ожидание, которое прерывается отменой задачи; как cancellation.sleep, при отмене -- Cancelled
+    while delay > 0:
+        if token.cancelled:
+            raise Cancelled()
+        await asyncio.sleep(min(step, delay))
+        delay -= step
+    if token.cancelled:
+        raise Cancelled()
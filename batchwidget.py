@@ -0,0 +1,168 @@
+import inspect
+import threading
+
+from PyQt5.QtWidgets import QWidget, QHeaderView, QMessageBox
+from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal
+
+from pointbatcher import PointBatcher
+from repeatstats import RepeatStats
+from cancellation import CancelEvent
+from mytools.backgroundworker import BackgroundWorker, TaskResult
+from instrumentcontroller import InstrumentController
+from pulsemeasurepowmodel import PulseMeasurePowModel
+from uicache import load_ui
+
+MODES = {
+    'continuous': 'непрерывный',
+    'pulse': 'импульсный',
+}
+
+
+class BatchWidget(QWidget):
+    _measureFinished = pyqtSignal(TaskResult)
+    _promptRequested = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, controller: InstrumentController=None):
+        super().__init__(parent)
+
+        self.setAttribute(Qt.WA_QuitOnClose)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+
+        # create instance variables
+        self._ui = load_ui('batchwidget.ui', self)
+
+        self._worker = BackgroundWorker(self)
+        self._token = CancelEvent()
+        self._batcher = PointBatcher(parent=self)
+
+        self._controller = controller
+
+        self._task = list()
+        self._modelPow = PulseMeasurePowModel(parent=self)
+        self._stats = RepeatStats()
+        self._golden = None
+
+        # оператор отвечает на запрос смены DUT в GUI-потоке, поток измерения ждёт ответа
+        self._promptAnswered = threading.Event()
+        self._promptAnswer = False
+
+        self._connectSignals()
+        self._initUi()
+
+    def _connectSignals(self):
+        self._measureFinished.connect(self.on_measure_finished, type=Qt.QueuedConnection)
+        self._batcher.batchReady.connect(self.on_measureBatch)
+        self._promptRequested.connect(self.on_promptRequested, type=Qt.QueuedConnection)
+
+    def _initUi(self):
+        self._ui.tableMeasurePow.setModel(self._modelPow)
+        self._ui.tableMeasurePow.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+    # worker dispatch
+    def _startWorker(self, fn, cb, **kwargs):
+        if inspect.iscoroutinefunction(fn):
+            from asyncinstrument import runner
+            runner().runTask(fn=fn, fn_finished=cb, **kwargs)
+            return
+        self._worker.runTask(fn=fn, fn_finished=cb, **kwargs)
+
+    def _queue(self):
+        queue = list()
+        for line in self._ui.editQueue.toPlainText().splitlines():
+            parts = line.split()
+            if not parts:
+                continue
+            serial = parts[0]
+            mode = parts[1] if len(parts) > 1 else 'continuous'
+            if mode not in MODES:
+                print(f'unknown mode {mode} for {serial}, skip')
+                continue
+            queue.append((serial, mode))
+        return queue
+
+    def _measure(self):
+        from goldencompare import GoldenCompare
+
+        self._modelPow.clear()
+        self._stats.clear()
+        self._golden = GoldenCompare.from_config('golden.ini', getattr(self._controller, 'dataset', None))
+        queue = self._queue()
+        if not self._task or not queue:
+            return
+        self._ui.pteditLog.clear()
+        self._token = CancelEvent()
+        self._batcher.start()
+        self._startWorker(
+            fn=self._controller.measureBatch,
+            cb=self._measureFinishedCallback,
+            report_fn=self._measureInProgress,
+            params=self._controller.secondaryParams.params,
+            token=self._token,
+            task=self._task,
+            queue=queue,
+            prompt_fn=self._promptDut,
+        )
+
+    # callbacks
+    def _measureFinishedCallback(self, result: tuple):
+        self._measureFinished.emit(TaskResult(*result))
+
+    def _measureInProgress(self, data):
+        self._batcher.push(data)
+
+    def _promptDut(self, serial, mode):
+        self._promptAnswered.clear()
+        self._promptRequested.emit(serial, mode)
+        self._promptAnswered.wait()
+        return self._promptAnswer and not self._token.cancelled
+
+    @pyqtSlot(str, str)
+    def on_promptRequested(self, serial, mode):
+        self._batcher.flush()
+        res = QMessageBox.question(self, 'Вопрос', f'Подключите {serial}, режим: {MODES[mode]}. Продолжить?')
+        self._promptAnswer = res == QMessageBox.Yes
+        if self._promptAnswer:
+            self._logGolden()
+            self._modelPow.clear()
+            self._stats.clear()
+            self._ui.pteditLog.appendPlainText(f'{serial}: {MODES[mode]}')
+        self._promptAnswered.set()
+
+    def _logGolden(self):
+        # итог сравнения с эталоном -- по каждому прибору партии
+        if self._golden is None or not self._golden.checked:
+            return
+        self._ui.pteditLog.appendPlainText(self._golden.summary())
+        self._golden.clear()
+
+    @pyqtSlot(TaskResult)
+    def on_measure_finished(self, result):
+        self._batcher.stop()
+        self._logGolden()
+        ok, msg = result.values
+        self._ui.pteditLog.appendPlainText(msg)
+        if not ok:
+            print(f'error during batch measure: {msg}')
+            return
+        print('batch result', ok, msg)
+
+    @pyqtSlot(list)
+    def on_calTask_ready(self, task):
+        self._task = task
+
+    @pyqtSlot(list)
+    def on_measureBatch(self, points):
+        points = self._stats.update(points)
+        if self._golden is not None:
+            points = self._golden.update(points)
+        self._modelPow.updateBatch(points)
+
+    @pyqtSlot()
+    def on_btnStart_clicked(self):
+        self._measure()
+
+    @pyqtSlot()
+    def on_btnCancel_clicked(self):
+        self._token.cancelled = True
+        self._promptAnswer = False
+        self._promptAnswered.set()
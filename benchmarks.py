@@ -0,0 +1,318 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# замеры производительности, запускать из каталога проекта:
+#   python benchmarks.py startup
+#   python benchmarks.py headless
+#   python benchmarks.py cancel --runs 20
+#   python benchmarks.py export --rows 120000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# тяжёлые модули, которые не должны грузиться до появления окна
+STARTUP_FORBIDDEN = ['pandas', 'pyarrow', 'openpyxl', 'matplotlib', 'numpy', 'pyqtgraph', 'formlayout']
+# консольный запуск обходится без GUI вообще
+HEADLESS_FORBIDDEN = ['PyQt5', 'pyqtgraph', 'openpyxl', 'pandas', 'pyarrow', 'matplotlib']
+
+# бюджеты, с; те же числа проверяет tests/test_startup.py
+STARTUP_BUDGET = 2.0
+HEADLESS_BUDGET = 1.0
+
+STARTUP_SCRIPT = """
+import sys
+import time
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+
+from mainwindow import MainWindow
+
+
+def shown():
+    print(f'window shown at {time.time()}', flush=True)
+    app.quit()
+
+
+app = QApplication(sys.argv)
+window = MainWindow()
+window.show()
+QTimer.singleShot(0, shown)
+app.exec_()
+"""
+
+
+def _import_times(stderr):
+    # строки вида 'import time: self [us] | cumulative | imported package', вложенность -- отступом
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def _print_errors(stderr):
+    print('\n'.join(line for line in stderr.splitlines() if not line.startswith('import time:'))[-2000:])
+
+
+def _print_imports(times, top):
+    total = sum(cumulative for _, cumulative, depth in times.values() if depth == 0)
+    print(f'imports total: {total / 1_000_000:.3f} s, {len(times)} modules')
+    # модули проекта импортируются из скрипта напрямую или через main/mainwindow, поэтому два верхних уровня
+    print('slowest imports:')
+    upper = {name: cumulative for name, (_, cumulative, depth) in times.items() if depth <= 1}
+    for name, cumulative in sorted(upper.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f'  {cumulative / 1000:9.1f} ms  {name}')
+
+
+def _check_forbidden(times, forbidden, where):
+    loaded = sorted(name for name in forbidden if name in times)
+    if loaded:
+        print(f'FAIL: loaded {where}: {", ".join(loaded)}')
+    return not loaded
+
+
+def bench_startup(args):
+    started = time.time()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    if proc.returncode != 0:
+        _print_errors(proc.stderr)
+        return False
+
+    shown = [line for line in proc.stdout.splitlines() if line.startswith('window shown at')]
+    if not shown:
+        print('window was not shown')
+        return False
+    to_window = float(shown[0].rsplit(' ', 1)[1]) - started
+
+    times = _import_times(proc.stderr)
+
+    print(f'time to first window: {to_window:.3f} s')
+    _print_imports(times, args.top)
+
+    ok = _check_forbidden(times, STARTUP_FORBIDDEN, 'before first window')
+    if args.budget and to_window > args.budget:
+        print(f'FAIL: time to first window {to_window:.3f} s exceeds budget {args.budget:.3f} s')
+        ok = False
+    return ok
+
+
+def bench_headless(args):
+    started = time.time()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import runner'],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    elapsed = time.time() - started
+    if proc.returncode != 0:
+        _print_errors(proc.stderr)
+        return False
+
+    times = _import_times(proc.stderr)
+
+    print(f'headless runner import: {elapsed:.3f} s')
+    _print_imports(times, args.top)
+
+    ok = _check_forbidden(times, HEADLESS_FORBIDDEN, 'by headless runner')
+    if args.budget and elapsed > args.budget:
+        print(f'FAIL: headless runner import {elapsed:.3f} s exceeds budget {args.budget:.3f} s')
+        ok = False
+    return ok
+
+
+def bench_cancel(args):
+    # развёртка на имитаторах приборов, отмена посреди FETCH? -- время от отмены до OUTP OFF
+    from cancellation import CancelEvent
+    from instr.instrumentfactory import mock_enabled
+    from instrumentcontroller import InstrumentController
+    from siminstruments import SimulatedGenerator, SimulatedMeter, SimulatedSupply
+
+    if mock_enabled:
+        print('mock mode replaces instrument readings, run without it')
+        return False
+
+    controller = InstrumentController()
+    gen = SimulatedGenerator()
+    controller._instruments = {
+        'Генератор': gen,
+        'Изм. мощности': SimulatedMeter(fetch_delay=args.fetch),
+        'Источник': SimulatedSupply(),
+    }
+    params = {**controller.secondaryParams.params, 'adapt_tol': 0, 'curr_buf': 0, 'fail_after': 0}
+    task = [
+        {'f': f * 1_000_000_000, 'p': 0.0, 'p_ref': 0.0, 'delta_in': 0.0, 'delta_out': 0.0}
+        for f in range(1, 1000)
+    ]
+
+    rnd = random.Random(args.seed)
+    latencies = list()
+    for _ in range(args.runs):
+        token = CancelEvent()
+        gen.offAt = None
+        results = list()
+        worker = threading.Thread(target=lambda: results.append(controller.measure(
+            report_fn=lambda point: None,
+            token=token,
+            params=params,
+            task=task,
+        )))
+        worker.start()
+        time.sleep(args.after + rnd.uniform(0, args.fetch))
+        token.cancelled = True
+        worker.join()
+
+        if gen.offAt is None or not results or results[0][0]:
+            print(f'run was not cancelled: {results}')
+            return False
+        latencies.append(gen.offAt - token.cancelledAt)
+
+    mean = sum(latencies) / len(latencies)
+    worst = max(latencies)
+    print(f'cancel to rf off over {len(latencies)} runs: mean {mean * 1000:.1f} ms, max {worst * 1000:.1f} ms')
+
+    if args.budget and worst > args.budget:
+        print(f'FAIL: cancel latency {worst:.3f} s exceeds budget {args.budget:.3f} s')
+        return False
+    return True
+
+
+def bench_export(args):
+    # выгрузка в Excel синтетического прогона: три напряжения питания, гармоники по первому
+    from measureresult import MeasureResult
+
+    per_src = args.rows // 3
+    result = MeasureResult()
+    result.adjustment = None
+    for u_src in (4.7, 5.0, 5.3):
+        for i in range(per_src):
+            u_control = i * 0.01
+            result.add_point({
+                'u_src': u_src,
+                'u_control': u_control,
+                'read_f': (1000 + 50 * u_control + u_src) * 1_000_000,
+                'read_p': 10 - 0.01 * u_control,
+                'read_i': (30 + u_control) / 1000,
+            })
+    harm = [{'u_control': i * 0.01, 'p': -20 - 0.01 * i} for i in range(per_src)]
+    result.add_harmonics_measurement(harm, harm)
+    result._process()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            started = time.perf_counter()
+            file_name = result.export_excel(reveal=False)
+            elapsed = time.perf_counter() - started
+            size = os.path.getsize(file_name)
+        finally:
+            os.chdir(cwd)
+
+    print(f'export of {per_src * 3} rows: {elapsed:.3f} s, {per_src * 3 / elapsed:.0f} rows/s, file {size / 1_000_000:.1f} MB')
+    try:
+        import resource
+        print(f'peak rss: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+    except ImportError:
+        pass
+
+    if args.budget and elapsed > args.budget:
+        print(f'FAIL: export {elapsed:.3f} s exceeds budget {args.budget:.3f} s')
+        return False
+    return True
+
+
+def bench_accumulate(args):
+    # накопление точек длинной развёртки перестройки: время на точку в начале и в конце должно совпадать
+    from measureresult import MeasureResult
+
+    result = MeasureResult()
+    result.adjustment = None
+    chunk = max(args.points // 10, 1)
+    per_point = list()
+
+    tracemalloc.start()
+    for start in range(0, args.points, chunk):
+        started = time.perf_counter()
+        for i in range(start, min(start + chunk, args.points)):
+            u_control = i * 0.001
+            result.add_point({
+                'u_src': 5.0,
+                'u_control': u_control,
+                'read_f': (1000 + 50 * u_control) * 1_000_000,
+                'read_p': 10 - 0.01 * u_control,
+                'read_i': (30 + u_control) / 1000,
+            })
+        per_point.append((time.perf_counter() - started) / chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    first, last = per_point[0], per_point[-1]
+    print(f'{args.points} points: first {first * 1_000_000:.2f} us/point, last {last * 1_000_000:.2f} us/point, '
+          f'peak memory {peak / 1_000_000:.1f} MB ({peak / args.points:.0f} B/point)')
+
+    if args.budget and last > args.budget / 1_000_000:
+        print(f'FAIL: {last * 1_000_000:.2f} us/point exceeds budget {args.budget:.2f} us/point')
+        return False
+    return True
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Замеры производительности')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    startup = sub.add_parser('startup', help='время до появления окна и цена импортов')
+    startup.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='допустимое время до окна, с (0 -- не проверять)')
+    startup.add_argument('--top', type=int, default=15, help='сколько самых медленных импортов показать')
+    startup.set_defaults(fn=bench_startup)
+
+    headless = sub.add_parser('headless', help='время импорта консольного запуска')
+    headless.add_argument('--budget', type=float, default=HEADLESS_BUDGET, help='допустимое время импорта, с (0 -- не проверять)')
+    headless.add_argument('--top', type=int, default=15, help='сколько самых медленных импортов показать')
+    headless.set_defaults(fn=bench_headless)
+
+    cancel = sub.add_parser('cancel', help='задержка от отмены до снятия ВЧ')
+    cancel.add_argument('--runs', type=int, default=20, help='число отмен')
+    cancel.add_argument('--after', type=float, default=0.3, help='время от старта до отмены, с')
+    cancel.add_argument('--fetch', type=float, default=0.5, help='время ответа FETCH? имитатора, с')
+    cancel.add_argument('--seed', type=int, default=0, help='зерно случайной добавки к моменту отмены')
+    cancel.add_argument('--budget', type=float, default=0.05, help='допустимая задержка, с (0 -- не проверять)')
+    cancel.set_defaults(fn=bench_cancel)
+
+    export = sub.add_parser('export', help='время выгрузки результатов в Excel')
+    export.add_argument('--rows', type=int, default=120_000, help='число строк')
+    export.add_argument('--budget', type=float, default=0.0, help='допустимое время выгрузки, с (0 -- не проверять)')
+    export.set_defaults(fn=bench_export)
+
+    accumulate = sub.add_parser('accumulate', help='цена точки при накоплении результата перестройки')
+    accumulate.add_argument('--points', type=int, default=1_000_000, help='число точек')
+    accumulate.add_argument('--budget', type=float, default=0.0, help='допустимое время на точку, мкс (0 -- не проверять)')
+    accumulate.set_defaults(fn=bench_accumulate)
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    sys.exit(0 if args.fn(args) else 1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
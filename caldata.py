@@ -0,0 +1,65 @@
+import hashlib
+import json
+
+from collections import defaultdict
+from itertools import cycle
+
+from forgot_again.file import pprint_to_file, load_ast_if_exists
+
+from instr.const import GIGA
+
+# калибровка хранится как {Pвх, дБм: {Fвх, ГГц: (read_pow, delta)}}
+
+
+def add_cal_point(data, point):
+    p = round(point['p'])
+    f = round(point['f'] / GIGA, 3)
+    data[p][f] = (point['read_pow'], point['delta'])
+    return p, f
+
+
+def cal_points(data):
+    out = list()
+    for p in sorted(data.keys()):
+        for f in sorted(data[p].keys()):
+            out.append({
+                'p': p,
+                'f': f * GIGA,
+                'read_pow': data[p][f][0],
+                'delta': data[p][f][1],
+            })
+    return out
+
+
+def load_cal_data(file):
+    res: dict = load_ast_if_exists(file, defaultdict(dict))
+    data = defaultdict(dict)
+    data.update({**res})
+    return data
+
+
+def save_cal_data(file, data):
+    pprint_to_file(file, dict(data.items()))
+
+
+def make_task(cal_in, cal_out):
+    return [
+        {
+            'f': i['f'],
+            'p': i['read_pow'],
+            'p_ref': i['p'],
+            'delta_in': i['delta'],
+            'delta_out': o,
+        }
+        for i, o
+        in zip(
+            cal_in,
+            cycle([v['delta'] for v in cal_out])
+        )
+    ]
+
+
+def cal_id(task):
+    # одинаковые поправки -- одинаковый идентификатор, по нему запуски связываются с калибровкой
+    deltas = [(t['f'], t['p'], t['p_ref'], t['delta_in'], t['delta_out']) for t in task]
+    return hashlib.sha1(json.dumps(deltas).encode()).hexdigest()[:12]
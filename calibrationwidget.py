@@ -1,20 +1,21 @@
-from itertools import cycle
+import inspect
 
-from PyQt5 import uic
 from PyQt5.QtWidgets import QWidget, QMessageBox, QHeaderView, QFileDialog
 from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal
 
+from caldata import make_task
 from calmodel import CaliModel
-from mytools.backgroundworker import BackgroundWorker, CancelToken, TaskResult
+from pointbatcher import PointBatcher
+from cancellation import CancelEvent
+from mytools.backgroundworker import BackgroundWorker, TaskResult
 from instrumentcontroller import InstrumentController
+from uicache import load_ui
 
 
 class CalibrationWidget(QWidget):
 
     _calibrateInFinished = pyqtSignal(TaskResult)
     _calibrateOutFinished = pyqtSignal(TaskResult)
-    _calibrateInReport = pyqtSignal(dict)
-    _calibrateOutReport = pyqtSignal(dict)
     measureTaskReady = pyqtSignal(list)
 
     def __init__(self, parent=None, controller: InstrumentController=None):
@@ -24,11 +25,13 @@ class CalibrationWidget(QWidget):
         self.setAttribute(Qt.WA_DeleteOnClose)
 
         # create instance variables
-        self._ui = uic.loadUi('calibrationwidget.ui', self)
+        self._ui = load_ui('calibrationwidget.ui', self)
 
         self._worker = BackgroundWorker(self)
-        self._tokenIn = CancelToken()
-        self._tokenOut = CancelToken()
+        self._tokenIn = CancelEvent()
+        self._tokenOut = CancelEvent()
+        self._batcherIn = PointBatcher(parent=self)
+        self._batcherOut = PointBatcher(parent=self)
 
         self._controller = controller
 
@@ -41,8 +44,8 @@ class CalibrationWidget(QWidget):
     def _connectSignals(self):
         self._calibrateInFinished.connect(self.on_calibrateIn_finished, type=Qt.QueuedConnection)
         self._calibrateOutFinished.connect(self.on_calibrateOut_finished, type=Qt.QueuedConnection)
-        self._calibrateInReport.connect(self.on_calibrateInReport, type=Qt.QueuedConnection)
-        self._calibrateOutReport.connect(self.on_calibrateOutReport, type=Qt.QueuedConnection)
+        self._batcherIn.batchReady.connect(self.on_calibrateInBatch)
+        self._batcherOut.batchReady.connect(self.on_calibrateOutBatch)
 
     def _initUi(self):
         self._ui.tableCalibrateIn.setModel(self._cal_in_model)
@@ -52,11 +55,16 @@ class CalibrationWidget(QWidget):
 
     # worker dispatch
     def _startWorker(self, fn, cb, **kwargs):
+        if inspect.iscoroutinefunction(fn):
+            from asyncinstrument import runner
+            runner().runTask(fn=fn, fn_finished=cb, **kwargs)
+            return
         self._worker.runTask(fn=fn, fn_finished=cb, **kwargs)
 
     def _calibrateIn(self):
         self._cal_in_model.clear()
-        self._tokenIn = CancelToken()
+        self._tokenIn = CancelEvent()
+        self._batcherIn.start()
         self._startWorker(
             fn=self._controller.calibrateIn,
             cb=self._calibrateInFinishedCallback,
@@ -71,7 +79,8 @@ class CalibrationWidget(QWidget):
             return
 
         self._cal_out_model.clear()
-        self._tokenOut = CancelToken()
+        self._tokenOut = CancelEvent()
+        self._batcherOut.start()
         self._startWorker(
             fn=self._controller.calibrateOut,
             cb=self._calibrateOutFinishedCallback,
@@ -89,13 +98,14 @@ class CalibrationWidget(QWidget):
         self._calibrateOutFinished.emit(TaskResult(*result))
 
     def _calibrateInProgress(self, data):
-        self._calibrateInReport.emit(data)
+        self._batcherIn.push(data)
 
     def _calibrateOutProgress(self, data):
-        self._calibrateOutReport.emit(data)
+        self._batcherOut.push(data)
 
     @pyqtSlot(TaskResult)
     def on_calibrateIn_finished(self, result: TaskResult):
+        self._batcherIn.stop()
         ok, msg = result.values
         if not ok:
             print(f'error during calibrate in: {msg}')
@@ -105,6 +115,7 @@ class CalibrationWidget(QWidget):
 
     @pyqtSlot(TaskResult)
     def on_calibrateOut_finished(self, result):
+        self._batcherOut.stop()
         ok, msg = result.values
         if not ok:
             print(f'error during calibrate out: {msg}')
@@ -113,15 +124,13 @@ class CalibrationWidget(QWidget):
         print('cal out result', ok, msg)
         self.measureTaskReady.emit(self.task())
 
-    @pyqtSlot(dict)
-    def on_calibrateInReport(self, data):
-        print('calibrate in point:', data)
-        self._cal_in_model.update(data)
+    @pyqtSlot(list)
+    def on_calibrateInBatch(self, points):
+        self._cal_in_model.updateBatch(points)
 
-    @pyqtSlot(dict)
-    def on_calibrateOutReport(self, data):
-        print('calibrate out point:', data)
-        self._cal_out_model.update(data)
+    @pyqtSlot(list)
+    def on_calibrateOutBatch(self, points):
+        self._cal_out_model.updateBatch(points)
 
     @pyqtSlot()
     def on_btnCalibrateIn_clicked(self):
@@ -168,20 +177,7 @@ class CalibrationWidget(QWidget):
         self._cal_out_model.saveCalData(file)
 
     def task(self):
-        return [
-            {
-                'f': i['f'],
-                'p': i['read_pow'],
-                'p_ref': i['p'],
-                'delta_in': i['delta'],
-                'delta_out': o,
-            }
-            for i, o
-            in zip(
-                self._cal_in_model.calData(),
-                cycle([v['delta'] for v in self._cal_out_model.calData()])
-            )
-        ]
+        return make_task(self._cal_in_model.calData(), self._cal_out_model.calData())
 
     def is_ready(self):
         return self._cal_in_model.is_ready() and self._cal_out_model.is_ready()
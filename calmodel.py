@@ -1,9 +1,9 @@
 from collections import defaultdict
 
 from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant
-from forgot_again.file import pprint_to_file, load_ast_if_exists
 
-from instr.const import GIGA
+from caldata import add_cal_point, cal_points, load_cal_data, save_cal_data
+from tracing import traced
 
 
 class CaliModel(QAbstractTableModel):
@@ -27,13 +27,20 @@ class CaliModel(QAbstractTableModel):
         self.endResetModel()
 
     def update(self, point: dict):
+        self.updateBatch([point])
+
+    @traced('model update', 'gui', args=lambda self, points: {'model': self.__class__.__name__, 'points': len(points)})
+    def updateBatch(self, points: list):
         self.beginResetModel()
 
-        p = round(point['p'])
-        f = round(point['f'] / GIGA, 3)
-        self._pows = sorted(set(self._pows + [p]))
-        self._freqs = sorted(set(self._freqs + [f]))
-        self._data[p][f] = (point['read_pow'], point['delta'])
+        pows = set(self._pows)
+        freqs = set(self._freqs)
+        for point in points:
+            p, f = add_cal_point(self._data, point)
+            pows.add(p)
+            freqs.add(f)
+        self._pows = sorted(pows)
+        self._freqs = sorted(freqs)
 
         self._header = ['Pвх, дБм'] + [f'Fвх={v}, ГГц' for v in self._freqs]
 
@@ -67,30 +74,19 @@ class CaliModel(QAbstractTableModel):
         return QVariant()
 
     def calData(self):
-        out = list()
-        for p in self._pows:
-            for f in self._freqs:
-                out.append({
-                    'p': p,
-                    'f': f * GIGA,
-                    'read_pow': self._data[p][f][0],
-                    'delta': self._data[p][f][1],
-                })
-        return out
+        return cal_points(self._data)
 
     def is_ready(self):
         return bool(self._data)
 
     def saveCalData(self, file):
-        pprint_to_file(file, dict(self._data.items()))
+        save_cal_data(file, self._data)
 
     def loadCalData(self, file):
         try:
-            res: dict = load_ast_if_exists(file, defaultdict(dict))
-            tmp = defaultdict(dict)
-            tmp.update({**res})
-            self._pows = sorted(res.keys())
-            self._freqs = sorted(list(res.values())[0].keys())
+            tmp = load_cal_data(file)
+            self._pows = sorted(tmp.keys())
+            self._freqs = sorted(list(tmp.values())[0].keys())
         except Exception as ex:
             print(f'Error load calibration file {file}: {ex}, skip load')
             return
@@ -0,0 +1,120 @@
+import threading
+import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from tracing import span
+
+QUERY_TIMEOUT = 10
+POLL_INTERVAL = 0.01
+
+# по объекту сессии, а не по id(): id закрытой сессии может достаться новой
+_executors = weakref.WeakKeyDictionary()
+_executors_lock = threading.Lock()
+# сессии, в которых остался брошенный запрос и которые ещё не очищены
+_stale = weakref.WeakSet()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelEvent:
+    # совместим с CancelToken (флаг cancelled), но ожидание на нём прерывается сразу при отмене
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.cancelledAt = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    @cancelled.setter
+    def cancelled(self, value):
+        if value:
+            self.cancelledAt = time.perf_counter()
+            self._event.set()
+        else:
+            self.cancelledAt = None
+            self._event.clear()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+
+def sleep(token, delay):
+    with span('settle', 'sweep', delay=delay):
+        if hasattr(token, 'wait'):
+            cancelled = token.wait(delay)
+        else:
+            deadline = time.perf_counter() + delay
+            while not token.cancelled and time.perf_counter() < deadline:
+                time.sleep(min(POLL_INTERVAL, max(deadline - time.perf_counter(), 0)))
+            cancelled = token.cancelled
+    if cancelled:
+        raise Cancelled()
+
+
+def query(inst, question, token, timeout=QUERY_TIMEOUT):
+    # запрос VISA прервать нельзя, поэтому он выполняется в потоке прибора,
+    # а здесь ждём либо ответа, либо отмены; брошенный запрос сессию после себя очищает, см. abandon()
+    executor = _executor(inst)
+    future = executor.submit(inst.query, question)
+    deadline = time.perf_counter() + timeout
+    while True:
+        done, _ = wait([future], timeout=POLL_INTERVAL)
+        if done:
+            return future.result()
+        if token.cancelled:
+            abandon(inst, executor)
+            raise Cancelled()
+        if time.perf_counter() > deadline:
+            abandon(inst, executor)
+            raise TimeoutError(f'{question} timed out after {timeout} s')
+
+
+def abandon(inst, executor=None):
+    # брошенный запрос ещё читает из сессии, и его поздний ответ достался бы следующему запросу:
+    # в очередь потока прибора за ним ставится очистка сессии (clear() -- device clear VISA);
+    # пока она не прошла или если прибор её не умеет, сессия считается испорченной и SessionPool её переоткроет
+    _stale.add(inst)
+    try:
+        (executor or _executor(inst)).submit(_clear, inst)
+    except RuntimeError:
+        # поток уже остановлен forget(), сессию закрывают
+        pass
+
+
+def stale(inst):
+    return inst in _stale
+
+
+def _clear(inst):
+    clear = getattr(inst, 'clear', None)
+    if clear is None:
+        return
+    try:
+        clear()
+    except Exception as ex:
+        print(f'session clear error: {ex!r}')
+        return
+    _stale.discard(inst)
+
+
+def _executor(inst):
+    with _executors_lock:
+        executor = _executors.get(inst)
+        if executor is None:
+            executor = _executors[inst] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query')
+        return executor
+
+
+def forget(inst):
+    # закрытой сессии поток больше не нужен; зависший в нём запрос завершится по таймауту VISA
+    with _executors_lock:
+        executor = _executors.pop(inst, None)
+    _stale.discard(inst)
+    if executor is not None:
+        executor.shutdown(wait=False)
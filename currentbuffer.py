@@ -0,0 +1,71 @@
+BUS = 'BUS'
+EXT = 'EXT'
+
+# при буфере тока точка доставляется в report_fn дважды: в развёртке с read_curr = nan и после развёртки с током;
+# точку определяет point_key, вторая доставка заменяет первую. Таблицы, хранилище точек, статистика повторов
+# и сравнение с эталоном хранят точки по ключу и замену получают сами; тем, кто дописывает поток
+# (файл JSONL, поток сервера измерений), точки отдаёт FinalPoints -- каждую один раз, уже с током
+
+# один взвод -- одно показание в буфере источника, индекс показания совпадает с индексом точки
+ARM_COMMANDS = [
+    'TRAC:CLE',
+    'TRAC:POIN {points}',
+    'TRIG:SOUR {source}',
+    'TRIG:COUN 1',
+]
+
+
+class CurrentBuffer:
+    def __init__(self, src, source=BUS):
+        self._src = src
+        self._source = source
+        self._count = 0
+
+    def arm(self, points):
+        for cmd in ARM_COMMANDS:
+            self._src.send(cmd.format(points=points, source=self._source))
+        self._count = 0
+
+    def trigger(self):
+        self._src.send('INIT')
+        if self._source == BUS:
+            self._src.send('*TRG')
+        self._count += 1
+        return self._count - 1
+
+    def fetch(self):
+        raw = self._src.query('TRAC:DATA?').strip()
+        readings = [float(v) for v in raw.split(',') if v.strip()]
+        if len(readings) != self._count:
+            print(f'current buffer: expected {self._count} readings, got {len(readings)}')
+        readings = readings[:self._count]
+        return readings + [float('nan')] * (self._count - len(readings))
+
+
+def point_key(point):
+    return point.get('f'), point.get('p_ref', point.get('p')), point.get('repeat', 0)
+
+
+class FinalPoints:
+    # buffered=False -- буфер тока выключен, точки проходят сразу;
+    # точки калибровки тока не несут и тоже не задерживаются
+
+    def __init__(self, emit_fn, buffered=True):
+        self._emit = emit_fn
+        self._buffered = buffered
+        self._held = dict()
+
+    def __call__(self, point):
+        key = point_key(point)
+        if key in self._held:
+            del self._held[key]
+        elif self._buffered and 'read_curr' in point:
+            self._held[key] = point
+            return
+        self._emit(point)
+
+    def flush(self):
+        # ток так и не пришёл (отмена, прерывание по допускам): точки отдаются как есть
+        held, self._held = self._held, dict()
+        for point in held.values():
+            self._emit(point)
@@ -0,0 +1,187 @@
+import datetime
+import functools
+import json
+import math
+import operator
+import os
+import re
+import socket
+import uuid
+
+from forgot_again.file import load_ast_if_exists
+
+from tracing import traced
+
+# все запуски в одном наборе Parquet, разбитом по дате, стенду и прибору (hive: date=.../station=.../dut=...)
+#   один запуск -- один файл, дописывание не трогает старые файлы
+#   фильтры по разбиению отбрасывают каталоги целиком, фильтры по столбцам уходят в статистику групп строк
+#
+#   ds = ResultDataset('dataset')
+#   df = ds.query(dut=['SN1', 'SN2'], date_from='2026-10-01', f_min=1 * GIGA, f_max=2 * GIGA)
+#   cols = ds.arrays(mode='pulse', columns=['f', 'adjusted_pow'])
+#
+# status -- complete или aborted (прерван по допускам), source -- live, replay или mock;
+# у запусков, записанных до появления этих столбцов, там null
+
+POINT_COLUMNS = ('f', 'p', 'p_ref', 'read_pow', 'adjusted_pow', 'read_curr')
+RUN_COLUMNS = ('run_id', 'started', 'mode', 'cal_id', 'params', 'status', 'source')
+PARTITIONS = ('date', 'station', 'dut')
+
+
+class ResultDataset:
+
+    def __init__(self, root='dataset', station=''):
+        self.root = root
+        self.station = station or socket.gethostname()
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.root}, station={self.station})'
+
+    @classmethod
+    def from_config(cls, file_name='dataset.ini'):
+        # {'enabled': True, 'root': 'dataset', 'station': 'bench-1'}
+        conf = load_ast_if_exists(file_name, default={})
+        if not conf.get('enabled', True):
+            return None
+        return cls(conf.get('root', 'dataset'), conf.get('station', ''))
+
+    @traced('dataset append', 'io', args=lambda self, points, mode, params, **kw: {'points': len(points), 'mode': mode})
+    def append(self, points, mode, params, cal_id='', dut='', started=None, status='complete', source='live'):
+        # возвращает имя записанного файла
+        if not points:
+            return ''
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        started = started or datetime.datetime.now()
+        run_id = f'{started:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        count = len(points)
+
+        table = pa.table({
+            **{name: pa.array([_float(point.get(name)) for point in points], pa.float64()) for name in POINT_COLUMNS},
+            'limit_ok': pa.array([bool(point.get('limit_ok', True)) for point in points], pa.bool_()),
+            'repeat': pa.array([int(point.get('repeat', 0)) for point in points], pa.int32()),
+            'run_id': pa.array([run_id] * count, pa.string()),
+            'started': pa.array([started] * count, pa.timestamp('ms')),
+            'mode': pa.array([mode] * count, pa.string()),
+            'cal_id': pa.array([cal_id] * count, pa.string()),
+            'params': pa.array([json.dumps(params, ensure_ascii=False, sort_keys=True)] * count, pa.string()),
+            'status': pa.array([status] * count, pa.string()),
+            'source': pa.array([source] * count, pa.string()),
+        })
+
+        path = os.path.join(
+            self.root,
+            f'date={started:%Y-%m-%d}',
+            f'station={_segment(self.station)}',
+            f'dut={_segment(dut)}',
+        )
+        os.makedirs(path, exist_ok=True)
+        file_name = os.path.join(path, f'{run_id}.parquet')
+        pq.write_table(table, file_name)
+        return file_name
+
+    def query(self, columns=None, **filters):
+        # pandas.DataFrame; фильтры -- как у table()
+        table = self.table(columns, **filters)
+        if table is None:
+            from pandas import DataFrame
+            return DataFrame(columns=columns)
+        return table.to_pandas()
+
+    def arrays(self, columns=None, **filters):
+        # {столбец: numpy.ndarray}
+        table = self.table(columns, **filters)
+        if table is None:
+            return dict()
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    def runs(self, **filters):
+        # по строке на запуск: когда, где, какой прибор, режим, калибровка и чем закончился
+        df = self.query(columns=list(PARTITIONS) + ['run_id', 'started', 'mode', 'cal_id', 'status', 'source'], **filters)
+        return df.drop_duplicates('run_id').sort_values('started').reset_index(drop=True)
+
+    @traced('dataset query', 'io')
+    def table(self, columns=None, dut=None, station=None, date_from=None, date_to=None, mode=None, cal_id=None,
+              run_id=None, status=None, source=None, f_min=None, f_max=None, p_min=None, p_max=None):
+        # даты включительно, 'YYYY-MM-DD' или date; dut, station, mode, cal_id, run_id, status, source -- значение или список;
+        # f_* в Гц и p_* в дБм задают диапазон по столбцам f и p_ref
+        if not os.path.isdir(self.root):
+            return None
+
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor='hive')
+        # схема задана явно: в старых файлах недостающие столбцы читаются как null
+        dataset = ds.dataset(self.root, schema=_schema(), format='parquet', partitioning=partitioning)
+
+        conditions = [
+            _match('dut', dut, _segment),
+            _match('station', station, _segment),
+            _match('mode', mode),
+            _match('cal_id', cal_id),
+            _match('run_id', run_id),
+            _match('status', status),
+            _match('source', source),
+            _bound('date', operator.ge, date_from, _date),
+            _bound('date', operator.le, date_to, _date),
+            _bound('f', operator.ge, f_min, float),
+            _bound('f', operator.le, f_max, float),
+            _bound('p_ref', operator.ge, p_min, float),
+            _bound('p_ref', operator.le, p_max, float),
+        ]
+        conditions = [c for c in conditions if c is not None]
+        expression = functools.reduce(operator.and_, conditions) if conditions else None
+
+        return dataset.to_table(columns=columns, filter=expression)
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        *[(name, pa.float64()) for name in POINT_COLUMNS],
+        ('limit_ok', pa.bool_()),
+        ('repeat', pa.int32()),
+        ('run_id', pa.string()),
+        ('started', pa.timestamp('ms')),
+        *[(name, pa.string()) for name in RUN_COLUMNS[2:]],
+        *[(name, pa.string()) for name in PARTITIONS],
+    ])
+
+
+def _match(name, value, convert=str):
+    if value is None:
+        return None
+    import pyarrow.dataset as ds
+
+    if isinstance(value, (list, tuple, set)):
+        return ds.field(name).isin([convert(v) for v in value])
+    return ds.field(name) == convert(value)
+
+
+def _bound(name, op, value, convert):
+    if value is None:
+        return None
+    import pyarrow.dataset as ds
+
+    return op(ds.field(name), convert(value))
+
+
+def _date(value):
+    if isinstance(value, str):
+        return value
+    return value.strftime('%Y-%m-%d')
+
+
+def _segment(value):
+    # значение разбиения становится именем каталога
+    return re.sub(r'[^\w.-]', '_', f'{value}') or '_'
+
+
+def _float(value):
+    if value is None:
+        return math.nan
+    return float(value)
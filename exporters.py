@@ -0,0 +1,152 @@
+import csv
+import os
+import subprocess
+import sys
+
+from array import array
+
+from cancellation import Cancelled
+
+# выгрузка всех точек из PointStore; Excel -- только сводные таблицы моделей, через export_excel
+#   csv -- без зависимостей, parquet и feather -- pyarrow, hdf5 -- h5py, xlsx -- pandas
+# progress_fn(done, total) вызывается между кусками и может прервать выгрузку исключением
+
+FILE_FILTER = 'CSV (*.csv);;Parquet (*.parquet);;Feather (*.feather);;HDF5 (*.h5 *.hdf5);;Excel (*.xlsx)'
+
+CHUNK = 10_000
+# openpyxl пишет строки медленно, куски меньше -- чтобы прогресс и отмена срабатывали чаще
+EXCEL_CHUNK = 1_000
+
+
+def export_points(store, file_name, progress_fn=None):
+    ext = os.path.splitext(file_name)[1].lower()
+    writer = _WRITERS.get(ext)
+    if writer is None:
+        return False, f'unknown export format {ext}'
+
+    dir_name = os.path.dirname(file_name)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+
+    progress_fn = progress_fn or (lambda done, total: None)
+    try:
+        writer(store, file_name, progress_fn)
+    except ImportError as ex:
+        return False, f'{ext[1:]} export unavailable: {ex.name} is not installed'
+    except BaseException:
+        # недописанный файл не оставляем
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        raise
+    return True, f'{len(store)} points exported to {file_name}'
+
+
+def export_excel(file_name, sheets, progress_fn=None, token=None):
+    # sheets -- {имя листа: DataFrame}; каждый лист пишется кусками, между ними -- прогресс и проверка отмены
+    from pandas import ExcelWriter
+
+    dir_name = os.path.dirname(file_name)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+
+    progress_fn = progress_fn or (lambda done, total: None)
+    total = sum(len(frame) for frame in sheets.values())
+    done = 0
+    try:
+        with ExcelWriter(file_name) as writer:
+            for sheet_name, frame in sheets.items():
+                for start in range(0, max(len(frame), 1), EXCEL_CHUNK):
+                    if token is not None and token.cancelled:
+                        raise Cancelled()
+                    progress_fn(done, total)
+                    chunk = frame.iloc[start:start + EXCEL_CHUNK]
+                    # заголовок -- только у первого куска, остальные дописываются под ним
+                    chunk.to_excel(writer, sheet_name=sheet_name, index=False, header=not start, startrow=start + 1 if start else 0)
+                    done += len(chunk)
+    except BaseException:
+        # ExcelWriter сохраняет файл и при исключении -- недописанный удаляем
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        raise
+    progress_fn(total, total)
+    return True, f'exported to {file_name}'
+
+
+def reveal_file(path):
+    # показать файл в файловом менеджере; где выделить нельзя -- открыть папку
+    path = os.path.abspath(path)
+    try:
+        if sys.platform.startswith('win'):
+            subprocess.Popen(['explorer', f'/select,{path}'])
+        elif sys.platform == 'darwin':
+            subprocess.Popen(['open', '-R', path])
+        else:
+            subprocess.Popen(['xdg-open', os.path.dirname(path)])
+    except OSError as ex:
+        print(f'cannot reveal {path}: {ex}')
+
+
+def _snapshot(store):
+    # копия столбцов: измерение может дописывать точки, пока идёт выгрузка
+    return {name: array('d', column) for name, column in store.columns().items()}
+
+
+def _csv(store, file_name, progress_fn):
+    rows = list(zip(*_snapshot(store).values()))
+    with open(file_name, mode='wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(store.names)
+        for start in range(0, len(rows), CHUNK):
+            progress_fn(start, len(rows))
+            writer.writerows(rows[start:start + CHUNK])
+    progress_fn(len(rows), len(rows))
+
+
+def _arrow_table(store):
+    import pyarrow as pa
+
+    return pa.table({
+        name: pa.Array.from_buffers(pa.float64(), len(column), [None, pa.py_buffer(column)])
+        for name, column in _snapshot(store).items()
+    })
+
+
+def _parquet(store, file_name, progress_fn):
+    import pyarrow.parquet as pq
+
+    table = _arrow_table(store)
+    with pq.ParquetWriter(file_name, table.schema) as writer:
+        for start in range(0, table.num_rows, CHUNK):
+            progress_fn(start, table.num_rows)
+            writer.write_table(table.slice(start, CHUNK))
+    progress_fn(table.num_rows, table.num_rows)
+
+
+def _feather(store, file_name, progress_fn):
+    import pyarrow.feather as feather
+
+    progress_fn(0, 1)
+    feather.write_feather(_arrow_table(store), file_name)
+    progress_fn(1, 1)
+
+
+def _hdf5(store, file_name, progress_fn):
+    import h5py
+    import numpy as np
+
+    columns = _snapshot(store)
+    with h5py.File(file_name, mode='w') as f:
+        for done, (name, column) in enumerate(columns.items()):
+            progress_fn(done, len(columns))
+            f.create_dataset(name, data=np.frombuffer(column, dtype=np.float64))
+        f.attrs['columns'] = list(store.names)
+    progress_fn(len(columns), len(columns))
+
+
+_WRITERS = {
+    '.csv': _csv,
+    '.parquet': _parquet,
+    '.feather': _feather,
+    '.h5': _hdf5,
+    '.hdf5': _hdf5,
+}
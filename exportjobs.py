@@ -0,0 +1,85 @@
+import itertools
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from cancellation import CancelEvent, Cancelled
+from exporters import reveal_file
+
+_queue = None
+
+
+class ExportJob:
+    def __init__(self, job_id, name, fn, reveal):
+        self.id = job_id
+        self.name = name
+        self.fn = fn
+        self.reveal = reveal
+        self.token = CancelEvent()
+        self.percent = 0
+
+
+class ExportQueue(QObject):
+    # выгрузки идут в своих потоках, GUI получает только сигналы;
+    # fn(progress_fn, token) -> (ok, msg), progress_fn(done, total), отмена -- token.cancelled
+    started = pyqtSignal(int, str)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, bool, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = dict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return list(self._jobs.values())
+
+    def submit(self, name, fn, reveal=''):
+        job = ExportJob(next(self._ids), name, fn, reveal)
+        with self._lock:
+            self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job, ), name=f'export-{job.id}', daemon=True).start()
+        return job.id
+
+    def cancel(self, job_id=None):
+        with self._lock:
+            jobs = list(self._jobs.values()) if job_id is None else [self._jobs.get(job_id)]
+        for job in jobs:
+            if job is not None:
+                job.token.cancelled = True
+
+    def _run(self, job):
+        self.started.emit(job.id, job.name)
+
+        def progress_fn(done, total):
+            if job.token.cancelled:
+                raise Cancelled()
+            percent = int(done * 100 / total) if total else 100
+            if percent != job.percent:
+                job.percent = percent
+                self.progress.emit(job.id, percent)
+
+        try:
+            ok, msg = job.fn(progress_fn, job.token)
+        except Cancelled:
+            ok, msg = False, f'{job.name}: export cancelled'
+        except Exception as ex:
+            ok, msg = False, f'{job.name}: export error: {ex!r}'
+
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+        print(msg)
+        if ok and job.reveal:
+            reveal_file(job.reveal)
+        self.finished.emit(job.id, ok, msg)
+
+
+def exports():
+    global _queue
+    if _queue is None:
+        _queue = ExportQueue()
+    return _queue
+
@@ -0,0 +1,209 @@
+import ast
+import json
+import math
+import os
+
+import numpy as np
+
+from forgot_again.file import load_ast_if_exists
+
+from limitmask import LimitMask
+
+# сравнение с эталонным («золотым») прибором по ходу измерения:
+#   эталон -- точки того же плана частот и мощностей (файл результата .txt, выгрузка runner .jsonl
+#   или последний запуск прибора из набора результатов); повторы эталона усредняются по ячейке
+#   допуск на отклонение задаётся полосами, как в limits.ini, но границы -- на разницу с эталоном
+#
+# golden.ini:
+# {
+#     'file': 'golden/SN0-pulse.jsonl',        # или 'dut': 'SN0' -- из набора результатов
+#     'tolerance': {
+#         'adjusted_pow': [(0, 40, -0.5, 0.5)],
+#         'read_curr': [(0, 40, -0.05, 0.05)],
+#     },
+# }
+
+DEFAULT_TOLERANCE = {'adjusted_pow': [(0, math.inf, -0.5, 0.5)]}
+
+
+class GoldenCompare:
+    # ячейки эталона -- плоские массивы, пачка пришедших точек сравнивается за одну векторную операцию
+
+    def __init__(self, golden_points, tolerance=None, name=''):
+        self.name = name
+        self.fields = tuple((tolerance or DEFAULT_TOLERANCE).keys())
+        mask = LimitMask(tolerance or DEFAULT_TOLERANCE)
+
+        sums = dict()
+        for point in golden_points:
+            cell = sums.setdefault(_key(point), {'f': point['f'], 'n': dict(), 's': dict()})
+            for field in self.fields:
+                value = point.get(field)
+                if value is None or math.isnan(value):
+                    continue
+                cell['n'][field] = cell['n'].get(field, 0) + 1
+                cell['s'][field] = cell['s'].get(field, 0.0) + value
+
+        self._index = {key: i for i, key in enumerate(sums.keys())}
+        cells = list(sums.values())
+        self._ref = {
+            field: np.array([c['s'][field] / c['n'][field] if c['n'].get(field) else np.nan for c in cells])
+            for field in self.fields
+        }
+        # границы допуска на ячейку считаются один раз, при загрузке
+        self._lo = dict()
+        self._hi = dict()
+        for field in self.fields:
+            bounds = [mask.bounds(field, c['f']) for c in cells]
+            self._lo[field] = np.array([-np.inf if lo is None else lo for lo, _ in bounds])
+            self._hi[field] = np.array([np.inf if hi is None else hi for _, hi in bounds])
+
+        self.clear()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.name}, {len(self)} cells)'
+
+    @classmethod
+    def from_config(cls, file_name='golden.ini', dataset=None):
+        # None, если эталон не задан или не найден
+        conf = load_ast_if_exists(file_name, default=None)
+        if not conf:
+            return None
+
+        if conf.get('dut'):
+            if dataset is None:
+                print(f'golden unit {conf["dut"]}: no results dataset')
+                return None
+            points = golden_from_dataset(dataset, conf['dut'], mode=conf.get('mode'))
+            name = f'dut {conf["dut"]}'
+        else:
+            points = load_golden(conf.get('file', ''))
+            name = conf.get('file', '')
+
+        if not points:
+            print(f'golden unit {name}: no points')
+            return None
+        golden = cls(points, conf.get('tolerance'), name=name)
+        print(f'golden unit loaded: {golden}')
+        return golden
+
+    def clear(self):
+        self.worst = {field: (0.0, None, None) for field in self.fields}
+        self._checked = set()
+        self._failed = set()
+
+    @property
+    def checked(self):
+        return len(self._checked)
+
+    @property
+    def failed(self):
+        return len(self._failed)
+
+    def update(self, points):
+        # возвращает точки с '<поле>_golden', '<поле>_delta' и 'golden_ok'; точка вне плана эталона -- без них
+        if not points:
+            return points
+
+        idx = np.fromiter((self._index.get(_key(p), -1) for p in points), dtype=np.intp, count=len(points))
+        known = idx >= 0
+        cells = np.where(known, idx, 0)
+
+        ok = known.copy()
+        columns = dict()
+        for field in self.fields:
+            values = np.fromiter((_value(p.get(field)) for p in points), dtype=float, count=len(points))
+            ref = np.where(known, self._ref[field][cells], np.nan)
+            delta = values - ref
+            measured = ~np.isnan(delta)
+            inside = (delta >= self._lo[field][cells]) & (delta <= self._hi[field][cells])
+            ok &= inside | ~measured
+            columns[field] = (ref, delta)
+
+            if measured.any():
+                i = np.nanargmax(np.abs(delta))
+                worst, f, _ = self.worst[field]
+                if f is None or abs(delta[i]) > abs(worst):
+                    self.worst[field] = (float(delta[i]), points[i]['f'], points[i].get('p_ref'))
+
+        out = list()
+        for i, point in enumerate(points):
+            if not known[i]:
+                out.append(point)
+                continue
+            key = _key(point)
+            self._checked.add(key)
+            if ok[i]:
+                self._failed.discard(key)
+            else:
+                self._failed.add(key)
+
+            res = dict(point)
+            for field, (ref, delta) in columns.items():
+                res[f'{field}_golden'] = float(ref[i])
+                res[f'{field}_delta'] = float(delta[i])
+            res['golden_ok'] = bool(ok[i])
+            out.append(res)
+        return out
+
+    def summary(self):
+        worst = ', '.join(
+            f'{field} {delta:+.3f} @ {f / 1_000_000_000:.3f} ГГц, {p} дБм'
+            for field, (delta, f, p) in self.worst.items() if f is not None
+        )
+        verdict = 'PASS' if not self._failed else f'FAIL {self.failed}'
+        return f'golden {self.name}: {verdict} of {self.checked} cells, worst {worst or "-"}'
+
+
+class GoldenRows:
+    # для потока по одной точке (runner): точки копятся строкой одного p_ref и сравниваются с эталоном
+    # одной пачкой, когда развёртка переходит к следующему уровню, как строки RfMetrics.update;
+    # emit_fn получает точки уже с отклонениями, в прежнем порядке
+
+    def __init__(self, golden, emit_fn):
+        self._golden = golden
+        self._emit = emit_fn
+        self._row = list()
+
+    def __call__(self, point):
+        if self._row and _key(self._row[-1])[1] != _key(point)[1]:
+            self.flush()
+        self._row.append(point)
+
+    def flush(self):
+        row, self._row = self._row, list()
+        for point in self._golden.update(row):
+            self._emit(point)
+
+
+def load_golden(file_name):
+    # результат измерения (.txt, pprint) или выгрузка runner (.jsonl)
+    if not file_name or not os.path.isfile(file_name):
+        return list()
+    with open(file_name, mode='rt', encoding='utf-8') as f:
+        if file_name.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return ast.literal_eval(f.read())
+
+
+def golden_from_dataset(dataset, dut, mode=None):
+    # последний полный запуск эталонного прибора на живых приборах
+    df = dataset.query(dut=dut, mode=mode, status='complete', source='live')
+    if df.empty:
+        return list()
+    last = df.sort_values('started')['run_id'].iloc[-1]
+    return df[df['run_id'] == last].to_dict('records')
+
+
+def _key(point):
+    # план тот же, но частоты и мощности приходят float-ами из разных файлов
+    return round(point['f']), round(float(point.get('p_ref', point['p'])), 3)
+
+
+def _value(value):
+    if value is None:
+        return np.nan
+    return float(value)
@@ -1,3 +1,12 @@
+import glob
+import os
 import subprocess
 
-subprocess.run(['pyinstaller', '--onedir', 'main.py', '--clean'])
+from uicache import CACHE_DIR, compile_all
+
+compile_all()
+
+# скомпилированные формы и сами .ui (по ним проверяется актуальность кэша) едут в сборку,
+# иначе собранная программа на первом запуске компилирует формы заново или грузит их через loadUi
+add_data = [f'{CACHE_DIR}{os.pathsep}{CACHE_DIR}', *[f'{ui_file}{os.pathsep}.' for ui_file in sorted(glob.glob('*.ui'))]]
+subprocess.run(['pyinstaller', '--onedir', 'main.py', '--clean', *[arg for spec in add_data for arg in ('--add-data', spec)]])
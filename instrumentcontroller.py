@@ -1,13 +1,25 @@
 import ast
+import functools
+import os
 import time
 
-import numpy as np
+from collections import defaultdict
 
-from PyQt5.QtCore import QObject, pyqtSignal
-from forgot_again.file import load_ast_if_exists, pprint_to_file
+from forgot_again.file import load_ast_if_exists, pprint_to_file, make_dirs
 
+from adaptivesweep import refine, drive, sweep_steps, group_rows
+from caldata import cal_id
+from cancellation import Cancelled, sleep, query
+from currentbuffer import CurrentBuffer, BUS, EXT
+from dataset import ResultDataset
+from instrumentsetup import InstrumentSetup
+from limitmask import LimitMask, LimitChecker
+from repeatstats import RepeatStats
 from instr.instrumentfactory import mock_enabled, SourceFactory, PowerMeterFactory, GeneratorFactory
 from secondaryparams import SecondaryParams
+from sessionpool import SessionPool
+from siminstruments import SimulatedSupply
+from tracing import span, traced
 
 GIGA = 1_000_000_000
 MEGA = 1_000_000
@@ -20,13 +32,42 @@ MICRO = 1 / 1_000_000
 # + TODO change table format according to reqs
 # + TODO show in cal pow + diff
 # + TODO show diff in out cal
-# TODO add limits for measurement task via gui
+# TODO add limits for measurement task via gui (now loaded from limits.ini)
 
-class InstrumentController(QObject):
-    pointReady = pyqtSignal()
+
+def _safe_state(name):
+    # при любом выходе из развёртки -- отмена, таймаут прибора, исключение -- снимаем ВЧ с генератора
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, token, *args, **kwargs):
+            try:
+                return fn(self, token, *args, **kwargs)
+            except Cancelled:
+                return False, f'{name} cancel'
+            except TimeoutError as ex:
+                return False, f'{name} instrument timeout: {ex}'
+            finally:
+                self._safeState(token)
+        return wrapper
+    return decorator
+
+
+def batch_summary(head, verdicts):
+    # итог очереди и вердикт по каждому прибору, по строке на прибор
+    counts = ', '.join(f'{sum(v[2] == verdict for v in verdicts)} {verdict}' for verdict in ('PASS', 'FAIL', 'ERROR'))
+    lines = [f'{serial} {mode}: {verdict}' + (f', {msg}' if msg else '') for serial, mode, verdict, msg in verdicts]
+    return '\n'.join([f'{head}: {counts}', *lines])
+
+
+def _repeats(params):
+    return max(int(params.get('repeat', 1)), 1)
+
+
+class InstrumentController:
+    # без Qt, чтобы контроллер можно было использовать из консольного запуска
 
     def __init__(self, parent=None):
-        super().__init__(parent=parent)
+        self.parent = parent
 
         addrs = load_ast_if_exists('instr.ini', default={
             'Генератор': 'ASRL6::INSTR',
@@ -113,13 +154,58 @@ class InstrumentController(QObject):
                 'Маркер 2=',
                 {'start': 0.0, 'end': 1_000_000.0, 'step': 1.0, 'value': 700.0, 'suffix': ' мкс'}
             ],
+            'sep_3': ['', {'value': None}],
+            'adapt_tol': [
+                'Адапт. допуск=',
+                {'start': 0.0, 'end': 10.0, 'step': 0.1, 'value': 0.0, 'decimals': 2, 'suffix': ' дБ'}
+            ],
+            'adapt_points': [
+                'Адапт. точек=',
+                {'start': 0, 'end': 1000, 'step': 1, 'value': 50, 'suffix': ''}
+            ],
+            'sep_4': ['', {'value': None}],
+            'rcl_reg': [
+                'Регистр *RCL=',
+                {'start': 0, 'end': 9, 'step': 1, 'value': 0, 'suffix': ''}
+            ],
+            'curr_buf': [
+                'Буфер тока=',
+                {'start': 0, 'end': 2, 'step': 1, 'value': 0, 'suffix': ''}
+            ],
+            'fail_after': [
+                'Брак, прерв. после=',
+                {'start': 0, 'end': 1000, 'step': 1, 'value': 0, 'suffix': ''}
+            ],
+            'sep_5': ['', {'value': None}],
+            'repeat': [
+                'Повторов=',
+                {'start': 1, 'end': 1000, 'step': 1, 'value': 1, 'suffix': ''}
+            ],
+            'repeat_point': [
+                'Повт. в точке=',
+                {'start': 0, 'end': 1, 'step': 1, 'value': 0, 'suffix': ''}
+            ],
         }, file_name='params.ini')
 
-        self._instruments = dict()
+        self._pool = SessionPool(self.requiredInstruments)
+        self._setup = InstrumentSetup()
+        self.dataset = ResultDataset.from_config('dataset.ini')
+        self.lastCancelLatency = None
+        # допуски последней доведённой до вердикта развёртки; None -- развёртка оборвалась раньше
+        self.lastLimits = None
 
     def __str__(self):
         return f'{self._instruments}'
 
+    @property
+    def _instruments(self):
+        return self._pool.instruments
+
+    @_instruments.setter
+    def _instruments(self, instruments):
+        self._pool.adopt(instruments)
+        self._setup.invalidate()
+
     # region connections
     def connect(self, **kwargs):
         addrs = kwargs.pop('addrs')
@@ -132,14 +218,30 @@ class InstrumentController(QObject):
         ok = self._find()
         if ok:
             return ok, 'instruments found'
+        elif self._pool.busy:
+            owners = ', '.join(f'{name} (pid {pid})' for name, pid in self._pool.busy.items())
+            return ok, f'instruments owned by another process: {owners}'
         else:
             return ok, 'instrument find error'
 
     def _find(self):
-        self._instruments = {
-            k: v.find() for k, v in self.requiredInstruments.items()
-        }
-        return all(self._instruments.values())
+        # открытые сессии с прежним адресом не переоткрываются, только проверяются
+        for name in self._pool.connect():
+            self._setup.invalidate(name)
+        if self._pool.busy:
+            # без части приборов мерить нельзя, остальные тоже отпускаются
+            self._pool.close()
+            return False
+        ok, _ = self._checkSessions()
+        return ok
+
+    def _checkSessions(self):
+        reconnected, failed = self._pool.check()
+        for name in reconnected:
+            self._setup.invalidate(name)
+        if failed:
+            return False, f'instrument lost: {", ".join(failed)}'
+        return True, 'instruments alive'
     # endregion
 
     # region calibrations
@@ -149,6 +251,16 @@ class InstrumentController(QObject):
         params = kwargs.pop('params')
         print(f'call calibrate in with {report_fn} {token} {params}')
 
+        ok, msg = self._checkSessions()
+        if not ok:
+            return ok, msg
+
+        return self._calibrateIn(token, params, report_fn)
+
+    @_safe_state('calibrate in')
+    def _calibrateIn(self, token, params, report_fn):
+        import numpy as np
+
         gen = self._instruments['Генератор']
         meter = self._instruments['Изм. мощности']
 
@@ -159,30 +271,23 @@ class InstrumentController(QObject):
         p_max = params['p_max']
         p_delta = params['p_delta']
 
-        avg = params['avg']
-
         accuracy = 0.05
 
         pows = [round(x, 1) for x in np.arange(start=p_min, stop=p_max + 0.000001, step=p_delta)]
         freqs = [round(x) for x in np.arange(start=f_min, stop=f_max + 0.000001, step=f_delta)]
 
-        self._init()
-
-        meter.send(f'SENS1:AVER:COUN {avg}')
-        meter.send('FORM ASCII')
-        # meter.send('TRIG:SOUR INT1')
-        # meter.send('INIT:CONT ON')
-
-        # автоматическое измерение ошибается в первой точке, измеряем пустышку
-        # почему - хз
-        gen.send(f'POW {pows[0]}dbm')
-        gen.send(f'FREQ {freqs[0]}')
-        meter.send(f'SENS1:FREQ {freqs[0]}')
-        gen.send('OUTP ON')
-        meter.send('ABORT')
-        meter.send('INIT')
-        time.sleep(0.2)
-        meter.query('FETCH?')
+        if self._init(self._continuousProfile(params)):
+            with span('warm-up', 'sweep'):
+                # автоматическое измерение ошибается в первой точке, измеряем пустышку
+                # почему - хз
+                gen.send(f'POW {pows[0]}dbm')
+                gen.send(f'FREQ {freqs[0]}')
+                meter.send(f'SENS1:FREQ {freqs[0]}')
+                gen.send('OUTP ON')
+                meter.send('ABORT')
+                meter.send('INIT')
+                sleep(token, 0.2)
+                query(meter, 'FETCH?', token)
 
         index = 0
         if mock_enabled:
@@ -190,34 +295,37 @@ class InstrumentController(QObject):
                 mocked_raw_data = ast.literal_eval(''.join(f.readlines()))
 
         result = []
-        for p in pows:
-            for f in freqs:
-                if token.cancelled:
-                    return False, 'calibrate in cancel'
 
-                gen.send(f'POW {p}dbm')
-                gen.send(f'FREQ {f}')
-                meter.send(f'SENS1:FREQ {f}')
-                gen.send('OUTP ON')
+        @traced('point', 'sweep', args=lambda p, f: {'f': f, 'p': p})
+        def measure_point(p, f):
+            nonlocal index
 
-                meter.send('ABORT')
-                meter.send('INIT')
+            if token.cancelled:
+                return None
 
-                if not mock_enabled:
-                    time.sleep(0.5)
+            gen.send(f'POW {p}dbm')
+            gen.send(f'FREQ {f}')
+            meter.send(f'SENS1:FREQ {f}')
+            gen.send('OUTP ON')
+
+            meter.send('ABORT')
+            meter.send('INIT')
 
-                label_pow = p
-                new_pow = p
-                read_pow = float(meter.query('FETCH?').strip())
-                diff = p - read_pow
-                prev = diff
+            if not mock_enabled:
+                sleep(token, 0.5)
 
-                if not mock_enabled:
-                    while abs(diff) > accuracy:
+            label_pow = p
+            new_pow = p
+            read_pow = float(query(meter, 'FETCH?', token).strip())
+            diff = p - read_pow
+            prev = diff
+
+            if not mock_enabled:
+                while abs(diff) > accuracy:
+                    with span('level', 'sweep', diff=diff):
                         prev = diff
                         if token.cancelled:
-                            gen.send('OUTP OFF')
-                            return False, 'measure cancel'
+                            return None
 
                         new_pow = new_pow + diff
                         gen.send(f'POW {new_pow}dbm')
@@ -225,30 +333,47 @@ class InstrumentController(QObject):
                         meter.send('ABORT')
                         meter.send('INIT')
 
-                        time.sleep(0.5)
+                        sleep(token, 0.5)
 
-                        read_pow = float(meter.query('FETCH?').strip())
+                        read_pow = float(query(meter, 'FETCH?', token).strip())
 
                         diff = p - read_pow
 
-                raw_point = {
-                    'f': f,
-                    'p': label_pow,
-                    'read_pow': read_pow,
-                    'delta': prev,
-                }
+            raw_point = {
+                'f': f,
+                'p': label_pow,
+                'read_pow': read_pow,
+                'delta': prev,
+            }
 
-                if mock_enabled:
-                    raw_point = mocked_raw_data[index]
-                    index += 1
+            if mock_enabled:
+                raw_point = mocked_raw_data[index]
+                index += 1
 
-                print(raw_point)
-                report_fn(raw_point)
-                result.append(raw_point)
+            print(raw_point)
+            report_fn(raw_point)
+            result.append(raw_point)
+            return raw_point
+
+        # адаптивная сетка строится по первому уровню мощности,
+        # остальные уровни меряются на ней же, чтобы калибровки по входу и выходу совпадали по частотам
+        adapt_tol = params.get('adapt_tol', 0)
+        if adapt_tol > 0 and not mock_enabled:
+            p = pows[0]
+            points = refine(freqs, lambda f: measure_point(p, f), 'delta', adapt_tol, params.get('adapt_points', len(freqs)))
+            if points is None:
+                return False, 'calibrate in cancel'
+            # точки уточнения пришли в порядке измерения, в файле -- по частоте, как у остальных уровней
+            result.sort(key=lambda point: point['f'])
+            freqs = [point['f'] for point in points]
+            pows = pows[1:]
 
-        gen.send('OUTP OFF')
+        for p in pows:
+            for f in freqs:
+                if measure_point(p, f) is None:
+                    return False, 'calibrate in cancel'
 
-        pprint_to_file('cal_in_res.txt', result)
+        self._writeResult('cal_in_res.txt', result)
         return True, 'calibrate in done'
 
     def calibrateOut(self, **kwargs):
@@ -259,6 +384,14 @@ class InstrumentController(QObject):
 
         print(f'call calibrate out with {report_fn} {token} {params}')
 
+        ok, msg = self._checkSessions()
+        if not ok:
+            return ok, msg
+
+        return self._calibrateOut(token, params, report_fn, cal_data)
+
+    @_safe_state('calibrate out')
+    def _calibrateOut(self, token, params, report_fn, cal_data):
         gen = self._instruments['Генератор']
         meter = self._instruments['Изм. мощности']
 
@@ -276,16 +409,17 @@ class InstrumentController(QObject):
         cal_data = list(filter(lambda el: el['p'] == max_p, cal_data))
         point = cal_data[0]
 
-        # автоматическое измерение ошибается в первой точке, измеряем пустышку
-        # почему - хз
-        gen.send(f'POW {point["p"]}dbm')
-        gen.send(f'FREQ {point["f"]}')
-        meter.send(f'SENS1:FREQ {point["f"]}')
-        gen.send('OUTP ON')
-        meter.send('ABORT')
-        meter.send('INIT')
-        time.sleep(0.2)
-        meter.query('FETCH?')
+        with span('warm-up', 'sweep'):
+            # автоматическое измерение ошибается в первой точке, измеряем пустышку
+            # почему - хз
+            gen.send(f'POW {point["p"]}dbm')
+            gen.send(f'FREQ {point["f"]}')
+            meter.send(f'SENS1:FREQ {point["f"]}')
+            gen.send('OUTP ON')
+            meter.send('ABORT')
+            meter.send('INIT')
+            sleep(token, 0.2)
+            query(meter, 'FETCH?', token)
 
         index = 0
         if mock_enabled:
@@ -294,44 +428,44 @@ class InstrumentController(QObject):
 
         result = []
         for point in cal_data:
-            if token.cancelled:
-                return False, 'calibrate out cancel'
+            with span('point', 'sweep', f=point['f']):
+                if token.cancelled:
+                    return False, 'calibrate out cancel'
 
-            p = point['read_pow']
-            f = point['f']
-            delta_in = point['delta']
+                p = point['read_pow']
+                f = point['f']
+                delta_in = point['delta']
 
-            gen.send(f'POW {p + delta_in}dbm')
-            gen.send(f'FREQ {f}')
-            meter.send(f'SENS1:FREQ {f}')
-            gen.send('OUTP ON')
+                gen.send(f'POW {p + delta_in}dbm')
+                gen.send(f'FREQ {f}')
+                meter.send(f'SENS1:FREQ {f}')
+                gen.send('OUTP ON')
 
-            meter.send('ABORT')
-            meter.send('INIT')
+                meter.send('ABORT')
+                meter.send('INIT')
 
-            if not mock_enabled:
-                time.sleep(0.2)
+                if not mock_enabled:
+                    sleep(token, 0.2)
 
-            read_pow = float(meter.query('FETCH?').strip())
-            delta = p - read_pow
+                read_pow = float(query(meter, 'FETCH?', token).strip())
+                delta = p - read_pow
 
-            raw_point = {
-                'f': f,
-                'p': p,
-                'read_pow': read_pow,
-                'delta': delta,
-            }
+                raw_point = {
+                    'f': f,
+                    'p': p,
+                    'read_pow': read_pow,
+                    'delta': delta,
+                }
 
-            if mock_enabled:
-                raw_point = mocked_raw_data[index]
-                index += 1
+                if mock_enabled:
+                    raw_point = mocked_raw_data[index]
+                    index += 1
 
-            print(raw_point)
-            report_fn(raw_point)
-            result.append(raw_point)
+                print(raw_point)
+                report_fn(raw_point)
+                result.append(raw_point)
 
-        gen.send('OUTP OFF')
-        pprint_to_file('cal_out_res.txt', result)
+        self._writeResult('cal_out_res.txt', result)
         return True, 'calibrate out done'
     # endregion
 
@@ -339,10 +473,48 @@ class InstrumentController(QObject):
     def _clear(self):
         pass
 
-    def _init(self):
-        self._instruments['Генератор'].send('*RST')
-        self._instruments['Изм. мощности'].send('*RST')
+    @traced('setup', 'sweep')
+    def _init(self, meter_profile, register=0):
+        # команды уходят только если настройки приборов отличаются от нужных,
+        # возвращает число отправленных команд -- если 0, прогревочное измерение не нужно
+        sent = self._setup.apply('Генератор', self._instruments['Генератор'], [])
+        sent += self._setup.apply('Изм. мощности', self._instruments['Изм. мощности'], meter_profile, register=register)
         # self._instruments['Источник'].send('*RST')
+        return sent
+
+    def _continuousProfile(self, params):
+        return [
+            ('SENS1:AVER:COUN', params['avg']),
+            ('FORM', 'ASCII'),
+            # ('TRIG:SOUR', 'INT1'),
+            # ('INIT:CONT', 'ON'),
+        ]
+
+    def _pulseProfile(self, params):
+        x_start = params['x_start'] * MICRO
+        x_scale = params['x_scale'] * MICRO
+        mark_1 = params['mark_1'] * MICRO
+        mark_2 = params['mark_2'] * MICRO
+
+        return self._continuousProfile(params) + [
+            ('INIT:CONT', 'ON'),
+            # ('TRAC:STAT', 'ON'),
+            ('TRIG:SOUR', 'INT1'),
+
+            ('DISP:WIND1:TRAC:FEED', '"SENS1"'),
+            ('DISP:WIND1:FORM', 'TRAC'),
+            ('DISP:SCR:FORM', 'FSCR'),
+
+            ('SENS1:TRAC:OFFS:TIME', x_start),
+            ('SENS1:TRAC:X:SCAL:PDIV', x_scale),
+            ('SENS1:TRAC:LIM:UPP', params['y_max']),
+            ('SENS1:TRAC:Y:SCAL:PDIV', params['y_scale']),
+
+            ('TRIG:SEQ:LEV', params['trig_level']),
+
+            ('SENS1:SWE1:OFFS:TIME', mark_1),
+            ('SENS1:SWE1:TIME', mark_2 - mark_1),
+        ]
     # endregion
 
     def measure(self, **kwargs):
@@ -350,53 +522,56 @@ class InstrumentController(QObject):
         token = kwargs.pop('token')
         params = kwargs.pop('params')
         task = kwargs.pop('task')
+        dut = kwargs.pop('dut', '')
         print(f'call measure with {report_fn} {token} {params} {task}')
 
-        ok = self._measure(token, params, report_fn, task)
-        if ok:
-            return ok, 'measure success'
-        else:
-            return ok, 'measure error'
+        ok, msg = self._checkSessions()
+        if not ok:
+            return ok, msg
+
+        res = self._measure(token, params, report_fn, task, dut=dut)
+        if res is True:
+            return True, 'measure success'
+        return res
 
-    def _measure(self, token, params, report_fn, task):
+    @_safe_state('measure continuous')
+    def _measure(self, token, params, report_fn, task, out_file='out_continuous.txt', dut=''):
         self._clear()
-        self._init()
 
         gen = self._instruments['Генератор']
         meter = self._instruments['Изм. мощности']
         src = self._instruments['Источник']
 
-        avg = params['avg']
-
-        gen.send('*RST')
-        meter.send('*RST')
-
-        meter.send(f'SENS1:AVER:COUN {avg}')
-        meter.send('FORMat ASCII')
-        # meter.send('TRIG:SOUR INT1')
-        # meter.send('INIT:CONT ON')
-
-        point = task[0]
-        # автоматическое измерение ошибается в первой точке, измеряем пустышку
-        # почему - хз
-        gen.send(f'POW {point["p"]}dbm')
-        gen.send(f'FREQ {point["f"]}')
-        meter.send(f'SENS1:FREQ {point["f"]}')
-        gen.send('OUTP ON')
-        meter.send('ABORT')
-        meter.send('INIT')
-        time.sleep(0.2)
-        meter.query('FETCH?')
+        if self._init(self._continuousProfile(params)):
+            with span('warm-up', 'sweep'):
+                point = task[0]
+                # автоматическое измерение ошибается в первой точке, измеряем пустышку
+                # почему - хз
+                gen.send(f'POW {point["p"]}dbm')
+                gen.send(f'FREQ {point["f"]}')
+                meter.send(f'SENS1:FREQ {point["f"]}')
+                gen.send('OUTP ON')
+                meter.send('ABORT')
+                meter.send('INIT')
+                sleep(token, 0.2)
+                query(meter, 'FETCH?', token)
 
-        index = 0
+        # мок-точки по порядку внутри каждого повтора
+        index = defaultdict(int)
         if mock_enabled:
             with open('./mock_data/measure_res.txt', mode='rt', encoding='utf-8') as f:
                 mocked_raw_data = ast.literal_eval(''.join(f.readlines()))
 
         result = []
-        for row in task:
+        currents = self._currentBuffer(src, params, task, pulse=False)
+        limits = LimitChecker(LimitMask.from_file('limits.ini'), params.get('fail_after', 0))
+
+        @traced('point', 'sweep', args=lambda row: {'f': row['f'], 'p': row['p']})
+        def measure_point(row):
+            nonlocal index
+
             if token.cancelled:
-                return False, 'measure continuous cancel'
+                return None
 
             p = row['p']
             f = row['f']
@@ -413,10 +588,10 @@ class InstrumentController(QObject):
             meter.send('INIT')
 
             if not mock_enabled:
-                time.sleep(0.1)
+                sleep(token, 0.1)
 
-            read_pow = float(meter.query('FETCH?').strip())
-            read_curr = float(src.query('MEAS:CURR?').strip())
+            read_pow = float(query(meter, 'FETCH?', token).strip())
+            read_curr = self._readCurrent(src, currents, token)
             adjusted_pow = read_pow + delta_out
 
             raw_point = {
@@ -429,14 +604,42 @@ class InstrumentController(QObject):
             }
 
             if mock_enabled:
-                raw_point = mocked_raw_data[index]
-                index += 1
+                k = row.get('repeat', 0)
+                raw_point = dict(mocked_raw_data[index[k] % len(mocked_raw_data)])
+                index[k] += 1
+                # при буфере ток -- только из имитатора источника, записанный в mock-точке не смешивается с ним
+                if currents is not None:
+                    raw_point['read_curr'] = read_curr
+
+            raw_point['repeat'] = row.get('repeat', 0)
+            raw_point['limit_ok'] = limits.check(raw_point)
 
             result.append(raw_point)
             report_fn(raw_point)
-
-        pprint_to_file('out_continuous.txt', result)
-        gen.send('OUTP OFF')
+            if limits.abort:
+                return None
+            return raw_point
+
+        if not self._sweep(task, params, measure_point):
+            if limits.abort:
+                self.lastLimits = limits
+                # прерванный запуск сохраняется с током: буфер уже накопил показания снятых точек
+                if currents is not None:
+                    self._fillCurrents(currents, result, report_fn, limits)
+                self._writeResult(out_file, result)
+                self._storeRun('continuous', params, task, result, dut, out_file, status='aborted')
+                return False, f'measure continuous limit abort: {limits.summary()}'
+            return False, 'measure continuous cancel'
+
+        if currents is not None:
+            self._fillCurrents(currents, result, report_fn, limits)
+
+        self._writeResult(out_file, result)
+        self._storeRun('continuous', params, task, result, dut, out_file)
+        # брак без прерывания -- тоже неуспех: его должны увидеть оператор, код выхода runner и очередь
+        self.lastLimits = limits
+        if not limits.passed:
+            return False, f'measure continuous limits {limits.summary()}'
         return True
 
     def measurePulse(self, **kwargs):
@@ -444,78 +647,58 @@ class InstrumentController(QObject):
         token = kwargs.pop('token')
         params = kwargs.pop('params')
         task = kwargs.pop('task')
+        dut = kwargs.pop('dut', '')
         print(f'call continuous measure with {report_fn} {token} {params} {task}')
 
-        ok = self._measurePulse(token, params, report_fn, task)
-        if ok:
-            return ok, 'measure success'
-        else:
-            return ok, 'measure error'
+        ok, msg = self._checkSessions()
+        if not ok:
+            return ok, msg
 
-    def _measurePulse(self, token, params, report_fn, task):
+        res = self._measurePulse(token, params, report_fn, task, dut=dut)
+        if res is True:
+            return True, 'measure success'
+        return res
+
+    @_safe_state('measure pulse')
+    def _measurePulse(self, token, params, report_fn, task, out_file='out_pulse.txt', dut=''):
         self._clear()
-        self._init()
 
         gen = self._instruments['Генератор']
         meter = self._instruments['Изм. мощности']
         src = self._instruments['Источник']
 
-        avg = params['avg']
-        x_start = params['x_start'] * MICRO
-        x_scale = params['x_scale'] * MICRO
-        y_max = params['y_max']
-        y_scale = params['y_scale']
-        trig_level = params['trig_level']
-        mark_1 = params['mark_1'] * MICRO
-        mark_2 = params['mark_2'] * MICRO
-
-        gen.send('*RST')
-        meter.send('*RST')
-
-        meter.send(f'SENS1:AVER:COUN {avg}')
-        meter.send('FORMat ASCII')
-
-        meter.send('INIT:CONT ON')
-        # meter.send('TRAC:STAT ON')
-        meter.send('TRIG:SOUR INT1')
-
-        meter.send('DISP:WIND1:TRAC:FEED "SENS1"')
-        meter.send('DISP:WIND1:FORM TRAC')
-        meter.send('DISP:SCR:FORM FSCR')
-
-        meter.send(f'SENS1:TRAC:OFFS:TIME {x_start}')
-        meter.send(f'SENS1:TRAC:X:SCAL:PDIV {x_scale}')
-        meter.send(f'SENS1:TRAC:LIM:UPP {y_max}')
-        meter.send(f'SENS1:TRAC:Y:SCAL:PDIV {y_scale}')
-
-        meter.send(f'TRIG:SEQ:LEV {trig_level}')
-
-        meter.send(f'SENS1:SWE1:OFFS:TIME {mark_1}')
-        meter.send(f'SENS1:SWE1:TIME {mark_2 - mark_1}')
-
-        # автоматическое измерение ошибается в первой точке, измеряем пустышку
-        # почему - хз
-        f1 = task[0]['f']
-        p1 = task[0]['p']
-        gen.send(f'POW {p1}dbm')
-        gen.send(f'FREQ {f1}')
-        meter.send(f'SENS1:FREQ {f1}')
-        if not mock_enabled:
-            time.sleep(1)
-        gen.send('OUTP ON')
-        if not mock_enabled:
-            time.sleep(1)
-        meter.query('FETCH?')
+        if self._init(self._pulseProfile(params), register=int(params.get('rcl_reg', 0))):
+            with span('warm-up', 'sweep'):
+                # автоматическое измерение ошибается в первой точке, измеряем пустышку
+                # почему - хз
+                f1 = task[0]['f']
+                p1 = task[0]['p']
+                gen.send(f'POW {p1}dbm')
+                gen.send(f'FREQ {f1}')
+                meter.send(f'SENS1:FREQ {f1}')
+                if not mock_enabled:
+                    sleep(token, 1)
+                gen.send('OUTP ON')
+                if not mock_enabled:
+                    sleep(token, 1)
+                query(meter, 'FETCH?', token)
 
-        index = 0
+        # мок-точки по порядку внутри каждого повтора
+        index = defaultdict(int)
         if mock_enabled:
             with open('./mock_data/pulse1.txt', mode='rt', encoding='utf-8') as f:
                 mocked_raw_data = ast.literal_eval(''.join(f.readlines()))
 
         result = []
-        for t in task:
+        currents = self._currentBuffer(src, params, task, pulse=True)
+        limits = LimitChecker(LimitMask.from_file('limits.ini'), params.get('fail_after', 0))
+
+        @traced('point', 'sweep', args=lambda t: {'f': t['f'], 'p': t['p']})
+        def measure_point(t):
+            nonlocal index
+
             if token.cancelled:
-                return False, 'measure pulse cancel'
+                return None
 
             f = t['f']
             p = t['p']
@@ -529,10 +712,10 @@ class InstrumentController(QObject):
             gen.send('OUTP ON')
 
             if not mock_enabled:
-                time.sleep(0.5)
+                sleep(token, 0.5)
 
-            read_pow = float(meter.query('FETCH?').strip())
-            read_curr = float(src.query('MEAS:CURR?').strip())
+            read_pow = float(query(meter, 'FETCH?', token).strip())
+            read_curr = self._readCurrent(src, currents, token)
             adjusted_pow = read_pow + delta_out
 
             point = {
@@ -545,16 +728,186 @@ class InstrumentController(QObject):
             }
 
             if mock_enabled:
-                point = mocked_raw_data[index]
-                index += 1
+                k = t.get('repeat', 0)
+                point = dict(mocked_raw_data[index[k] % len(mocked_raw_data)])
+                index[k] += 1
+                # при буфере ток -- только из имитатора источника, записанный в mock-точке не смешивается с ним
+                if currents is not None:
+                    point['read_curr'] = read_curr
+
+            point['repeat'] = t.get('repeat', 0)
+            point['limit_ok'] = limits.check(point)
 
             result.append(point)
             report_fn(point)
+            if limits.abort:
+                return None
+            return point
+
+        if not self._sweep(task, params, measure_point):
+            if limits.abort:
+                self.lastLimits = limits
+                # прерванный запуск сохраняется с током: буфер уже накопил показания снятых точек
+                if currents is not None:
+                    self._fillCurrents(currents, result, report_fn, limits)
+                self._writeResult(out_file, result)
+                self._storeRun('pulse', params, task, result, dut, out_file, status='aborted')
+                return False, f'measure pulse limit abort: {limits.summary()}'
+            return False, 'measure pulse cancel'
+
+        if currents is not None:
+            self._fillCurrents(currents, result, report_fn, limits)
+
+        self._writeResult(out_file, result)
+        self._storeRun('pulse', params, task, result, dut, out_file)
+        # брак без прерывания -- тоже неуспех: его должны увидеть оператор, код выхода runner и очередь
+        self.lastLimits = limits
+        if not limits.passed:
+            return False, f'measure pulse limits {limits.summary()}'
+        return True
+
+    def measureBatch(self, **kwargs):
+        report_fn = kwargs.pop('report_fn')
+        token = kwargs.pop('token')
+        params = kwargs.pop('params')
+        task = kwargs.pop('task')
+        queue = kwargs.pop('queue')
+        prompt_fn = kwargs.pop('prompt_fn')
+        print(f'call batch measure with {report_fn} {token} {params} {queue}')
+
+        make_dirs('batch')
+        sweeps = {
+            'continuous': self._measure,
+            'pulse': self._measurePulse,
+        }
 
-        gen.send('OUTP OFF')
+        verdicts = list()
+        for done, (serial, mode) in enumerate(queue):
+            if token.cancelled or not prompt_fn(serial, mode):
+                return False, batch_summary(f'batch cancel after {done} devices', verdicts)
+
+            # между приборами оператор может стоять долго, сессии проверяются заново
+            ok, msg = self._checkSessions()
+            if not ok:
+                return ok, batch_summary(f'{msg}, batch stopped after {done} devices', verdicts)
+
+            self.lastLimits = None
+            res = sweeps[mode](
+                token,
+                params,
+                lambda point: report_fn({**point, 'dut': serial}),
+                task,
+                out_file=f'batch/{serial}-{mode}.txt',
+                dut=serial,
+            )
+            if res is True:
+                verdicts.append((serial, mode, 'PASS', ''))
+                continue
+            if token.cancelled:
+                return False, batch_summary(f'batch cancel after {done} devices', verdicts)
+
+            # забракованный по допускам прибор снимается, очередь идёт дальше;
+            # ошибка или таймаут прибора -- стенд неисправен, следующий прибор не меряем
+            if self.lastLimits is not None and not self.lastLimits.passed:
+                verdicts.append((serial, mode, 'FAIL', res[1]))
+                continue
+            verdicts.append((serial, mode, 'ERROR', res[1]))
+            return False, batch_summary(f'batch stopped after {done} devices on instrument error', verdicts)
+
+        return all(v[2] == 'PASS' for v in verdicts), batch_summary(f'batch done, {len(queue)} devices', verdicts)
+
+    def _sweep(self, task, params, measure_fn):
+        # повторы: вся развёртка N раз подряд -- в статистику попадает и дрейф стенда за время развёртки;
+        # N раз подряд в каждой точке -- быстрее (без перестройки генератора), но только шум измерения;
+        # план общий с асинхронным контроллером, см. adaptivesweep.sweep_steps
+        return drive(sweep_steps(task, params, adaptive=not mock_enabled), measure_fn) is not None
+
+    def _sweepCapacity(self, task, params):
+        adapt_tol = params.get('adapt_tol', 0)
+        if adapt_tol <= 0 or mock_enabled:
+            return len(task) * _repeats(params)
+        return sum(max(int(params.get('adapt_points', 0)), len(row)) for row in group_rows(task)) * _repeats(params)
+
+    def _currentBuffer(self, src, params, task, pulse):
+        # 0 -- MEAS:CURR? в каждой точке, 1 -- буфер, запуск командой, 2 -- буфер, запуск импульсом
+        mode = int(params.get('curr_buf', 0))
+        if not mode:
+            return None
 
-        pprint_to_file('out_pulse.txt', result)
+        if mock_enabled:
+            src = SimulatedSupply()
+
+        currents = CurrentBuffer(src, source=EXT if pulse and mode == 2 else BUS)
+        currents.arm(self._sweepCapacity(task, params))
+        return currents
+
+    def _readCurrent(self, src, currents, token):
+        if currents is None:
+            return float(query(src, 'MEAS:CURR?', token).strip())
+        # значение придёт из буфера после окончания развёртки
+        currents.trigger()
+        return float('nan')
+
+    @traced('current buffer', 'sweep')
+    def _fillCurrents(self, currents, result, report_fn, limits):
+        # повторная доставка тех же точек, см. currentbuffer.point_key
+        for point, read_curr in zip(result, currents.fetch()):
+            point['read_curr'] = read_curr
+            point['limit_ok'] = limits.check(point, keys=('read_curr', )) and point['limit_ok']
+            report_fn(point)
+
+    @traced('write result', 'io', args=lambda self, file_name, result: {'file': file_name, 'points': len(result)})
+    def _writeResult(self, file_name, result):
+        pprint_to_file(file_name, result)
+
+    def _storeRun(self, mode, params, task, result, dut='', out_file='', status='complete'):
+        # статистика повторов -- рядом с файлом сырых точек, запуск -- в общий набор результатов;
+        # ошибка записи не портит измерение
+        if out_file and _repeats(params) > 1:
+            stats = RepeatStats()
+            stats.update(result)
+            self._writeResult(f'{os.path.splitext(out_file)[0]}-stats.txt', stats.rows())
+
+        if self.dataset is None:
+            return
+        # mock и воспроизведение журнала -- не измерение прибора, в набор не пишем
+        source = self.source
+        if source != 'live':
+            print(f'{source} run not stored to results dataset')
+            return
+        try:
+            file_name = self.dataset.append(result, mode, params, cal_id=cal_id(task), dut=dut, status=status, source=source)
+        except ImportError as ex:
+            print(f'results dataset disabled: {ex.name} is not installed')
+            self.dataset = None
+            return
+        except Exception as ex:
+            print(f'results dataset write error: {ex!r}')
+            return
+        if file_name:
+            print(f'run stored to {file_name}')
+
+    def _safeState(self, token):
+        gen = self._instruments.get('Генератор')
+        if gen is None:
+            return
+        try:
+            gen.send('OUTP OFF')
+        except Exception as ex:
+            print(f'safe state error: {ex!r}')
+        if token.cancelled and getattr(token, 'cancelledAt', None) is not None:
+            self.lastCancelLatency = time.perf_counter() - token.cancelledAt
+            print(f'rf off {self.lastCancelLatency * 1000:.1f} ms after cancel')
 
     @property
     def status(self):
         return [i.status for i in self._instruments.values()]
+
+    @property
+    def source(self):
+        # откуда точки: live, replay (журнал SCPI вместо приборов) или mock
+        if mock_enabled:
+            return 'mock'
+        if any(getattr(i, 'status', '') == 'replay' for i in self._instruments.values()):
+            return 'replay'
+        return 'live'
@@ -0,0 +1,75 @@
+import hashlib
+
+from forgot_again.file import load_ast_if_exists, pprint_to_file
+
+
+class InstrumentSetup:
+    # профиль -- список пар (заголовок SCPI, значение) в порядке отправки,
+    # состояние прибора -- то, что ушло в него после последнего *RST
+
+    def __init__(self, registers_file='setup.ini'):
+        self._state = dict()
+        self._registers_file = registers_file
+        self._registers = load_ast_if_exists(registers_file, default=dict())
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._state.clear()
+        else:
+            self._state.pop(name, None)
+
+    def reset(self, name, inst):
+        inst.send('*RST')
+        self._state[name] = dict()
+
+    def apply(self, name, inst, profile, register=0):
+        # неизвестное состояние (первый запуск, переподключение) не опрашивается, а сбрасывается *RST:
+        # опрос видит только заголовки профиля, настройки другого профиля остались бы в приборе
+        profile = list(profile)
+        headers = {header for header, _ in profile}
+
+        known = self._state.get(name)
+        diff = [(header, value) for header, value in profile if known is None or not _same(known.get(header), value)]
+        extra = set(known) - headers if known is not None else set()
+        if known is not None and not diff and not extra:
+            return 0
+
+        key = _profile_key(profile)
+        registers = self._registers.setdefault(name, dict())
+        if register and registers.get(register) == key:
+            inst.send(f'*RCL {register}')
+            self._state[name] = dict(profile)
+            return 1
+
+        sent = 0
+        # настройки от другого профиля проще сбросить, чем перечислять значения по умолчанию
+        if known is None or extra:
+            self.reset(name, inst)
+            diff = profile
+            sent += 1
+
+        for header, value in diff:
+            inst.send(f'{header} {value}')
+            self._state[name][header] = value
+            sent += 1
+
+        if register:
+            inst.send(f'*SAV {register}')
+            registers[register] = key
+            pprint_to_file(self._registers_file, self._registers)
+            sent += 1
+
+        return sent
+
+
+def _same(a, b):
+    if a is None:
+        return False
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a).strip('"').upper() == str(b).strip('"').upper()
+
+
+def _profile_key(profile):
+    return hashlib.md5(repr(profile).encode('utf-8')).hexdigest()[:12]
@@ -0,0 +1,95 @@
+import math
+
+from forgot_again.file import load_ast_if_exists
+
+from instr.const import GIGA
+
+from currentbuffer import point_key
+
+# limits.ini:
+# {
+#     'adjusted_pow': [(f_min, f_max, p_min, p_max), ...],
+#     'read_curr': [(f_min, f_max, i_min, i_max), ...],
+# }
+# частоты в ГГц, None вместо границы -- граница не проверяется
+
+
+class LimitMask:
+    def __init__(self, masks=None):
+        self._masks = {
+            key: sorted(segments, key=lambda seg: seg[0]) for key, segments in (masks or dict()).items()
+        }
+
+    def __bool__(self):
+        return any(self._masks.values())
+
+    @classmethod
+    def from_file(cls, file_name='limits.ini'):
+        return cls(load_ast_if_exists(file_name, default=dict()))
+
+    def bounds(self, key, f):
+        f = f / GIGA
+        for f_min, f_max, lo, hi in self._masks.get(key, []):
+            if f_min <= f <= f_max:
+                return lo, hi
+        return None, None
+
+    def check(self, point, keys=None):
+        fails = list()
+        for key in keys or self._masks.keys():
+            value = point.get(key)
+            if value is None or math.isnan(value):
+                continue
+            lo, hi = self.bounds(key, point['f'])
+            if (lo is not None and value < lo) or (hi is not None and value > hi):
+                fails.append((key, value, lo, hi))
+        return fails
+
+
+class LimitChecker:
+    # fail_after: 0 -- не прерывать, 1 -- на первом браке, N -- после N бракованных точек;
+    # точки считаются по point_key: каждый повтор ячейки -- отдельная точка,
+    # повторная доставка той же точки с током из буфера -- та же самая
+    # failed -- нарушения по ячейкам (f, p_ref), для итога
+
+    def __init__(self, mask, fail_after=0):
+        self._mask = mask
+        self._fail_after = int(fail_after)
+
+        self.checked = 0
+        self.failed = dict()
+        self._failedPoints = set()
+
+    def check(self, point, keys=None):
+        fails = self._mask.check(point, keys)
+        if keys is None:
+            self.checked += 1
+        if fails:
+            self.failed.setdefault((point['f'], point.get('p_ref', point['p'])), []).extend(fails)
+            self._failedPoints.add(point_key(point))
+        return not fails
+
+    @property
+    def failedPoints(self):
+        return len(self._failedPoints)
+
+    @property
+    def abort(self):
+        return 0 < self._fail_after <= len(self._failedPoints)
+
+    @property
+    def passed(self):
+        return not self.failed
+
+    def summary(self):
+        if not self._mask:
+            return 'no limits'
+        if self.passed:
+            return f'PASS, {self.checked} points'
+        # по первому нарушению в первых ячейках, повторы одной ячейки не дублируются
+        first = ', '.join(
+            f'{key}={value:.3f} @ {f / GIGA:.3f} ГГц, {p} дБм'
+            for (f, p), fails in list(self.failed.items())[:3]
+            for key, value, _, _ in fails[:1]
+        )
+        return f'FAIL, {len(self._failedPoints)} of {self.checked} points in {len(self.failed)} cells: {first}'
@@ -1,4 +1,5 @@
 import sys
+import time
 
 from PyQt5.QtWidgets import QApplication
 from mainwindow import MainWindow
@@ -6,8 +7,27 @@ from mainwindow import MainWindow
 
 def main(args):
     app = QApplication(args)
-    window = MainWindow()
+
+    # --trace: таймлайн всего запуска пишется в trace-<время>.json при выходе
+    if '--trace' in args:
+        import tracing
+        tracing.start(f'trace-{time.strftime("%Y%m%d-%H%M%S")}.json')
+
+    use_async = '--async' in args
+    loop = None
+    if use_async:
+        from asyncinstrument import install_qt_loop
+        loop = install_qt_loop(app)
+
+    # --isolated: приборы и развёртка в отдельном процессе, GUI не сбивает тайминги
+    # --server=host:port: приборами владеет сервер измерений, GUI -- его клиент
+    server = next((arg.partition('=')[2] for arg in args if arg.startswith('--server=')), '')
+    window = MainWindow(use_async=use_async, isolated='--isolated' in args, server=server)
     window.show()
+
+    if loop is not None:
+        with loop:
+            sys.exit(loop.run_forever())
     sys.exit(app.exec_())
 
 
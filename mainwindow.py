@@ -1,32 +1,40 @@
 import datetime
 import os
 
-from subprocess import Popen
-
-from PyQt5 import uic
 from PyQt5.QtGui import QGuiApplication
-from PyQt5.QtWidgets import QMainWindow
+from PyQt5.QtWidgets import QMainWindow, QProgressBar, QPushButton
 from PyQt5.QtCore import Qt, pyqtSlot
 
+from batchwidget import BatchWidget
 from calibrationwidget import CalibrationWidget
 from pulsewidget import PulseWidget
-from formlayout.formlayout import fedit
 from instrumentcontroller import InstrumentController
 from mytools.connectionwidgetwithworker import ConnectionWidgetWithWorker
 from mytools.paraminputwidget import ParamInputWidget
-from primaryplotwidget import PrimaryPlotWidget
 from continuouswidget import ContinuousWidget
+from exporters import reveal_file
+from exportjobs import exports
+from uicache import load_ui
 
 
 class MainWindow(QMainWindow):
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, use_async=False, isolated=False, server=''):
         super().__init__(parent)
 
         self.setAttribute(Qt.WA_QuitOnClose)
         self.setAttribute(Qt.WA_DeleteOnClose)
 
         self._instrumentController = InstrumentController(parent=self)
+        if server:
+            from measureserver import MeasureClient, RemoteInstrumentController
+            self._instrumentController = RemoteInstrumentController(self._instrumentController, MeasureClient.from_address(server))
+        elif isolated:
+            from processengine import ProcessInstrumentController
+            self._instrumentController = ProcessInstrumentController(self._instrumentController)
+        elif use_async:
+            from asynccontroller import AsyncInstrumentController
+            self._instrumentController = AsyncInstrumentController(self._instrumentController)
         self._connectionWidget = ConnectionWidgetWithWorker(parent=self, controller=self._instrumentController)
         self._paramInputWidget = ParamInputWidget(
             parent=self,
@@ -37,9 +45,10 @@ class MainWindow(QMainWindow):
         self._calibWidget = CalibrationWidget(parent=self, controller=self._instrumentController)
         self._continuousWidget = ContinuousWidget(parent=self, controller=self._instrumentController)
         self._pulseWidget = PulseWidget(parent=self, controller=self._instrumentController)
+        self._batchWidget = BatchWidget(parent=self, controller=self._instrumentController)
 
         # init UI
-        self._ui = uic.loadUi('mainwindow.ui', self)
+        self._ui = load_ui('mainwindow.ui', self)
         self.setWindowTitle('Измерение выходной мощности')
 
         self._ui.layInstrs.insertWidget(0, self._connectionWidget)
@@ -48,6 +57,16 @@ class MainWindow(QMainWindow):
         self._ui.tabWidget.addTab(self._calibWidget, 'Калибровка')
         self._ui.tabWidget.addTab(self._continuousWidget, 'Непрерывный режим')
         self._ui.tabWidget.addTab(self._pulseWidget, 'Импульсный режим')
+        self._ui.tabWidget.addTab(self._batchWidget, 'Пакетный режим')
+
+        # фоновые выгрузки: общий прогресс и отмена в строке состояния
+        self._exportProgress = QProgressBar(self)
+        self._exportProgress.setMaximumWidth(200)
+        self._btnExportCancel = QPushButton('Отменить выгрузку', self)
+        self._ui.statusbar.addPermanentWidget(self._exportProgress)
+        self._ui.statusbar.addPermanentWidget(self._btnExportCancel)
+        self._exportProgress.hide()
+        self._btnExportCancel.hide()
 
         self._connectSignals()
         self._init()
@@ -58,9 +77,13 @@ class MainWindow(QMainWindow):
 
     def _connectSignals(self):
         self._connectionWidget.connected.connect(self.on_instrumens_connected)
-        self._instrumentController.pointReady.connect(self.on_point_ready)
+        exports().started.connect(self.on_export_started)
+        exports().progress.connect(self.on_export_progress)
+        exports().finished.connect(self.on_export_finished)
+        self._btnExportCancel.clicked.connect(lambda: exports().cancel())
         self._calibWidget.measureTaskReady.connect(self._continuousWidget.on_calTask_ready)
         self._calibWidget.measureTaskReady.connect(self._pulseWidget.on_calTask_ready)
+        self._calibWidget.measureTaskReady.connect(self._batchWidget.on_calTask_ready)
 
         # TODO fkn hack
         if self._calibWidget._cal_in_model.is_ready() and self._calibWidget._cal_out_model.is_ready():
@@ -81,8 +104,7 @@ class MainWindow(QMainWindow):
         file_name = f'./{path}/{device}-{datetime.datetime.now().isoformat().replace(":", ".")}.png'
         pixmap.save(file_name)
 
-        full_path = os.path.abspath(file_name)
-        Popen(f'explorer /select,"{full_path}"')
+        reveal_file(file_name)
 
     @pyqtSlot()
     def on_instrumens_connected(self):
@@ -103,6 +125,8 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def on_actParams_triggered(self):
+        from formlayout.formlayout import fedit
+
         data = [
             ('Набор для коррекции', [1, '+25', '+85', '-60']),
         ]
@@ -125,9 +149,28 @@ class MainWindow(QMainWindow):
         # while self._paramInputWidget._threads.activeThreadCount() > 0:
         #     time.sleep(0.1)
 
+    @pyqtSlot(int, str)
+    def on_export_started(self, job_id, name):
+        self._ui.statusbar.showMessage(f'Выгрузка: {name}')
+        self._exportProgress.setValue(0)
+        self._exportProgress.show()
+        self._btnExportCancel.show()
+
+    @pyqtSlot(int, int)
+    def on_export_progress(self, job_id, percent):
+        self._exportProgress.setValue(percent)
+
+    @pyqtSlot(int, bool, str)
+    def on_export_finished(self, job_id, ok, msg):
+        self._ui.statusbar.showMessage(msg, 10_000)
+        if not exports().active:
+            self._exportProgress.hide()
+            self._btnExportCancel.hide()
+
     @pyqtSlot()
     def on_btnExcel_clicked(self):
-        self._instrumentController.result.export_excel()
+        result = self._instrumentController.result
+        exports().submit('excel', lambda progress_fn, token: (True, result.export_excel(reveal=False)))
 
     @pyqtSlot()
     def on_btnScreenShot_clicked(self):
@@ -1,16 +1,15 @@
 import os
-import openpyxl
-import pandas as pd
 
-from collections import defaultdict
-from openpyxl.chart import LineChart, Series, Reference
-from openpyxl.chart.axis import ChartLines
-from openpyxl.cell import Cell
 from textwrap import dedent
 
-from forgot_again.file import load_ast_if_exists, pprint_to_file, make_dirs, open_explorer_at
+import numpy as np
+
+from forgot_again.file import load_ast_if_exists, pprint_to_file, make_dirs
 from forgot_again.string import now_timestamp
 
+from exporters import reveal_file
+from tracing import traced
+
 GIGA = 1_000_000_000
 MEGA = 1_000_000
 KILO = 1_000
@@ -24,46 +23,61 @@ class MeasureResult:
 
     def __init__(self):
         self._secondaryParams = dict()
-        self._raw = list()
-        self._raw_x2 = list()
-        self._raw_x3 = list()
 
-        self._report = dict()
+        # точки по напряжениям питания в порядке прихода, столбцы -- в _Series
+        self._series = dict()
+        self._count = 0
+        self._last = None
 
-        self._processed = list()
-        self._processed_x2 = list()
-        self._processed_x3 = list()
+        self._raw_x2 = _EMPTY_HARM
+        self._raw_x3 = _EMPTY_HARM
+        self._processed_x2 = _EMPTY_HARM
+        self._processed_x3 = _EMPTY_HARM
 
         self.ready = False
 
-        self.data1 = defaultdict(list)
-        self.data2 = defaultdict(list)
-        self.data3 = dict()
-        self.data4 = dict()
-        self.data5 = defaultdict(list)
-        self.data6 = defaultdict(list)
-
         self.adjustment = load_ast_if_exists('adjust.ini', default=None)
 
     def __bool__(self):
         return self.ready
 
-    def _process(self):
-        harm_x2 = [list(d.values()) for d in self._raw_x2]
-        harm_x2 = _find_deltas(harm_x2, self._processed)
-        self.data3[1] = harm_x2
-        self._processed_x2 = harm_x2
+    # серии для графиков: {Uпит: (xs, ys)}, xs и ys -- срезы столбцов без копирования,
+    # действительны до следующей точки, поэтому берутся заново при каждой перерисовке
+    @property
+    def data1(self):
+        return {u_src: (s['u_control'], s['f_tune']) for u_src, s in self._series.items()}
 
-        harm_x3 = [list(d.values()) for d in self._raw_x3]
-        harm_x3 = _find_deltas(harm_x3, self._processed)
-        self.data4[1] = harm_x3
-        self._processed_x3 = harm_x3
+    @property
+    def data2(self):
+        return {u_src: (s['u_control'], s['p_out']) for u_src, s in self._series.items()}
+
+    @property
+    def data3(self):
+        return {1: (self._processed_x2[:, 0], self._processed_x2[:, 1])} if self.ready else dict()
+
+    @property
+    def data4(self):
+        return {1: (self._processed_x3[:, 0], self._processed_x3[:, 1])} if self.ready else dict()
 
+    @property
+    def data5(self):
+        return {u_src: (s['u_control'], s['i_src']) for u_src, s in self._series.items()}
+
+    @property
+    def data6(self):
+        # у первой точки серии наклона нет
+        return {u_src: (s['u_control'][1:], s['tune'][1:]) for u_src, s in self._series.items() if len(s) > 1}
+
+    def _process(self):
+        # гармоники сопоставляются с основной мощностью по номеру точки
+        p_out = self._column('p_out')
+        self._processed_x2 = _find_deltas(self._raw_x2, p_out)
+        self._processed_x3 = _find_deltas(self._raw_x3, p_out)
         self.ready = True
 
     def add_harmonics_measurement(self, x2, x3):
-        self._raw_x2 = list(x2)
-        self._raw_x3 = list(x3)
+        self._raw_x2 = _harm_array(x2)
+        self._raw_x3 = _harm_array(x3)
 
     def _process_point(self, data):
         u_src = data['u_src']
@@ -74,52 +88,36 @@ class MeasureResult:
         i_src = data['read_i'] / MILLI
 
         if self.adjustment is not None:
-            point = self.adjustment[len(self._processed)]
+            point = self.adjustment[self._count]
             f_tune += point['f_tune']
             p_out += point['p_out']
             i_src += point['i_src']
 
-        self._report = {
-            'u_src': u_src,
-            'u_control': u_control,
-            'f_tune': f_tune,
-            'p_out': p_out,
-            'i_src': i_src,
-        }
-
-        self.data1[u_src].append([u_control, f_tune])
-        self.data2[u_src].append([u_control, p_out])
-        self.data5[u_src].append([u_control, i_src])
-
-        if len(self._processed):
-            # (f2 - f1) / (u2 - u1) * 100
-            last_point = self._processed[-1]
-            f1 = last_point['f_tune']
-            f2 = f_tune
-            u1 = last_point['u_control']
-            u2 = u_control
-            tune = (f2 - f1) / (u2 - u1) * 100
-            self.data6[u_src].append([u_control, tune])
-        self._processed.append({**self._report})
+        series = self._series.get(u_src)
+        if series is None:
+            series = self._series[u_src] = _Series()
+        series.append(u_control, f_tune, p_out, i_src)
+
+        self._last = u_src
+        self._count += 1
+
+    def _column(self, name):
+        # столбец всех точек подряд, по сериям; копия, нужна только при обработке и выгрузке
+        if not self._series:
+            return np.empty(0)
+        return np.concatenate([s[name] for s in self._series.values()])
 
     def clear(self):
         self._secondaryParams.clear()
-        self._raw.clear()
-        self._raw_x2.clear()
-        self._raw_x3.clear()
 
-        self._report.clear()
+        self._series.clear()
+        self._count = 0
+        self._last = None
 
-        self._processed.clear()
-        self._processed_x2.clear()
-        self._processed_x3.clear()
-
-        self.data1.clear()
-        self.data2.clear()
-        self.data3.clear()
-        self.data4.clear()
-        self.data5.clear()
-        self.data6.clear()
+        self._raw_x2 = _EMPTY_HARM
+        self._raw_x3 = _EMPTY_HARM
+        self._processed_x2 = _EMPTY_HARM
+        self._processed_x3 = _EMPTY_HARM
 
         self.adjustment = load_ast_if_exists('adjust.ini', default=None)
 
@@ -129,21 +127,26 @@ class MeasureResult:
         self._secondaryParams = dict(**params.params)
 
     def add_point(self, data):
-        self._raw.append(data)
         self._process_point(data)
 
     def save_adjustment_template(self):
         if self.adjustment is None:
             print('measured, saving template')
             self.adjustment = [{
-                'u_src': p['u_src'],
-                'u_control': p['u_control'],
+                'u_src': u_src,
+                'u_control': u_control,
                 'f_tune': 0,
                 'p_out': 0,
                 'i_src': 0,
-            } for p in self._processed]
+            } for u_src, s in self._series.items() for u_control in s['u_control'].tolist()]
             pprint_to_file('adjust.ini', self.adjustment)
 
+    @property
+    def _report(self):
+        if self._last is None:
+            return dict()
+        return {'u_src': self._last, **self._series[self._last].last()}
+
     @property
     def report(self):
         return dedent("""        Источник питания:
@@ -156,14 +159,22 @@ class MeasureResult:
         Pвых, дБм={p_out:0.3f}
         """.format(**self._report))
 
-    def export_excel(self):
+    @traced('export excel', 'io')
+    def export_excel(self, reveal=True):
+        # pandas и openpyxl нужны только для выгрузки, не грузим их при старте
+        import openpyxl
+        import pandas as pd
+
+        from openpyxl.chart import Reference
+        from openpyxl.utils import get_column_letter
+
         make_dirs(self.path)
         fn = self._secondaryParams.get('file_name', None) or f'{self.device}-{self.measurement_name}-{now_timestamp()}'
         file_name = f'./{self.path}/{fn}.xlsx'
 
         u_dr_1, u_dr_2, u_dr_3 = 0, 0, 0
 
-        udrs = list({point['u_src']: 0 for point in self._processed}.keys())
+        udrs = list(self._series.keys())
         try:
             u_dr_1 = udrs[0]
             u_dr_2 = udrs[1]
@@ -171,54 +182,53 @@ class MeasureResult:
         except IndexError:
             pass
 
-        result_harmonics_x2 = [[u_dr_1] + row for row in self._processed_x2]
-        result_harmonics_x3 = [[u_dr_1] + row for row in self._processed_x3]
+        df_harm_2 = pd.DataFrame({'Uпит, В': u_dr_1, 'Uупр, В': self._processed_x2[:, 0], 'Pвых_2, дБм': self._processed_x2[:, 1]})
+        df_harm_3 = pd.DataFrame({'Uпит, В': u_dr_1, 'Uупр, В': self._processed_x3[:, 0], 'Pвых_3, дБм': self._processed_x3[:, 1]})
 
-        df_harm_2 = pd.DataFrame(result_harmonics_x2, columns=['Uпит, В', 'Uупр, В', 'Pвых_2, дБм'])
-        df_harm_3 = pd.DataFrame(result_harmonics_x3, columns=['Uпит, В', 'Uупр, В', 'Pвых_3, дБм'])
+        df = pd.DataFrame({
+            'Uпит, В': np.concatenate([np.full(len(s), u_src) for u_src, s in self._series.items()] or [np.empty(0)]),
+            'Uупр, В': self._column('u_control'),
+            'Fвых, МГц': self._column('f_tune'),
+            'Pвых, дБм': self._column('p_out'),
+            'Iпот, мА': self._column('i_src'),
+        })
 
-        df = pd.DataFrame(self._processed)
-        df.columns=['Uпит, В', 'Uупр, В', 'Fвых, МГц', 'Pвых, дБм', 'Iпот, мА', ]
-
-        df['fdiff'] = df.groupby('Uпит, В')['Fвых, МГц'].diff().shift(-1)
-        df['udiff'] = df.groupby('Uпит, В')['Uупр, В'].diff().shift(-1)
-        df['S, МГц/В'] = df[df['fdiff'].notna()].apply(lambda row: (row['fdiff'] / row['udiff']) * 100, axis = 1)
-        df = df.drop(['fdiff', 'udiff'], axis=1)
+        # производные колонки считаются целыми столбцами, без построчного apply
+        by_src = df.groupby('Uпит, В')
+        df['S, МГц/В'] = by_src['Fвых, МГц'].diff().shift(-1) / by_src['Uупр, В'].diff().shift(-1) * 100
 
         df = pd.merge(df, df_harm_2, how='left', on=['Uпит, В', 'Uупр, В'])
         df = pd.merge(df, df_harm_3, how='left', on=['Uпит, В', 'Uупр, В'])
 
-        df['Pвых_2отн, дБм'] = df[df['Pвых_2, дБм'].notna()].apply(lambda row: -(row['Pвых, дБм'] - row['Pвых_2, дБм']), axis=1)
-        df['Pвых_3отн, дБм'] = df[df['Pвых_3, дБм'].notna()].apply(lambda row: -(row['Pвых, дБм'] - row['Pвых_3, дБм']), axis=1)
+        df['Pвых_2отн, дБм'] = -(df['Pвых, дБм'] - df['Pвых_2, дБм'])
+        df['Pвых_3отн, дБм'] = -(df['Pвых, дБм'] - df['Pвых_3, дБм'])
         df['S, МГц/В'] = df['S, МГц/В'].fillna(0)
 
         df_udr_1 = df[df['Uпит, В'] == u_dr_1]
         df_udr_2 = df[df['Uпит, В'] == u_dr_2]
         df_udr_3 = df[df['Uпит, В'] == u_dr_3]
 
-        cols = len(df_udr_1.columns)
+        header = df.columns.values.tolist()
+        cols = len(header)
         rows = len(df_udr_1)
 
-        udr_1_s = [df_udr_1.columns.values.tolist()] + df_udr_1.values.tolist()
-        udr_2_s = [df_udr_2.columns.values.tolist()] + (df_udr_2.values.tolist() or [[''] * cols] * rows)
-        udr_3_s = [df_udr_3.columns.values.tolist()] + (df_udr_3.values.tolist() or [[''] * cols] * rows)
-
-        print(udr_1_s)
-        print(udr_2_s)
-        print(udr_3_s)
+        # пустой набор заменяется пустыми строками, таблицы идут рядом через два пустых столбца
+        blocks = [df_udr_1.itertuples(index=False, name=None)] + [
+            d.itertuples(index=False, name=None) if len(d) else [('', ) * cols] * rows for d in (df_udr_2, df_udr_3)
+        ]
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
+        # write-only книга пишет строки сразу в файл, не держа всю таблицу ячейками в памяти
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
 
-        out = []
-        for r1, r2, r3 in zip(udr_1_s, udr_2_s, udr_3_s):
-            row = r1 + ['', ''] + r2 + ['', ''] + r3
-            out.append(row)
+        ws.append(header + ['', ''] + header + ['', ''] + header)
+        for r1, r2, r3 in zip(*blocks):
+            ws.append([*r1, '', '', *r2, '', '', *r3])
 
-        for row in out:
-            ws.append(row)
+        def loc(dy, dx):
+            # в write-only листе нет ячеек, адрес считается от левого верхнего угла графиков
+            return f'{get_column_letter(2 + dx)}{rows + 4 + dy}'
 
-        top_left_cell: Cell = ws.cell(row=rows + 4, column=2)
         dx = 9
         dy = 15
 
@@ -231,7 +241,7 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!AA2:AA{rows + 1}'),
             ],
             title='Диапазон перестройки',
-            loc=top_left_cell.offset(0, 0).coordinate,
+            loc=loc(0, 0),
             curve_labels=['Uпит = 4.7В', 'Uпит = 5.0В', 'Uпит = 5.3В'],
             ax_titles=['Uупр, В', 'Fвых, МГц'],
         )
@@ -245,7 +255,7 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!AB2:AB{rows + 1}'),
             ],
             title='Мощность',
-            loc=top_left_cell.offset(0, dx).coordinate,
+            loc=loc(0, dx),
             curve_labels=['Uпит = 4.7В', 'Uпит = 5.0В', 'Uпит = 5.3В'],
             ax_titles=['Uупр, В', 'Pвых, дБм'],
         )
@@ -257,7 +267,7 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!I2:I{rows + 1}'),
             ],
             title='Относительный уровень 2й гармоники',
-            loc=top_left_cell.offset(dy, 0).coordinate,
+            loc=loc(dy, 0),
             curve_labels=['Uпит = 4.7В'],
             ax_titles=['Uупр, В', 'Pвых х2, МГц'],
         )
@@ -269,7 +279,7 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!J2:J{rows + 1}'),
             ],
             title='Относительный уровень 3й гармоники',
-            loc=top_left_cell.offset(dy, dx).coordinate,
+            loc=loc(dy, dx),
             curve_labels=['Uпит = 4.7В'],
             ax_titles=['Uупр, В', 'Pвых х3, МГц'],
         )
@@ -281,7 +291,7 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!E2:E{rows + 1}'),
             ],
             title='Ток потребления',
-            loc=top_left_cell.offset(0, 2 * dx).coordinate,
+            loc=loc(0, 2 * dx),
             curve_labels=['Uпит = 4.7В'],
             ax_titles=['Uупр, В', 'Iпот, мА'],
         )
@@ -293,16 +303,21 @@ class MeasureResult:
                 Reference(ws, range_string=f'{ws.title}!F2:F{rows}'),
             ],
             title='Чувствительность',
-            loc=top_left_cell.offset(dy, 2 * dx).coordinate,
+            loc=loc(dy, 2 * dx),
             curve_labels=['Uпит = 4.7В'],
             ax_titles=['Uупр, В', 'S, МГц/В'],
         )
 
         wb.save(file_name)
-        open_explorer_at(os.path.abspath(file_name))
+        if reveal:
+            reveal_file(file_name)
+        return file_name
 
 
 def _add_chart(ws, xs, ys, title, loc, curve_labels=None, ax_titles=None):
+    from openpyxl.chart import LineChart, Series
+    from openpyxl.chart.axis import ChartLines
+
     chart = LineChart()
 
     for y, label in zip(ys, curve_labels):
@@ -323,5 +338,51 @@ def _add_chart(ws, xs, ys, title, loc, curve_labels=None, ax_titles=None):
     ws.add_chart(chart, loc)
 
 
-def _find_deltas(harm, origin):
-    return [[harm[0], -(main['p_out'] - harm[1])] for harm, main in zip(harm, origin)]
+class _Series:
+    # столбцы одной серии в одном массиве [поле, точка]; при заполнении ёмкость удваивается,
+    # так что добавление точки -- несколько присваиваний без выделения памяти
+    FIELDS = ('u_control', 'f_tune', 'p_out', 'i_src', 'tune')
+
+    def __init__(self, capacity=256):
+        self._data = np.empty((len(self.FIELDS), capacity))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        return self._data[self.FIELDS.index(name), :self._size]
+
+    def append(self, u_control, f_tune, p_out, i_src):
+        n = self._size
+        if n == self._data.shape[1]:
+            data = np.empty((len(self.FIELDS), 2 * n))
+            data[:, :n] = self._data
+            self._data = data
+        d = self._data
+
+        # (f2 - f1) / (u2 - u1) * 100 по предыдущей точке той же серии
+        tune = np.nan
+        if n:
+            du = u_control - d[0, n - 1]
+            tune = (f_tune - d[1, n - 1]) / du * 100 if du else np.nan
+
+        d[:, n] = (u_control, f_tune, p_out, i_src, tune)
+        self._size = n + 1
+
+    def last(self):
+        return dict(zip(self.FIELDS[:-1], self._data[:-1, self._size - 1].tolist()))
+
+
+_EMPTY_HARM = np.empty((0, 2))
+
+
+def _harm_array(harm):
+    # [{'u_control': ..., 'p': ...}, ...] -> [[u_control, p], ...]
+    return np.array([list(d.values()) for d in harm], dtype=float).reshape(-1, 2)
+
+
+def _find_deltas(harm, p_out):
+    # уровень гармоники относительно основной мощности той же по счёту точки
+    n = min(len(harm), len(p_out))
+    return np.column_stack([harm[:n, 0], harm[:n, 1] - p_out[:n]])
@@ -0,0 +1,561 @@
+import argparse
+import itertools
+import json
+import math
+import queue
+import select
+import socket
+import socketserver
+import sys
+import threading
+
+from cancellation import CancelEvent
+from currentbuffer import FinalPoints
+
+# сервер измерений: один процесс владеет приборами, задания и точки ходят по localhost,
+# одна строка JSON -- одно сообщение
+#   -> {"cmd": "submit", "mode": "continuous", "params": {...}, "cal_in": "...", "cal_out": "...", "dut": "SN123"}
+#      "task" (задание измерения) и "cal_data" (калибровка по входу) -- вместо файлов калибровки, так работает GUI
+#   <- {"ok": true, "job": 1}
+#   -> {"cmd": "subscribe"}
+#   <- {"ok": true}, затем поток {"event": "started" | "point" | "finished", "job": 1, ...}
+#   -> {"cmd": "status"}
+#   -> {"cmd": "cancel", "job": 1}
+# после subscribe соединение только принимает события, команды идут отдельными соединениями;
+# приборами владеет один процесс: GUI с --server=host:port работает через RemoteInstrumentController
+# и приборы не открывает; процесс, открывающий приборы сам, получает отказ с номером владельца (sessionpool.SessionLock)
+#   python measureserver.py --port 5055
+#   python main.py --server=127.0.0.1:5055
+
+HOST = '127.0.0.1'
+PORT = 5055
+SUBSCRIBER_QUEUE = 10_000
+# сколько законченных заданий помнит сервер для запроса job, старые забываются
+JOB_RETENTION = 100
+POLL_INTERVAL = 0.05
+
+MODES = ['calibrate-in', 'calibrate-out', 'continuous', 'pulse']
+
+
+class Subscriber:
+    # медленный подписчик не тормозит развёртку: при переполнении выбрасываются самые старые события
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class Hub:
+    def __init__(self):
+        self._subscribers = list()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, maxsize=SUBSCRIBER_QUEUE):
+        subscriber = Subscriber(maxsize)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+
+class Job:
+    def __init__(self, job_id, mode, params, cal_in, cal_out, dut='', task=None, cal_data=None):
+        self.id = job_id
+        self.mode = mode
+        self.params = params
+        self.cal_in = cal_in
+        self.cal_out = cal_out
+        self.dut = dut
+        self.task = task
+        self.cal_data = cal_data
+        self.token = CancelEvent()
+        self.state = 'queued'
+        self.points = 0
+        self.msg = ''
+        # забракован по допускам, а не оборван ошибкой прибора
+        self.rejected = False
+
+    def info(self):
+        return {
+            'job': self.id,
+            'mode': self.mode,
+            'dut': self.dut,
+            'state': self.state,
+            'points': self.points,
+            'msg': self.msg,
+            'rejected': self.rejected,
+        }
+
+
+class MeasureServer:
+    def __init__(self, controller, host=HOST, port=PORT, cal_in='default_cal_in.txt', cal_out='default_cal_out.txt'):
+        self._controller = controller
+        self._cal_in = cal_in
+        self._cal_out = cal_out
+
+        self._hub = Hub()
+        self._jobs = dict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = queue.Queue()
+        self._current = None
+        self._stopped = threading.Event()
+
+        self._server = _TcpServer((host, port), _Handler)
+        self._server.owner = self
+        self._worker = threading.Thread(target=self._work, name='measure-jobs', daemon=True)
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def serve_forever(self):
+        self._worker.start()
+        print(f'measure server on {self.address[0]}:{self.address[1]}')
+        self._server.serve_forever()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='measure-server', daemon=True).start()
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._current is not None:
+            self._current.token.cancelled = True
+        self._pending.put(None)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def subscribe(self):
+        return self._hub.subscribe()
+
+    def unsubscribe(self, subscriber):
+        self._hub.unsubscribe(subscriber)
+
+    def submit(self, mode, params=None, cal_in='', cal_out='', dut='', task=None, cal_data=None):
+        if mode not in MODES:
+            return False, f'unknown mode {mode}'
+        job = Job(
+            next(self._ids),
+            mode,
+            {**self._controller.secondaryParams.params, **(params or dict())},
+            cal_in or self._cal_in,
+            cal_out or self._cal_out,
+            dut,
+            task,
+            cal_data,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pending.put(job)
+        return True, job
+
+    def cancel(self, job_id=None):
+        job = self._current if job_id is None else self.job(job_id)
+        if job is None:
+            return False, f'no job {job_id}' if job_id is not None else 'no running job'
+        if job.state not in ('queued', 'running'):
+            return False, f'job {job.id} is {job.state}'
+        job.token.cancelled = True
+        return True, f'job {job.id} cancel requested'
+
+    def status(self):
+        with self._lock:
+            queued = [job.id for job in self._jobs.values() if job.state == 'queued']
+        return {
+            'busy': self._current is not None,
+            'current': self._current.info() if self._current is not None else None,
+            'queued': queued,
+            'subscribers': len(self._hub),
+            'instruments': [f'{s}' for s in self._controller.status],
+        }
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self):
+        from runner import run_job
+
+        while not self.stopped:
+            job = self._pending.get()
+            if job is None:
+                break
+
+            if job.token.cancelled:
+                self._finish(job, False, f'job {job.id} cancelled before start')
+                continue
+
+            self._current = job
+            job.state = 'running'
+            self._hub.publish({'event': 'started', 'job': job.id, 'mode': job.mode})
+
+            # при буфере тока подписчики получают каждую точку один раз, уже с током
+            points = FinalPoints(lambda point: self._point(job, point), buffered=bool(int(job.params.get('curr_buf', 0))))
+            self._controller.lastLimits = None
+            try:
+                ok, msg = run_job(
+                    self._controller, job.mode, job.token, job.params, points, job.cal_in, job.cal_out,
+                    dut=job.dut, task=job.task, cal_data=job.cal_data,
+                )
+            except Exception as ex:
+                ok, msg = False, f'{job.mode} error: {ex!r}'
+            points.flush()
+            limits = self._controller.lastLimits
+            job.rejected = not ok and limits is not None and not limits.passed
+            self._current = None
+            self._finish(job, ok, msg)
+
+    def _point(self, job, point):
+        job.points += 1
+        self._hub.publish({'event': 'point', 'job': job.id, 'point': dict(point)})
+
+    def _finish(self, job, ok, msg):
+        job.state = 'done' if ok else ('cancelled' if job.token.cancelled else 'failed')
+        job.msg = msg
+        print(f'job {job.id} {job.mode}: {msg}')
+        self._hub.publish({'event': 'finished', 'job': job.id, 'ok': ok, 'msg': msg, 'points': job.points, 'rejected': job.rejected})
+
+        # долго работающий сервер не копит задания: помнит только последние законченные
+        with self._lock:
+            finished = [j.id for j in self._jobs.values() if j.state not in ('queued', 'running')]
+            for job_id in finished[:-JOB_RETENTION]:
+                del self._jobs[job_id]
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server.owner
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as ex:
+                self._reply({'ok': False, 'msg': f'bad request: {ex}'})
+                continue
+
+            cmd = request.get('cmd')
+            if cmd == 'subscribe':
+                self._stream(server)
+                return
+            elif cmd == 'submit':
+                ok, job = server.submit(
+                    request.get('mode'),
+                    request.get('params'),
+                    request.get('cal_in', ''),
+                    request.get('cal_out', ''),
+                    request.get('dut', ''),
+                    request.get('task'),
+                    request.get('cal_data'),
+                )
+                self._reply({'ok': True, 'job': job.id} if ok else {'ok': False, 'msg': job})
+            elif cmd == 'cancel':
+                ok, msg = server.cancel(request.get('job'))
+                self._reply({'ok': ok, 'msg': msg})
+            elif cmd == 'status':
+                self._reply({'ok': True, **server.status()})
+            elif cmd == 'job':
+                job = server.job(request.get('job'))
+                self._reply({'ok': True, **job.info()} if job is not None else {'ok': False, 'msg': f'no job {request.get("job")}'})
+            else:
+                self._reply({'ok': False, 'msg': f'unknown command {cmd}'})
+
+    def _reply(self, message):
+        self.wfile.write((dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def _stream(self, server):
+        subscriber = server.subscribe()
+        try:
+            self._reply({'ok': True})
+            while not server.stopped:
+                try:
+                    event = subscriber.queue.get(timeout=1)
+                except queue.Empty:
+                    if self._closed():
+                        break
+                    continue
+                if subscriber.dropped:
+                    event = {**event, 'dropped': subscriber.dropped}
+                self._reply(event)
+        except OSError:
+            pass
+        finally:
+            server.unsubscribe(subscriber)
+
+    def _closed(self):
+        # подписчик ничего не присылает, поэтому читаемый сокет означает закрытое соединение
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+
+class MeasureClient:
+    def __init__(self, host=HOST, port=PORT, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.host}:{self.port})'
+
+    @classmethod
+    def from_address(cls, address, timeout=5):
+        host, _, port = address.rpartition(':')
+        return cls(host or HOST, int(port or PORT), timeout=timeout)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        return sock, sock.makefile('rwb')
+
+    def request(self, **message):
+        sock, stream = self._connect()
+        with sock, stream:
+            stream.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+            stream.flush()
+            line = stream.readline()
+        if not line:
+            return {'ok': False, 'msg': 'server closed connection'}
+        return json.loads(line)
+
+    def submit(self, mode, params=None, cal_in='', cal_out='', dut='', task=None, cal_data=None):
+        return self.request(cmd='submit', mode=mode, params=params, cal_in=cal_in, cal_out=cal_out, dut=dut, task=task, cal_data=cal_data)
+
+    def cancel(self, job=None):
+        return self.request(cmd='cancel', job=job)
+
+    def status(self):
+        return self.request(cmd='status')
+
+    def subscribe(self):
+        # подписка оформляется сразу, до первого next(), чтобы не пропустить начало задания
+        sock, stream = self._connect()
+        stream.write(b'{"cmd": "subscribe"}\n')
+        stream.flush()
+        reply = json.loads(stream.readline() or b'{}')
+        if not reply.get('ok'):
+            sock.close()
+            raise ConnectionError(f'subscribe failed: {reply}')
+        # события могут не приходить дольше таймаута запросов
+        sock.settimeout(None)
+
+        def events():
+            with sock, stream:
+                for line in stream:
+                    yield json.loads(line)
+
+        return events()
+
+
+class RemoteInstrumentController:
+    # тот же интерфейс, что у InstrumentController, но приборами владеет сервер измерений:
+    # задания уходят через MeasureClient, точки приходят подпиской, отмена -- командой cancel;
+    # параметры и список приборов берутся у локального контроллера, который приборы не открывает
+
+    def __init__(self, controller, client):
+        self._controller = controller
+        self._client = client
+        self._status = list()
+
+    def __getattr__(self, item):
+        return getattr(self._controller, item)
+
+    def __str__(self):
+        return f'Remote({self._client}, {self._status})'
+
+    @property
+    def status(self):
+        return self._status
+
+    def connect(self, **kwargs):
+        # адреса приборов знает сервер, здесь только проверяется, что он отвечает
+        try:
+            reply = self._client.status()
+        except OSError as ex:
+            return False, f'measure server {self._client} unavailable: {ex}'
+        self._status = reply.get('instruments', list())
+        return True, f'connected to measure server {self._client}'
+
+    def calibrateIn(self, **kwargs):
+        return self._call('calibrate-in', **kwargs)[:2]
+
+    def calibrateOut(self, **kwargs):
+        cal_data = kwargs.pop('cal_data')
+        return self._call('calibrate-out', cal_data=cal_data, **kwargs)[:2]
+
+    def measure(self, **kwargs):
+        return self._call('continuous', **kwargs)[:2]
+
+    def measurePulse(self, **kwargs):
+        return self._call('pulse', **kwargs)[:2]
+
+    def measureBatch(self, **kwargs):
+        # очередь ведёт клиент: оператор отвечает здесь, каждый прибор -- отдельное задание сервера
+        from instrumentcontroller import batch_summary
+
+        report_fn = kwargs.pop('report_fn')
+        token = kwargs.pop('token')
+        params = kwargs.pop('params')
+        task = kwargs.pop('task')
+        queue = kwargs.pop('queue')
+        prompt_fn = kwargs.pop('prompt_fn')
+
+        verdicts = list()
+        for done, (serial, mode) in enumerate(queue):
+            if token.cancelled or not prompt_fn(serial, mode):
+                return False, batch_summary(f'batch cancel after {done} devices', verdicts)
+
+            ok, msg, rejected = self._call(
+                mode,
+                report_fn=lambda point: report_fn({**point, 'dut': serial}),
+                token=token,
+                params=params,
+                task=task,
+                dut=serial,
+            )
+            if ok:
+                verdicts.append((serial, mode, 'PASS', ''))
+                continue
+            if token.cancelled:
+                return False, batch_summary(f'batch cancel after {done} devices', verdicts)
+            if rejected:
+                verdicts.append((serial, mode, 'FAIL', msg))
+                continue
+            verdicts.append((serial, mode, 'ERROR', msg))
+            return False, batch_summary(f'batch stopped after {done} devices on instrument error', verdicts)
+
+        return all(v[2] == 'PASS' for v in verdicts), batch_summary(f'batch done, {len(queue)} devices', verdicts)
+
+    def _call(self, mode, report_fn, token, params, task=None, cal_data=None, dut=''):
+        # (ok, msg, rejected); подписка -- до отправки задания, чтобы не пропустить первые точки
+        try:
+            events = self._client.subscribe()
+            reply = self._client.submit(mode, params=params, dut=dut, task=task, cal_data=cal_data)
+        except OSError as ex:
+            return False, f'measure server {self._client} unavailable: {ex}', False
+        if not reply.get('ok'):
+            events.close()
+            return False, reply.get('msg', f'{mode} rejected by measure server'), False
+        job = reply['job']
+
+        finished = threading.Event()
+        threading.Thread(target=self._watchCancel, args=(job, token, finished), name=f'remote-cancel-{job}', daemon=True).start()
+        res = False, 'measure server closed connection', False
+        try:
+            for event in events:
+                if event.get('job') != job:
+                    continue
+                if event['event'] == 'point':
+                    # пустые значения приходят как null, дальше их ждут как nan
+                    report_fn({k: math.nan if v is None else v for k, v in event['point'].items()})
+                elif event['event'] == 'finished':
+                    res = event['ok'], event['msg'], event.get('rejected', False)
+                    break
+        except OSError as ex:
+            res = False, f'measure server connection lost: {ex}', False
+        finally:
+            finished.set()
+            events.close()
+
+        try:
+            self._status = self._client.status().get('instruments', self._status)
+        except OSError:
+            pass
+        return res
+
+    def _watchCancel(self, job, token, finished):
+        while not finished.wait(POLL_INTERVAL):
+            if token.cancelled:
+                try:
+                    self._client.cancel(job)
+                except OSError as ex:
+                    print(f'measure server cancel error: {ex}')
+                return
+
+
+def dumps(message):
+    # NaN и бесконечностей в JSON нет, пустые значения уходят как null
+    return json.dumps(_plain(message), ensure_ascii=False, allow_nan=False)
+
+
+def _plain(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Сервер измерений')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--instr', default='instr.ini', help='адреса приборов')
+    parser.add_argument('--params', default='params.ini', help='параметры измерения по умолчанию')
+    parser.add_argument('--cal-in', default='default_cal_in.txt', help='калибровка по входу')
+    parser.add_argument('--cal-out', default='default_cal_out.txt', help='калибровка по выходу')
+    return parser.parse_args(args)
+
+
+def main(args):
+    from forgot_again.file import load_ast_if_exists
+
+    from instrumentcontroller import InstrumentController
+
+    args = parse_args(args)
+
+    controller = InstrumentController()
+    controller.secondaryParams.file_name = args.params
+    controller.secondaryParams.load_from_config()
+
+    addrs = load_ast_if_exists(args.instr, default={k: v.addr for k, v in controller.requiredInstruments.items()})
+    # приборы, уже открытые GUI или консольным запуском, сервер не отнимает
+    ok, msg = controller.connect(addrs=addrs)
+    if not ok:
+        print(f'measure server not started: {msg}')
+        sys.exit(1)
+    print(msg)
+
+    server = MeasureServer(controller, host=args.host, port=args.port, cal_in=args.cal_in, cal_out=args.cal_out)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,38 @@
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class PointBatcher(QObject):
+    # точки копятся из потока измерения и уходят в GUI пачкой не чаще rate раз в секунду,
+    # чтобы цена обновления таблиц не зависела от скорости приборов
+    batchReady = pyqtSignal(list)
+
+    def __init__(self, parent=None, rate=30):
+        super().__init__(parent)
+
+        self._lock = threading.Lock()
+        self._pending = list()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(int(1000 / rate))
+        self._timer.timeout.connect(self.flush)
+
+    def push(self, point):
+        with self._lock:
+            self._pending.append(point)
+
+    def start(self):
+        with self._lock:
+            self._pending.clear()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, list()
+        if batch:
+            self.batchReady.emit(batch)
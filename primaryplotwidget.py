@@ -257,8 +257,8 @@ class PrimaryPlotWidget(QWidget):
 
 
 def _plot_curves(datas, curves, plot, prefix='', suffix=''):
-    for pow_lo, data in datas.items():
-        curve_xs, curve_ys = zip(*data)
+    # data -- пара массивов (xs, ys) из MeasureResult, передаются в pyqtgraph без перепаковки
+    for pow_lo, (curve_xs, curve_ys) in datas.items():
         try:
             curves[pow_lo].setData(x=curve_xs, y=curve_ys)
         except KeyError:
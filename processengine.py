@@ -0,0 +1,177 @@
+import atexit
+import multiprocessing
+import threading
+
+from resultring import ResultRing, CAPACITY
+
+POLL_INTERVAL = 0.01
+
+
+class _EventToken:
+    # токен отмены процесса измерений поверх multiprocessing.Event
+
+    def __init__(self, event):
+        self._event = event
+        self.cancelledAt = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+
+def _engine_main(conn, cancel, ring_name, capacity):
+    # процесс измерений: свой интерпретатор и свой GIL, GUI на тайминги развёртки не влияет
+    from instrumentcontroller import InstrumentController
+
+    controller = InstrumentController()
+    ring = ResultRing.attach(ring_name, capacity)
+    token = _EventToken(cancel)
+
+    def prompt(serial, mode):
+        conn.send(('prompt', serial, mode))
+        return conn.recv()[1]
+
+    try:
+        while True:
+            msg = conn.recv()
+            cmd = msg[0]
+            if cmd == 'stop':
+                break
+
+            try:
+                if cmd == 'connect':
+                    res = controller.connect(addrs=msg[1])
+                else:
+                    _, method, kwargs = msg
+                    if method == 'measureBatch':
+                        kwargs['prompt_fn'] = prompt
+                    res = getattr(controller, method)(token=token, report_fn=ring.push, **kwargs)
+            except Exception as ex:
+                res = False, f'{cmd} error: {ex!r}'
+
+            conn.send(('done', res, [f'{s}' for s in controller.status]))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        ring.close()
+
+
+class ProcessInstrumentController:
+    # тот же интерфейс, что у InstrumentController, но приборы и развёртка живут в дочернем процессе:
+    # команды и ответы идут по Pipe, отмена -- через Event, точки -- через кольцо в разделяемой памяти;
+    # параметры и список приборов берутся у локального контроллера, который приборы не открывает
+
+    def __init__(self, controller, capacity=CAPACITY):
+        self._controller = controller
+        self._ring = ResultRing.create(capacity)
+        self._lock = threading.Lock()
+        self._status = list()
+
+        # fork вместе с Qt ненадёжен, поэтому дочерний процесс запускается с нуля
+        context = multiprocessing.get_context('spawn')
+        self._cancel = context.Event()
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_engine_main,
+            args=(child_conn, self._cancel, self._ring.name, capacity),
+            name='instrument-engine',
+            daemon=True,
+        )
+        self._process.start()
+        atexit.register(self.close)
+
+    def __getattr__(self, item):
+        return getattr(self._controller, item)
+
+    def __str__(self):
+        return f'Process({self._process.pid}, {self._status})'
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def lostPoints(self):
+        return self._ring.lost
+
+    def connect(self, **kwargs):
+        addrs = kwargs.pop('addrs')
+        return self._request(('connect', addrs))
+
+    def calibrateIn(self, **kwargs):
+        return self._call('calibrateIn', **kwargs)
+
+    def calibrateOut(self, **kwargs):
+        return self._call('calibrateOut', **kwargs)
+
+    def measure(self, **kwargs):
+        return self._call('measure', **kwargs)
+
+    def measurePulse(self, **kwargs):
+        return self._call('measurePulse', **kwargs)
+
+    def measureBatch(self, **kwargs):
+        return self._call('measureBatch', **kwargs)
+
+    def close(self):
+        if self._process.is_alive():
+            try:
+                self._cancel.set()
+                self._conn.send(('stop', ))
+            except OSError:
+                pass
+            self._process.join(timeout=5)
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def _call(self, method, **kwargs):
+        report_fn = kwargs.pop('report_fn')
+        token = kwargs.pop('token')
+        prompt_fn = kwargs.pop('prompt_fn', None)
+        return self._request(('call', method, kwargs), token, report_fn, prompt_fn)
+
+    def _request(self, msg, token=None, report_fn=None, prompt_fn=None):
+        with self._lock:
+            if not self._process.is_alive():
+                return False, 'instrument engine is not running'
+
+            self._cancel.clear()
+            self._conn.send(msg)
+
+            dut = None
+            while True:
+                if token is not None and token.cancelled and not self._cancel.is_set():
+                    self._cancel.set()
+
+                ready = self._conn.poll(POLL_INTERVAL)
+                self._drain(report_fn, dut)
+                if not ready:
+                    if not self._process.is_alive():
+                        return False, 'instrument engine died'
+                    continue
+
+                reply = self._conn.recv()
+                if reply[0] == 'prompt':
+                    _, serial, mode = reply
+                    answer = bool(prompt_fn(serial, mode))
+                    dut = serial if answer else dut
+                    self._conn.send(('prompt', answer))
+                    continue
+
+                # точки кладутся в кольцо раньше ответа, последний проход забирает хвост
+                _, res, self._status = reply
+                self._drain(report_fn, dut)
+                return res
+
+    def _drain(self, report_fn, dut):
+        points = self._ring.read()
+        if report_fn is None:
+            return
+        for point in points:
+            if dut is not None:
+                point['dut'] = dut
+            report_fn(point)
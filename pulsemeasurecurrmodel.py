@@ -1,14 +1,13 @@
 import datetime
-import os
 
 from collections import defaultdict
-from subprocess import Popen
 
-from pandas import DataFrame
 from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant
 
-from forgot_again.file import make_dirs
+from exporters import export_excel
 from instr.const import GIGA
+from repeatstats import stats_tip
+from tracing import traced
 
 
 class PulseMeasureCurrModel(QAbstractTableModel):
@@ -17,26 +16,37 @@ class PulseMeasureCurrModel(QAbstractTableModel):
 
         self._header = header or ['#']
         self._data = defaultdict(dict)
+        self._tips = defaultdict(dict)
         self._pows = list()
         self._freqs = list()
 
     def clear(self):
         self.beginResetModel()
         self._data.clear()
+        self._tips.clear()
         self._pows.clear()
         self._freqs.clear()
         self.endResetModel()
 
     def update(self, point: dict):
+        self.updateBatch([point])
+
+    @traced('model update', 'gui', args=lambda self, points: {'model': self.__class__.__name__, 'points': len(points)})
+    def updateBatch(self, points: list):
         # a = {'f': 2700000000, 'p': 14.9917657, 'read_pow': 12.7655025, 'adjusted_pow': 15.0660151}
         self.beginResetModel()
 
-        p = round(point['p'])
-        p_ref = point['p_ref']
-        f = round(point['f'] / GIGA, 3)
-        self._pows = sorted(set(self._pows + [p_ref]))
-        self._freqs = sorted(set(self._freqs + [f]))
-        self._data[p_ref][f] = (point['read_curr'], 0)
+        pows = set(self._pows)
+        freqs = set(self._freqs)
+        for point in points:
+            f = round(point['f'] / GIGA, 3)
+            p_ref = point['p_ref']
+            pows.add(p_ref)
+            freqs.add(f)
+            self._data[p_ref][f] = (point['read_curr'], 0)
+            self._tips[p_ref][f] = stats_tip(point, 'read_curr')
+        self._pows = sorted(pows)
+        self._freqs = sorted(freqs)
 
         self._header = ['Pвх, дБм'] + [f'Fвх={v}, ГГц' for v in self._freqs]
         self.endResetModel()
@@ -67,23 +77,30 @@ class PulseMeasureCurrModel(QAbstractTableModel):
                 return QVariant(p)
             return QVariant(self._data[p].get(self._freqs[col - 1], (0, 0))[0])
 
+        if role == Qt.ToolTipRole and col:
+            # разброс повторов, если развёртка повторялась
+            return QVariant(self._tips[self._pows[row]].get(self._freqs[col - 1], ''))
+
         return QVariant()
 
     def is_ready(self):
         return bool(self._data)
 
-    def export(self, suffix=''):
+    def export(self, suffix='', file_name=''):
+        # таблица копируется сразу, в потоке GUI; медленная запись в Excel -- в возвращаемой функции,
+        # её можно отдать в фон: write(progress_fn, token) -> (ok, msg)
         device = f'{suffix}' if suffix else ''
         path = 'xlsx'
-        make_dirs('xlsx')
-        file_name = f'./{path}/{device}-{datetime.datetime.now().isoformat().replace(":", ".")}.xlsx'
+        file_name = file_name or f'./{path}/{device}-{datetime.datetime.now().isoformat().replace(":", ".")}.xlsx'
 
         pows = sorted(self._data.keys())
-        vals = [{f'Fвх={k}, ГГц': v[1] for k, v in row.items()} for row in self._data.values()]
-        vals = [{'Pвх, дБм': p, **v} for p, v in zip(pows, vals)]
+        # те же значения, что показывает таблица, строки -- по возрастанию мощности
+        vals = [{'Pвх, дБм': p, **{f'Fвх={k}, ГГц': v[0] for k, v in self._data[p].items()}} for p in pows]
+
+        @traced('export', 'io', args=lambda *_: {'file': file_name})
+        def write(progress_fn=None, token=None):
+            from pandas import DataFrame
 
-        df = DataFrame(vals)
-        df.to_excel(file_name, index=False)
+            return export_excel(file_name, {'Sheet1': DataFrame(vals)}, progress_fn, token)
 
-        full_path = os.path.abspath(file_name)
-        Popen(f'explorer /select,"{full_path}"')
+        return file_name, write
@@ -1,17 +1,27 @@
-from PyQt5 import uic
-from PyQt5.QtWidgets import QWidget, QHeaderView
+import inspect
+
+from PyQt5.QtWidgets import QWidget, QHeaderView, QFileDialog
 from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal
 
-from mytools.backgroundworker import BackgroundWorker, CancelToken, TaskResult
+from forgot_again.string import now_timestamp
+
+from pointbatcher import PointBatcher
+from repeatstats import RepeatStats
+from resultstore import PointStore
+from rfmetricsmodel import RfMetricsModel
+from cancellation import CancelEvent
+from exporters import FILE_FILTER, export_points
+from exportjobs import exports
+from mytools.backgroundworker import BackgroundWorker, TaskResult
 from instrumentcontroller import InstrumentController
 
 from pulsemeasurepowmodel import PulseMeasurePowModel
 from pulsemeasurecurrmodel import PulseMeasureCurrModel
+from uicache import load_ui
 
 
 class PulseWidget(QWidget):
     _measureFinished = pyqtSignal(TaskResult)
-    _measureReport = pyqtSignal(dict)
 
     def __init__(self, parent=None, controller: InstrumentController=None):
         super().__init__(parent)
@@ -20,23 +30,28 @@ class PulseWidget(QWidget):
         self.setAttribute(Qt.WA_DeleteOnClose)
 
         # create instance variables
-        self._ui = uic.loadUi('pulsewidget.ui', self)
+        self._ui = load_ui('pulsewidget.ui', self)
 
         self._worker = BackgroundWorker(self)
-        self._token = CancelToken()
+        self._token = CancelEvent()
+        self._batcher = PointBatcher(parent=self)
 
         self._controller = controller
 
         self._task = list()
         self._modelPow = PulseMeasurePowModel(parent=self)
         self._modelCurr = PulseMeasureCurrModel(parent=self)
+        self._modelMetrics = RfMetricsModel(parent=self)
+        self._store = PointStore()
+        self._stats = RepeatStats()
+        self._golden = None
 
         self._connectSignals()
         self._initUi()
 
     def _connectSignals(self):
         self._measureFinished.connect(self.on_measure_finished, type=Qt.QueuedConnection)
-        self._measureReport.connect(self.on_measureReport, type=Qt.QueuedConnection)
+        self._batcher.batchReady.connect(self.on_measureBatch)
 
     def _initUi(self):
         self._ui.tableMeasurePow.setModel(self._modelPow)
@@ -45,16 +60,31 @@ class PulseWidget(QWidget):
         self._ui.tableMeasureCurr.setModel(self._modelCurr)
         self._ui.tableMeasureCurr.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
 
+        self._ui.tableMetrics.setModel(self._modelMetrics)
+        self._ui.tableMetrics.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
     # worker dispatch
     def _startWorker(self, fn, cb, **kwargs):
+        if inspect.iscoroutinefunction(fn):
+            from asyncinstrument import runner
+            runner().runTask(fn=fn, fn_finished=cb, **kwargs)
+            return
         self._worker.runTask(fn=fn, fn_finished=cb, **kwargs)
 
     def _measure(self):
+        from goldencompare import GoldenCompare
+
         self._modelPow.clear()
         self._modelCurr.clear()
+        self._modelMetrics.clear(u_src=self._controller.secondaryParams.params.get('u_src', 0))
+        self._store.clear()
+        self._stats.clear()
+        # эталон перечитывается перед каждым измерением, его можно сменить, не перезапуская программу
+        self._golden = GoldenCompare.from_config('golden.ini', getattr(self._controller, 'dataset', None))
         if not self._task:
             return
-        self._token = CancelToken()
+        self._token = CancelEvent()
+        self._batcher.start()
         self._startWorker(
             fn=self._controller.measurePulse,
             cb=self._measureFinishedCallback,
@@ -72,10 +102,14 @@ class PulseWidget(QWidget):
         self._measureFinished.emit(TaskResult(*result))
 
     def _measureInProgress(self, data):
-        self._measureReport.emit(data)
+        self._batcher.push(data)
 
     @pyqtSlot(TaskResult)
     def on_measure_finished(self, result):
+        self._batcher.stop()
+        self._modelMetrics.finish()
+        if self._golden is not None:
+            print(self._golden.summary())
         ok, msg = result.values
         if not ok:
             print(f'error during raw command: {msg}')
@@ -87,11 +121,16 @@ class PulseWidget(QWidget):
     def on_calTask_ready(self, task):
         self._task = task
 
-    @pyqtSlot(dict)
-    def on_measureReport(self, data):
-        print('measure point:', data)
-        self._modelPow.update(data)
-        self._modelCurr.update(data)
+    @pyqtSlot(list)
+    def on_measureBatch(self, points):
+        # при повторах таблицы и выгрузка получают средние по ячейке, разброс -- в подсказке
+        points = self._stats.update(points)
+        if self._golden is not None:
+            points = self._golden.update(points)
+        self._store.extend(points)
+        self._modelPow.updateBatch(points)
+        self._modelCurr.updateBatch(points)
+        self._modelMetrics.updateBatch(points)
 
     @pyqtSlot()
     def on_btnMeasure_clicked(self):
@@ -103,5 +142,22 @@ class PulseWidget(QWidget):
 
     @pyqtSlot()
     def on_btnExport_clicked(self):
-        self._modelPow.export('pulse-pow')
-        self._modelCurr.export('pulse-curr')
+        file_name, _ = QFileDialog.getSaveFileName(self, 'Выгрузка точек', f'./out/pulse-{now_timestamp()}.csv', FILE_FILTER)
+        if not file_name:
+            return
+
+        # выгрузка идёт в фоне, можно сразу мерить следующий прибор;
+        # Excel -- сводные таблицы моделей, остальные форматы -- все точки из хранилища
+        if file_name.lower().endswith('.xlsx'):
+            base = file_name[:-len('.xlsx')]
+            for model, kind in ((self._modelPow, 'pow'), (self._modelCurr, 'curr'), (self._modelMetrics, 'metrics')):
+                xlsx_name, write = model.export(f'pulse-{kind}', file_name=f'{base}-{kind}.xlsx')
+                exports().submit(f'pulse {kind} xlsx', write, reveal=xlsx_name)
+            return
+
+        store = self._store.copy()
+        exports().submit(
+            'pulse points',
+            lambda progress_fn, token: export_points(store, file_name, progress_fn),
+            reveal=file_name,
+        )
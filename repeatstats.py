@@ -0,0 +1,95 @@
+import math
+
+# статистика повторных развёрток по ячейкам (f, p_ref) без хранения самих повторов:
+# среднее и дисперсия -- по Уэлфорду, устойчиво к накоплению ошибки при больших N
+#   точка несёт номер повтора 'repeat'; повторная доставка той же точки (ток из буфера после развёртки)
+#   учитывает только поля, которые в первый раз были пустыми
+
+FIELDS = ('read_pow', 'adjusted_pow', 'read_curr')
+
+
+class _Running:
+    __slots__ = ('n', 'mean', 'm2', 'lo', 'hi', 'last')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.lo = math.inf
+        self.hi = -math.inf
+        self.last = -1
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.lo = min(self.lo, value)
+        self.hi = max(self.hi, value)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class RepeatStats:
+
+    def __init__(self, fields=FIELDS):
+        self.fields = tuple(fields)
+        self._cells = dict()
+        self._points = dict()
+
+    def __len__(self):
+        return len(self._cells)
+
+    def clear(self):
+        self._cells.clear()
+        self._points.clear()
+
+    def update(self, points):
+        # возвращает точки со средними вместо значений и статистикой в '<поле>_n', '_std', '_min', '_max';
+        # модели таблиц показывают их как обычные точки
+        out = list()
+        for point in points:
+            key = (point['f'], point['p_ref'])
+            repeat = int(point.get('repeat', 0))
+
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = {name: _Running() for name in self.fields}
+
+            for name, acc in cell.items():
+                value = point.get(name)
+                if repeat <= acc.last or value is None or math.isnan(value):
+                    continue
+                acc.add(value)
+                acc.last = repeat
+
+            self._points[key] = point
+            out.append(self._aggregate(point, cell))
+        return out
+
+    def rows(self):
+        # по строке на ячейку, для сохранения рядом с сырыми точками
+        return [self._aggregate(self._points[key], cell) for key, cell in self._cells.items()]
+
+    def _aggregate(self, point, cell):
+        res = {k: v for k, v in point.items() if k != 'repeat'}
+        for name, acc in cell.items():
+            if not acc.n:
+                continue
+            res[name] = acc.mean
+            res[f'{name}_n'] = acc.n
+            res[f'{name}_std'] = acc.std
+            res[f'{name}_min'] = acc.lo
+            res[f'{name}_max'] = acc.hi
+        return res
+
+
+def stats_tip(point, name, fmt='.3f'):
+    # подсказка для ячейки таблицы; для одиночного измерения пустая
+    n = point.get(f'{name}_n', 0)
+    if n < 2:
+        return ''
+    return (f'N={n}\nσ={point[f"{name}_std"]:{fmt}}\n'
+            f'min={point[f"{name}_min"]:{fmt}}\nmax={point[f"{name}_max"]:{fmt}}')
@@ -0,0 +1,306 @@
+import argparse
+import html
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dataset import ResultDataset
+
+# отчёты по сохранённым запускам из набора результатов, без GUI и без приборов:
+#   по каждому прибору -- последний запуск, графики, показатели по частоте, HTML/PDF/XLSX,
+#   по партии -- сводная таблица; приборы обрабатываются параллельно, по процессу на ядро
+#   python reportgen.py SN1 SN2 SN3 --lot L42
+#   python reportgen.py --date-from 2026-10-19 --mode pulse --workers 4
+#   python reportgen.py --duts-file lot.txt --formats html,xlsx
+
+FORMATS = ('html', 'pdf', 'xlsx')
+
+METRIC_TITLES = {
+    'f': 'Fвх, ГГц',
+    'gain': 'Kу, дБ',
+    'pin_1db': 'Pвх 1дБ, дБм',
+    'p1db': 'P1дБ, дБм',
+    'psat': 'Pнас, дБм',
+    'de_max': 'КПД макс., %',
+    'pae_max': 'КДМ макс., %',
+}
+
+SUMMARY_TITLES = {
+    'dut': 'Прибор',
+    'mode': 'Режим',
+    'started': 'Запуск',
+    'points': 'Точек',
+    'fails': 'Вне допуска',
+    'gain_min': 'Kу мин., дБ',
+    'gain_max': 'Kу макс., дБ',
+    'flatness': 'Неравн. Kу, дБ',
+    'p1db_min': 'P1дБ мин., дБм',
+    'psat_max': 'Pнас макс., дБм',
+    'pae_max': 'КДМ макс., %',
+    'ok': 'Годен',
+}
+
+# в отчёт идут только полные запуски на живых приборах -- не прерванные, не воспроизведённые и не mock
+LAST_RUN = {'status': 'complete', 'source': 'live'}
+
+# кривых Kу(Pвх) на графике не больше, частоты берутся равномерно
+GAIN_CURVES = 8
+
+
+def generate(duts, root='dataset', out_dir='reports', lot='', formats=FORMATS, workers=None, **filters):
+    # возвращает (сводные строки, имя сводного файла); filters -- как у ResultDataset.table
+    started = time.perf_counter()
+    out_dir = os.path.join(out_dir, lot) if lot else out_dir
+    os.makedirs(out_dir, exist_ok=True)
+
+    rows = list()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(render_dut, root, dut, out_dir, formats, filters): dut for dut in duts}
+        for done, future in enumerate(as_completed(futures), start=1):
+            dut = futures[future]
+            try:
+                row = future.result()
+            except Exception as ex:
+                row = {'dut': dut, 'ok': False, 'msg': f'report error: {ex!r}'}
+            print(f'[{done}/{len(duts)}] {dut}: {row.get("msg", "done")}')
+            rows.append(row)
+
+    rows.sort(key=lambda r: r['dut'])
+    summary = _write_summary(rows, out_dir, lot, formats)
+    print(f'{len(rows)} reports in {time.perf_counter() - started:.1f} s, lot summary: {summary}')
+    return rows, summary
+
+
+def render_dut(root, dut, out_dir, formats, filters):
+    # выполняется в процессе пула: данные прибора читаются здесь же, по фильтру на разбиение dut=
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from rfmetrics import RfMetrics
+
+    df = ResultDataset(root).query(dut=dut, **{**LAST_RUN, **filters})
+    if df.empty:
+        return {'dut': dut, 'ok': False, 'msg': 'no stored runs'}
+
+    # последний запуск прибора; повторы усредняются по ячейке
+    last = df.sort_values('started')['run_id'].iloc[-1]
+    df = df[df['run_id'] == last]
+    params = json.loads(df['params'].iloc[0])
+    points = df.groupby(['f', 'p_ref'], as_index=False)[['adjusted_pow', 'read_curr']].mean()
+
+    metrics = RfMetrics(params.get('u_src', 0))
+    metrics.update(points.to_dict('records'))
+    metrics.finish()
+    table = _metrics_frame(metrics)
+
+    fails = int((~df['limit_ok']).sum())
+    gain = table[METRIC_TITLES['gain']]
+    row = {
+        'dut': dut,
+        'mode': df['mode'].iloc[0],
+        'started': str(df['started'].iloc[0]),
+        'points': len(points),
+        'fails': fails,
+        'gain_min': gain.min(),
+        'gain_max': gain.max(),
+        'flatness': metrics.smallSignalFlatness(),
+        'p1db_min': table[METRIC_TITLES['p1db']].min(),
+        'psat_max': table[METRIC_TITLES['psat']].max(),
+        'pae_max': table[METRIC_TITLES['pae_max']].max(),
+        'ok': fails == 0,
+    }
+
+    dut_dir = os.path.join(out_dir, _safe(dut))
+    os.makedirs(dut_dir, exist_ok=True)
+    figures = _figures(points, metrics)
+
+    files = list()
+    if 'html' in formats:
+        files.append(_write_html(dut_dir, dut, row, table, figures))
+    if 'pdf' in formats:
+        files.append(_write_pdf(dut_dir, dut, row, table, figures))
+    if 'xlsx' in formats:
+        files.append(_write_xlsx(dut_dir, dut, df, points, table))
+
+    row['files'] = files
+    row['msg'] = f'{len(files)} files in {dut_dir}'
+    return row
+
+
+def _metrics_frame(metrics):
+    from pandas import DataFrame
+
+    table = DataFrame(metrics.table())
+    table['f'] = (table['f'] / 1_000_000_000).round(3)
+    return table.rename(columns=METRIC_TITLES)
+
+
+def _figures(points, metrics):
+    from matplotlib.figure import Figure
+
+    pout = Figure(figsize=(8, 4.5))
+    ax = pout.add_subplot()
+    for p_ref, group in points.groupby('p_ref'):
+        ax.plot(group['f'] / 1_000_000_000, group['adjusted_pow'], marker='o', markersize=3, label=f'Pвх={p_ref:g} дБм')
+    ax.set(title='Выходная мощность', xlabel='Fвх, ГГц', ylabel='Pвых, дБм')
+    ax.grid(True)
+    ax.legend(fontsize='small')
+
+    gain = Figure(figsize=(8, 4.5))
+    ax = gain.add_subplot()
+    order = metrics.pins.argsort()
+    cols = metrics.freqs.argsort()
+    step = max(len(cols) // GAIN_CURVES, 1)
+    for col in cols[::step]:
+        ax.plot(metrics.pins[order], metrics.gain[order, col], marker='o', markersize=3, label=f'F={metrics.freqs[col] / 1_000_000_000:g} ГГц')
+    ax.set(title='Коэффициент усиления', xlabel='Pвх, дБм', ylabel='Kу, дБ')
+    ax.grid(True)
+    ax.legend(fontsize='small')
+
+    pae = Figure(figsize=(8, 4.5))
+    ax = pae.add_subplot()
+    for row in order:
+        ax.plot(metrics.freqs[cols] / 1_000_000_000, metrics.pae[row, cols], marker='o', markersize=3, label=f'Pвх={metrics.pins[row]:g} дБм')
+    ax.set(title='КДМ', xlabel='Fвх, ГГц', ylabel='КДМ, %')
+    ax.grid(True)
+    ax.legend(fontsize='small')
+
+    return [('pout', pout), ('gain', gain), ('pae', pae)]
+
+
+def _write_html(dut_dir, dut, row, table, figures):
+    images = list()
+    for name, fig in figures:
+        fig.savefig(os.path.join(dut_dir, f'{name}.png'), dpi=100)
+        images.append(f'<img src="{name}.png">')
+
+    file_name = os.path.join(dut_dir, f'{_safe(dut)}.html')
+    with open(file_name, mode='wt', encoding='utf-8') as f:
+        f.write(_HTML.format(
+            title=html.escape(f'{dut}: {row["mode"]}, {row["started"]}'),
+            summary=_summary_frame([row]).to_html(index=False, float_format='{:.2f}'.format, na_rep='-'),
+            images='\n'.join(images),
+            table=table.to_html(index=False, float_format='{:.2f}'.format, na_rep='-'),
+        ))
+    return file_name
+
+
+def _write_pdf(dut_dir, dut, row, table, figures):
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.figure import Figure
+
+    file_name = os.path.join(dut_dir, f'{_safe(dut)}.pdf')
+    with PdfPages(file_name) as pdf:
+        for _, fig in figures:
+            pdf.savefig(fig)
+
+        page = Figure(figsize=(8.27, 11.69))
+        ax = page.add_subplot()
+        ax.axis('off')
+        ax.set_title(f'{dut}: {row["mode"]}, {row["started"]}')
+        cells = table.round(2).astype(str).replace('nan', '-').values.tolist()
+        ax.table(cellText=cells, colLabels=list(table.columns), loc='upper center').auto_set_font_size(True)
+        pdf.savefig(page)
+    return file_name
+
+
+def _write_xlsx(dut_dir, dut, df, points, table):
+    from pandas import ExcelWriter
+
+    file_name = os.path.join(dut_dir, f'{_safe(dut)}.xlsx')
+    with ExcelWriter(file_name) as writer:
+        table.to_excel(writer, sheet_name='Показатели', index=False)
+        points.to_excel(writer, sheet_name='Средние', index=False)
+        df.drop(columns=['params']).to_excel(writer, sheet_name='Точки', index=False)
+    return file_name
+
+
+def _summary_frame(rows):
+    from pandas import DataFrame
+
+    return DataFrame(rows, columns=list(SUMMARY_TITLES)).rename(columns=SUMMARY_TITLES)
+
+
+def _write_summary(rows, out_dir, lot, formats):
+    summary = _summary_frame(rows)
+    name = os.path.join(out_dir, f'lot-{_safe(lot)}' if lot else 'lot')
+    passed = sum(1 for r in rows if r.get('ok'))
+
+    if 'xlsx' in formats:
+        summary.to_excel(f'{name}.xlsx', index=False)
+
+    links = ''.join(
+        f'<li><a href="{_safe(r["dut"])}/{_safe(r["dut"])}.html">{html.escape(r["dut"])}</a></li>'
+        for r in rows if 'html' in formats and r.get('files')
+    )
+    with open(f'{name}.html', mode='wt', encoding='utf-8') as f:
+        f.write(_HTML.format(
+            title=html.escape(f'Партия {lot}: годных {passed} из {len(rows)}'),
+            summary=summary.to_html(index=False, float_format='{:.2f}'.format, na_rep='-'),
+            images='',
+            table=f'<ul>{links}</ul>',
+        ))
+    return f'{name}.html'
+
+
+def _safe(value):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in f'{value}') or '_'
+
+
+_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body {{font-family: sans-serif}} table {{border-collapse: collapse}} td, th {{border: 1px solid #999; padding: 2px 6px}}</style>
+</head><body>
+<h2>{title}</h2>
+{summary}
+{images}
+{table}
+</body></html>
+"""
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Отчёты по сохранённым запускам')
+    parser.add_argument('duts', nargs='*', help='серийные номера; без них -- все приборы, подходящие под фильтры')
+    parser.add_argument('--duts-file', default='', help='файл с серийными номерами, по одному в строке')
+    parser.add_argument('--root', default='dataset', help='каталог набора результатов')
+    parser.add_argument('--out', default='reports', help='каталог отчётов')
+    parser.add_argument('--lot', default='', help='номер партии, отчёты кладутся в подкаталог')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='html, pdf, xlsx через запятую')
+    parser.add_argument('--workers', type=int, default=0, help='число процессов, по умолчанию -- по числу ядер')
+    parser.add_argument('--mode', default=None, help='continuous или pulse')
+    parser.add_argument('--station', default=None, help='стенд')
+    parser.add_argument('--date-from', default=None, help='YYYY-MM-DD')
+    parser.add_argument('--date-to', default=None, help='YYYY-MM-DD')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    filters = {k: v for k, v in {
+        'mode': args.mode,
+        'station': args.station,
+        'date_from': args.date_from,
+        'date_to': args.date_to,
+    }.items() if v is not None}
+
+    duts = list(args.duts)
+    if args.duts_file:
+        with open(args.duts_file, mode='rt', encoding='utf-8') as f:
+            duts += [line.strip() for line in f if line.strip()]
+    if not duts:
+        duts = sorted(ResultDataset(args.root).runs(**{**LAST_RUN, **filters})['dut'].unique())
+    if not duts:
+        print(f'no runs in {args.root}')
+        sys.exit(1)
+
+    formats = tuple(f.strip() for f in args.formats.split(',') if f.strip())
+    rows, _ = generate(duts, args.root, args.out, args.lot, formats, args.workers or None, **filters)
+    sys.exit(0 if all(r.get('ok') for r in rows) else 1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
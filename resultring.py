@@ -0,0 +1,105 @@
+import math
+import struct
+
+from multiprocessing import shared_memory
+
+# кольцо точек в разделяемой памяти: один писатель (процесс измерений), один читатель (GUI);
+# писатель должен быть запущен создателем кольца -- тогда у них общий resource_tracker и память удаляется один раз
+# заголовок -- номер следующей записи; запись -- её номер, маска заполненных полей и значения
+FIELDS = ('f', 'p', 'read_pow', 'adjusted_pow', 'p_ref', 'read_curr', 'delta', 'limit_ok', 'repeat')
+
+_HEADER = struct.Struct('<Q')
+_RECORD = struct.Struct(f'<QH6x{len(FIELDS)}d')
+
+CAPACITY = 4096
+
+
+class ResultRing:
+    # номер записи кладётся и в саму запись: если писатель успел её перезаписать, читатель это увидит
+
+    def __init__(self, name=None, capacity=CAPACITY, create=False):
+        self.capacity = capacity
+        size = _HEADER.size + capacity * _RECORD.size
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._owner = create
+        self._buf = self._shm.buf
+        self._read = self.written if not create else 0
+        self.lost = 0
+
+        if create:
+            _HEADER.pack_into(self._buf, 0, 0)
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.name}, {self.written}/{self.capacity})'
+
+    @classmethod
+    def create(cls, capacity=CAPACITY):
+        return cls(capacity=capacity, create=True)
+
+    @classmethod
+    def attach(cls, name, capacity=CAPACITY):
+        return cls(name=name, capacity=capacity)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def written(self):
+        return _HEADER.unpack_from(self._buf, 0)[0]
+
+    def push(self, point):
+        index = self.written
+        mask = 0
+        values = list()
+        for bit, key in enumerate(FIELDS):
+            value = point.get(key)
+            if value is None:
+                values.append(math.nan)
+                continue
+            mask |= 1 << bit
+            values.append(float(value))
+
+        _RECORD.pack_into(self._buf, self._offset(index), index, mask, *values)
+        # номер обновляется после записи, читатель не увидит недописанную точку
+        _HEADER.pack_into(self._buf, 0, index + 1)
+
+    def read(self):
+        written = self.written
+        if written - self._read > self.capacity:
+            self.lost += written - self._read - self.capacity
+            self._read = written - self.capacity
+
+        points = list()
+        while self._read < written:
+            offset = self._offset(self._read)
+            index, mask, *values = _RECORD.unpack_from(self._buf, offset)
+            # после копирования: номер в записи не сменился и писатель не дошёл до этой ячейки на новом круге,
+            # иначе запись могла быть перезаписана во время копирования
+            torn = _HEADER.unpack_from(self._buf, offset)[0] != index or self.written >= self._read + self.capacity
+            if index != self._read or torn:
+                # точку уже не восстановить -- отбрасываем и догоняем писателя
+                self.lost += 1
+                self._read += 1
+                continue
+            self._read += 1
+            points.append(_point(mask, values))
+        return points
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _offset(self, index):
+        return _HEADER.size + (index % self.capacity) * _RECORD.size
+
+
+def _point(mask, values):
+    point = {key: value for bit, (key, value) in enumerate(zip(FIELDS, values)) if mask & (1 << bit)}
+    if 'limit_ok' in point:
+        point['limit_ok'] = bool(point['limit_ok'])
+    if 'repeat' in point:
+        point['repeat'] = int(point['repeat'])
+    return point
@@ -0,0 +1,62 @@
+import math
+
+from array import array
+
+# все точки измерения в типизированных столбцах, в порядке прихода
+COLUMNS = ('f', 'p', 'p_ref', 'read_pow', 'adjusted_pow', 'read_curr')
+
+
+class PointStore:
+    # точка с теми же (f, p, p_ref) заменяет прежнюю: буфер тока дописывает ток в уже пришедшие точки
+
+    def __init__(self, columns=COLUMNS):
+        self.names = tuple(columns)
+        self._columns = {name: array('d') for name in self.names}
+        self._index = dict()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return bool(self._index)
+
+    def clear(self):
+        for column in self._columns.values():
+            del column[:]
+        self._index.clear()
+
+    def append(self, point):
+        values = [_value(point.get(name)) for name in self.names]
+        key = (point.get('f'), point.get('p'), point.get('p_ref'))
+
+        row = self._index.get(key)
+        if row is None:
+            self._index[key] = len(self._index)
+            for column, value in zip(self._columns.values(), values):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns.values(), values):
+                column[row] = value
+
+    def extend(self, points):
+        for point in points:
+            self.append(point)
+
+    def copy(self):
+        # снимок для фоновой выгрузки, пока в исходное хранилище продолжают приходить точки
+        store = PointStore(self.names)
+        store._columns = {name: array('d', column) for name, column in self._columns.items()}
+        store._index = dict(self._index)
+        return store
+
+    def column(self, name):
+        return self._columns[name]
+
+    def columns(self):
+        return dict(self._columns)
+
+
+def _value(value):
+    if value is None:
+        return math.nan
+    return float(value)
@@ -0,0 +1,170 @@
+import numpy as np
+
+# показатели усилителя по сетке (p_ref, f), которую дают _measure/_measurePulse:
+#   Kу = Pвых - Pвх, Pвх = p_ref (вход откалиброван), Pвых = adjusted_pow
+#   P1дБ -- выходная мощность, при которой Kу упал на 1 дБ от малосигнального (Kу на наименьшей Pвх),
+#     между соседними уровнями Pвх -- линейная интерполяция
+#   Pнас -- наибольшая Pвых на частоте
+#   КПД = Pвых / Pпотр, КДМ = (Pвых - Pвх) / Pпотр, Pпотр = Uп * read_curr, мощности в Вт
+#   неравномерность -- размах Kу по частоте на одном уровне Pвх
+# строка сетки (все частоты одного уровня Pвх) считается, когда развёртка ушла на следующий уровень;
+# ток из буфера приходит после развёртки и пересчитывает уже готовые строки
+
+COMPRESSION = 1.0
+
+COLUMNS = ('f', 'gain', 'pin_1db', 'p1db', 'psat', 'de_max', 'pae_max')
+
+
+class RfMetrics:
+
+    def __init__(self, u_src=0.0):
+        self.u_src = u_src
+        self.clear()
+
+    def clear(self):
+        self.pins = np.empty(0)
+        self.freqs = np.empty(0)
+        self._rows = dict()
+        self._cols = dict()
+
+        # сетки [строка Pвх, столбец f], строки и столбцы -- в порядке прихода
+        self.pout = np.empty((0, 0))
+        self.curr = np.empty((0, 0))
+        self.gain = np.empty((0, 0))
+        self.de = np.empty((0, 0))
+        self.pae = np.empty((0, 0))
+        self.flatness = np.empty(0)
+
+        # по частотам
+        self.gain0 = np.empty(0)
+        self.pin1db = np.empty(0)
+        self.p1db = np.empty(0)
+        self.psat = np.empty(0)
+        self.deMax = np.empty(0)
+        self.paeMax = np.empty(0)
+
+        self._dirty = set()
+        self._current = None
+
+    def __len__(self):
+        return len(self._cols)
+
+    def update(self, points):
+        # возвращает True, если пересчитана хотя бы одна строка
+        for point in points:
+            row, col = self._cell(point['p_ref'], point['f'])
+            self.pout[row, col] = _value(point.get('adjusted_pow'))
+            self.curr[row, col] = _value(point.get('read_curr'))
+            self._dirty.add(row)
+            self._current = row
+
+        ready = self._dirty - {self._current}
+        if not ready:
+            return False
+        self._recompute(ready)
+        return True
+
+    def finish(self):
+        if not self._dirty:
+            return False
+        self._recompute(set(self._dirty))
+        return True
+
+    def table(self):
+        # {столбец: массив} по возрастанию частоты
+        order = np.argsort(self.freqs)
+        return dict(zip(COLUMNS, (
+            self.freqs[order],
+            self.gain0[order],
+            self.pin1db[order],
+            self.p1db[order],
+            self.psat[order],
+            self.deMax[order],
+            self.paeMax[order],
+        )))
+
+    def flatnessByLevel(self):
+        # (Pвх, неравномерность Kу) по возрастанию Pвх
+        order = np.argsort(self.pins)
+        return self.pins[order], self.flatness[order]
+
+    def smallSignalFlatness(self):
+        if not len(self.pins):
+            return np.nan
+        return self.flatness[np.argmin(self.pins)]
+
+    def _cell(self, p_ref, f):
+        row = self._rows.get(p_ref)
+        if row is None:
+            row = self._rows[p_ref] = len(self._rows)
+            self.pins = np.append(self.pins, float(p_ref))
+            self.flatness = np.append(self.flatness, np.nan)
+            for name in ('pout', 'curr', 'gain', 'de', 'pae'):
+                grid = getattr(self, name)
+                setattr(self, name, np.vstack([grid, np.full((1, grid.shape[1]), np.nan)]))
+
+        col = self._cols.get(f)
+        if col is None:
+            col = self._cols[f] = len(self._cols)
+            self.freqs = np.append(self.freqs, float(f))
+            for name in ('pout', 'curr', 'gain', 'de', 'pae'):
+                grid = getattr(self, name)
+                setattr(self, name, np.hstack([grid, np.full((grid.shape[0], 1), np.nan)]))
+        return row, col
+
+    def _recompute(self, rows):
+        rows = np.fromiter(rows, dtype=np.intp)
+        self._dirty.difference_update(rows.tolist())
+
+        pin = self.pins[rows, np.newaxis]
+        pout = self.pout[rows]
+        pdc = self.u_src * self.curr[rows]
+        pout_w = _watts(pout)
+        pin_w = _watts(pin)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = pout - pin
+            self.gain[rows] = gain
+            self.de[rows] = np.where(pdc > 0, pout_w / pdc * 100, np.nan)
+            self.pae[rows] = np.where(pdc > 0, (pout_w - pin_w) / pdc * 100, np.nan)
+        self.flatness[rows] = np.fmax.reduce(gain, axis=1) - np.fmin.reduce(gain, axis=1)
+
+        self._recomputeColumns()
+
+    def _recomputeColumns(self):
+        # по частотам -- всегда вся сетка: уровней Pвх единицы-десятки, это дешевле, чем следить за порядком прихода
+        order = np.argsort(self.pins)
+        pins = self.pins[order]
+        gain = self.gain[order]
+        cols = np.arange(gain.shape[1])
+
+        gain0 = gain[0]
+        target = gain0 - COMPRESSION
+        with np.errstate(invalid='ignore'):
+            compressed = gain <= target
+        first = np.argmax(compressed, axis=0)
+        found = compressed[first, cols] & (first > 0)
+
+        prev = np.maximum(first - 1, 0)
+        g0 = gain[prev, cols]
+        g1 = gain[first, cols]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(found, (g0 - target) / (g0 - g1), np.nan)
+        pin1db = pins[prev] + t * (pins[first] - pins[prev])
+
+        self.gain0 = gain0
+        self.pin1db = np.where(found, pin1db, np.nan)
+        self.p1db = self.pin1db + target
+        self.psat = np.fmax.reduce(self.pout, axis=0)
+        self.deMax = np.fmax.reduce(self.de, axis=0)
+        self.paeMax = np.fmax.reduce(self.pae, axis=0)
+
+
+def _watts(dbm):
+    return np.power(10.0, (dbm - 30) / 10)
+
+
+def _value(value):
+    if value is None:
+        return np.nan
+    return float(value)
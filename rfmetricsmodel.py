@@ -0,0 +1,111 @@
+import datetime
+import math
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant
+
+from exporters import export_excel
+from instr.const import GIGA
+from tracing import traced
+
+
+class RfMetricsModel(QAbstractTableModel):
+    # строка -- частота, столбцы -- показатели из RfMetrics; неравномерность Kу -- в заголовке столбца Kу
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # RfMetrics держит сетки numpy, создаётся с первым измерением, а не при открытии окна
+        self._metrics = None
+        self._rows = list()
+        self._header = ['Fвх, ГГц', 'Kу, дБ', 'Pвх 1дБ, дБм', 'P1дБ, дБм', 'Pнас, дБм', 'КПД макс., %', 'КДМ макс., %']
+
+    def clear(self, u_src=None):
+        self.beginResetModel()
+        metrics = self._grid()
+        if u_src is not None:
+            metrics.u_src = u_src
+        metrics.clear()
+        self._rows = list()
+        self.endResetModel()
+
+    def update(self, point: dict):
+        self.updateBatch([point])
+
+    @traced('model update', 'gui', args=lambda self, points: {'model': self.__class__.__name__, 'points': len(points)})
+    def updateBatch(self, points: list):
+        if self._grid().update(points):
+            self._refresh()
+
+    def finish(self):
+        if self._metrics is not None and self._metrics.finish():
+            self._refresh()
+
+    def _grid(self):
+        if self._metrics is None:
+            from rfmetrics import RfMetrics
+            self._metrics = RfMetrics()
+        return self._metrics
+
+    def _refresh(self):
+        self.beginResetModel()
+        table = self._metrics.table()
+        self._rows = list(zip(*(table[name].tolist() for name in table)))
+        self.endResetModel()
+
+    def headerData(self, section, orientation, role=None):
+        if orientation == Qt.Horizontal:
+            if role == Qt.DisplayRole:
+                if section == 1 and self._metrics is not None:
+                    flatness = self._metrics.smallSignalFlatness()
+                    if not math.isnan(flatness):
+                        return QVariant(f'{self._header[1]} (±{flatness / 2:.2f})')
+                if section < len(self._header):
+                    return QVariant(self._header[section])
+        return QVariant()
+
+    def rowCount(self, parent=None, *args, **kwargs):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=None, *args, **kwargs):
+        return len(self._header)
+
+    def data(self, index, role=None):
+        if not index.isValid():
+            return QVariant()
+        row = index.row()
+        col = index.column()
+        if role == Qt.DisplayRole:
+            value = self._rows[row][col]
+            if col == 0:
+                return QVariant(round(value / GIGA, 3))
+            if math.isnan(value):
+                return QVariant('-')
+            return QVariant(round(value, 2))
+
+        return QVariant()
+
+    def is_ready(self):
+        return bool(self._rows)
+
+    def export(self, suffix='', file_name=''):
+        # как у моделей таблиц: данные копируются в потоке GUI, запись -- в write(progress_fn, token)
+        device = f'{suffix}' if suffix else ''
+        path = 'xlsx'
+        file_name = file_name or f'./{path}/{device}-{datetime.datetime.now().isoformat().replace(":", ".")}.xlsx'
+
+        header = list(self._header)
+        rows = [(round(r[0] / GIGA, 3), *r[1:]) for r in self._rows]
+        pins, flatness = (v.tolist() for v in self._grid().flatnessByLevel())
+
+        @traced('export', 'io', args=lambda *_: {'file': file_name})
+        def write(progress_fn=None, token=None):
+            from pandas import DataFrame
+
+            return export_excel(file_name, {
+                'По частоте': DataFrame(rows, columns=header),
+                'По мощности': DataFrame({'Pвх, дБм': pins, 'Неравномерность Kу, дБ': flatness}),
+            }, progress_fn, token)
+
+        return file_name, write
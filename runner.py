@@ -0,0 +1,256 @@
+import argparse
+import os
+import signal
+import sys
+import time
+
+from collections import defaultdict
+
+from forgot_again.file import load_ast_if_exists, make_dirs
+from forgot_again.string import now_timestamp
+
+from caldata import add_cal_point, cal_points, load_cal_data, save_cal_data, make_task
+from cancellation import CancelEvent
+from currentbuffer import FinalPoints
+from instrumentcontroller import InstrumentController
+from measureserver import dumps
+from tracing import traced
+
+# консольный запуск без GUI: PyQt, pyqtgraph и openpyxl здесь не импортируются
+#   python runner.py calibrate-in --cal-in default_cal_in.txt
+#   python runner.py calibrate-out --cal-in default_cal_in.txt --cal-out default_cal_out.txt
+#   python runner.py continuous --dut SN123
+#   python runner.py pulse --dut SN123 --out out/SN123-pulse.jsonl
+#   python runner.py continuous --dut SN123 --connect 127.0.0.1:5055
+#   python runner.py continuous --record session.jsonl
+#   python runner.py continuous --replay session.jsonl
+#   python runner.py continuous --trace trace.json
+#   python runner.py pulse --dut SN123 --golden golden.ini
+
+MODES = ['calibrate-in', 'calibrate-out', 'continuous', 'pulse']
+
+
+class PointWriter:
+    # одна точка -- одна строка JSON, файл сбрасывается на диск после каждой точки;
+    # при буфере тока точка пишется один раз, уже с током (currentbuffer.FinalPoints)
+
+    def __init__(self, file_name, extra=None, buffered=False):
+        self._file = open(file_name, mode='wt', encoding='utf-8')
+        self._extra = extra or dict()
+        self._points = FinalPoints(self._write, buffered)
+        self.count = 0
+
+    def __call__(self, point):
+        self._points(point)
+
+    @traced('write point', 'io')
+    def _write(self, point):
+        self._file.write(dumps({**point, **self._extra}) + '\n')
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        self._points.flush()
+        self._file.close()
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Измерение выходной мощности без GUI')
+    parser.add_argument('mode', choices=MODES)
+    parser.add_argument('--instr', default='instr.ini', help='адреса приборов')
+    parser.add_argument('--params', default='params.ini', help='параметры измерения')
+    parser.add_argument('--cal-in', default='default_cal_in.txt', help='калибровка по входу')
+    parser.add_argument('--cal-out', default='default_cal_out.txt', help='калибровка по выходу')
+    parser.add_argument('--dut', default='', help='серийный номер прибора')
+    parser.add_argument('--out', default='', help='файл результатов, по умолчанию out/<dut>-<mode>-<время>.jsonl')
+    parser.add_argument('--connect', default='', help='адрес сервера измерений host:port, приборы не открываются')
+    parser.add_argument('--record', default='', help='записать обмен с приборами в журнал')
+    parser.add_argument('--replay', default='', help='воспроизвести журнал вместо приборов')
+    parser.add_argument('--replay-timing', action='store_true', help='воспроизводить с записанными задержками')
+    parser.add_argument('--trace', default='', help='записать таймлайн запуска (Chrome trace JSON)')
+    parser.add_argument('--golden', default='', help='сравнивать с эталоном, настройки как в golden.ini')
+    return parser.parse_args(args)
+
+
+def run_job(controller, mode, token, params, report_fn, cal_in_file, cal_out_file, dut='', task=None, cal_data=None):
+    # общий для консольного запуска и сервера измерений: калибровки пишутся в файлы, измерения берут их оттуда;
+    # task и cal_data -- готовые задание и калибровка по входу от клиента (GUI), тогда файлы не читаются
+    if mode == 'calibrate-in':
+        cal = defaultdict(dict)
+        res = controller.calibrateIn(
+            report_fn=lambda point: (report_fn(point), add_cal_point(cal, point)),
+            token=token,
+            params=params,
+        )
+        if res[0]:
+            save_cal_data(cal_in_file, cal)
+        return res
+
+    if task is not None and mode in ('continuous', 'pulse'):
+        measure = controller.measurePulse if mode == 'pulse' else controller.measure
+        return measure(report_fn=report_fn, token=token, params=params, task=task, dut=dut)
+
+    cal_in = cal_data or cal_points(load_cal_data(cal_in_file))
+    if not cal_in:
+        return False, f'no input calibration in {cal_in_file}'
+
+    if mode == 'calibrate-out':
+        cal = defaultdict(dict)
+        res = controller.calibrateOut(
+            report_fn=lambda point: (report_fn(point), add_cal_point(cal, point)),
+            token=token,
+            params=params,
+            cal_data=cal_in,
+        )
+        if res[0]:
+            save_cal_data(cal_out_file, cal)
+        return res
+
+    cal_out = cal_points(load_cal_data(cal_out_file))
+    if not cal_out:
+        return False, f'no output calibration in {cal_out_file}'
+
+    measure = controller.measurePulse if mode == 'pulse' else controller.measure
+    return measure(
+        report_fn=report_fn,
+        token=token,
+        params=params,
+        task=make_task(cal_in, cal_out),
+        dut=dut,
+    )
+
+
+def run(args):
+    controller = InstrumentController()
+    controller.secondaryParams.file_name = args.params
+    controller.secondaryParams.load_from_config()
+    params = controller.secondaryParams.params
+
+    log = None
+    replay = None
+    if args.replay:
+        from scpirecord import replay_instruments
+
+        # параметры берутся из журнала, иначе команды разойдутся с записью
+        header, replay = replay_instruments(args.replay, controller.requiredInstruments.keys(), timing=args.replay_timing)
+        params = header['meta'].get('params', params)
+        controller._instruments = replay
+    else:
+        addrs = load_ast_if_exists(args.instr, default={k: v.addr for k, v in controller.requiredInstruments.items()})
+        ok, msg = controller.connect(addrs=addrs)
+        if not ok:
+            return False, msg
+
+        if args.record:
+            from scpirecord import SessionLog, recording_instruments
+
+            log = SessionLog(args.record, meta={'mode': args.mode, 'params': params})
+            controller._instruments = recording_instruments(controller._instruments, log)
+
+    token = CancelEvent()
+    signal.signal(signal.SIGINT, lambda *_: setattr(token, 'cancelled', True))
+
+    out = _out_file(args)
+    writer = PointWriter(out, extra={'dut': args.dut} if args.dut else None, buffered=bool(int(params.get('curr_buf', 0))))
+    report_fn = writer
+
+    golden = None
+    rows = None
+    if args.golden:
+        from goldencompare import GoldenCompare, GoldenRows
+
+        # отклонения от эталона пишутся в каждую точку, итог -- в конце; сравнение -- по строке p_ref
+        golden = GoldenCompare.from_config(args.golden, controller.dataset)
+        if golden is not None:
+            report_fn = rows = GoldenRows(golden, writer)
+
+    started = time.perf_counter()
+    try:
+        ok, msg = run_job(controller, args.mode, token, params, report_fn, args.cal_in, args.cal_out, dut=args.dut)
+    finally:
+        if rows is not None:
+            rows.flush()
+        writer.close()
+        print(f'{writer.count} points written to {out} in {time.perf_counter() - started:.3f} s')
+        if golden is not None:
+            print(golden.summary())
+        if log is not None:
+            log.close()
+            print(f'{log.count} instrument calls recorded to {args.record}')
+
+    if replay is not None:
+        from scpirecord import replay_report
+
+        replay_ok, replay_msg = replay_report(replay)
+        print(replay_msg)
+        return ok and replay_ok, msg if replay_ok else f'{msg}, {replay_msg}'
+    return ok, msg
+
+
+def run_remote(args):
+    from measureserver import MeasureClient
+
+    client = MeasureClient.from_address(args.connect)
+
+    try:
+        events = client.subscribe()
+    except OSError as ex:
+        return False, f'measure server {args.connect} unavailable: {ex}'
+
+    # калибровки сервер читает сам, пути передаются абсолютными
+    reply = client.submit(
+        args.mode,
+        params=load_ast_if_exists(args.params, default=None),
+        cal_in=os.path.abspath(args.cal_in),
+        cal_out=os.path.abspath(args.cal_out),
+        dut=args.dut,
+    )
+    if not reply['ok']:
+        events.close()
+        return False, reply['msg']
+    job = reply['job']
+    print(f'submitted job {job} to {client}')
+
+    signal.signal(signal.SIGINT, lambda *_: client.cancel(job))
+
+    # сервер отдаёт каждую точку один раз, уже с током
+    out = _out_file(args)
+    writer = PointWriter(out, extra={'dut': args.dut} if args.dut else None)
+
+    try:
+        for event in events:
+            if event.get('job') != job:
+                continue
+            if event['event'] == 'point':
+                writer(event['point'])
+            elif event['event'] == 'finished':
+                if event.get('dropped'):
+                    print(f'{event["dropped"]} events dropped by server')
+                return event['ok'], event['msg']
+        return False, 'measure server closed connection'
+    finally:
+        events.close()
+        writer.close()
+        print(f'{writer.count} points written to {out}')
+
+
+def _out_file(args):
+    if args.out:
+        return args.out
+    make_dirs('out')
+    return f'./out/{args.dut or "dut"}-{args.mode}-{now_timestamp()}.jsonl'
+
+
+def main(args):
+    args = parse_args(args)
+    if args.trace:
+        import tracing
+        tracing.start(args.trace)
+
+    ok, msg = run_remote(args) if args.connect else run(args)
+    print(msg)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+
+# запись обмена с приборами и воспроизведение без железа
+# журнал -- строки JSON: первая -- заголовок {"session": ..., "meta": {...}}, дальше по строке на вызов
+#   {"t": 0.0123, "i": "Генератор", "s": "FREQ 3000000000", "d": 0.0004}
+#   {"t": 0.0131, "i": "Изм. мощности", "q": "FETCH?", "r": "-3.93\n", "d": 0.512}
+# t -- от начала сеанса, d -- длительность вызова, e -- исключение вместо ответа
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+class SessionLog:
+    def __init__(self, file_name, meta=None):
+        self.file_name = file_name
+        self._file = open(file_name, mode='wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.count = 0
+
+        self._write({'session': time.strftime('%Y-%m-%d %H:%M:%S'), 'meta': meta or dict()})
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.file_name}, {self.count})'
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def record(self, event):
+        with self._lock:
+            self._write(event)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _write(self, event):
+        self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+
+class RecordingInstrument:
+    # обёртка над сессией прибора: всё, что уходит и приходит, пишется в журнал
+
+    def __init__(self, name, inst, log):
+        self.name = name
+        self._inst = inst
+        self._log = log
+
+    def __getattr__(self, item):
+        return getattr(self._inst, item)
+
+    def __str__(self):
+        return f'Recording({self._inst})'
+
+    def send(self, cmd):
+        return self._call('s', cmd, self._inst.send)
+
+    def query(self, question):
+        return self._call('q', question, self._inst.query)
+
+    def _call(self, op, cmd, fn):
+        event = {'t': round(self._log.elapsed(), 6), 'i': self.name, op: cmd}
+        started = time.perf_counter()
+        try:
+            res = fn(cmd)
+        except Exception as ex:
+            event['e'] = f'{ex.__class__.__name__}: {ex}'
+            raise
+        else:
+            if op == 'q':
+                event['r'] = res
+            return res
+        finally:
+            event['d'] = round(time.perf_counter() - started, 6)
+            self._log.record(event)
+
+
+class ReplayInstrument:
+    # отдаёт записанные ответы по порядку; расхождение команд копится в mismatches,
+    # в строгом режиме -- сразу исключение
+
+    def __init__(self, name, events, timing=False, strict=False):
+        self.name = name
+        self.addr = f'REPLAY::{name}'
+        self.status = 'replay'
+
+        self._events = events
+        self._pos = 0
+        self._timing = timing
+        self._strict = strict
+
+        self.mismatches = list()
+
+    def __str__(self):
+        return f'Replay({self.name}, {self._pos}/{len(self._events)})'
+
+    @property
+    def remaining(self):
+        return len(self._events) - self._pos
+
+    def send(self, cmd):
+        self._next('s', cmd)
+
+    def query(self, question):
+        return self._next('q', question).get('r', '')
+
+    def _next(self, op, cmd):
+        if self._pos >= len(self._events):
+            self._mismatch(f'{self.name}: unexpected {cmd!r} after end of session')
+            return dict()
+
+        event = self._events[self._pos]
+        self._pos += 1
+
+        expected = event.get(op)
+        if expected != cmd:
+            recorded = event.get('s', event.get('q'))
+            self._mismatch(f'{self.name} #{self._pos}: expected {recorded!r}, got {cmd!r}')
+
+        if self._timing:
+            time.sleep(event.get('d', 0))
+
+        if 'e' in event:
+            # таймаут прибора воспроизводится как таймаут, остальное -- как ошибка VISA
+            if event['e'].startswith('TimeoutError'):
+                raise TimeoutError(event['e'])
+            raise RuntimeError(event['e'])
+        return event
+
+    def _mismatch(self, msg):
+        self.mismatches.append(msg)
+        if self._strict:
+            raise ReplayMismatch(msg)
+
+
+def load_session(file_name):
+    # возвращает заголовок и вызовы, разложенные по приборам
+    with open(file_name, mode='rt', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or 'session' not in lines[0]:
+        raise ValueError(f'{file_name} is not a session log')
+
+    calls = dict()
+    for event in lines[1:]:
+        calls.setdefault(event['i'], list()).append(event)
+    return lines[0], calls
+
+
+def recording_instruments(instruments, log):
+    return {name: RecordingInstrument(name, inst, log) for name, inst in instruments.items()}
+
+
+def replay_instruments(file_name, names, timing=False, strict=False):
+    header, calls = load_session(file_name)
+    return header, {name: ReplayInstrument(name, calls.get(name, list()), timing=timing, strict=strict) for name in names}
+
+
+def replay_report(instruments):
+    # (ok, msg): сеанс воспроизведён полностью и без расхождений
+    mismatches = [m for inst in instruments.values() for m in inst.mismatches]
+    remaining = {inst.name: inst.remaining for inst in instruments.values() if inst.remaining}
+    if mismatches:
+        return False, f'replay diverged: {len(mismatches)} mismatches, first: {mismatches[0]}'
+    if remaining:
+        return False, f'replay incomplete, calls left: {remaining}'
+    return True, 'replay matched'
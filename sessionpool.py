@@ -0,0 +1,163 @@
+import os
+import re
+import sys
+import tempfile
+import time
+
+import tracing
+
+from cancellation import CancelEvent, Cancelled, query, forget, stale
+from instr.instrumentfactory import mock_enabled
+
+PROBE = '*IDN?'
+PROBE_TIMEOUT = 1
+
+
+class SessionPool:
+    # сессии VISA живут между заданиями; перед заданием каждый прибор опрашивается коротким *IDN?,
+    # переоткрывается только тот, кто не ответил
+
+    def __init__(self, factories, probe=PROBE, timeout=PROBE_TIMEOUT):
+        self._factories = factories
+        self._probe = probe
+        self._timeout = timeout
+        self._addrs = dict()
+        self._locks = dict()
+
+        self.instruments = dict()
+        self.lastCheck = dict()
+        # {имя: pid} приборов, которые держит другой процесс
+        self.busy = dict()
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.instruments})'
+
+    def adopt(self, instruments):
+        # готовые сессии или имитаторы вместо найденных фабриками
+        for inst in self.instruments.values():
+            if inst not in instruments.values():
+                forget(inst)
+        self.instruments.clear()
+        self.instruments.update({name: tracing.instrument(name, inst) for name, inst in instruments.items()})
+        self._addrs = {name: getattr(inst, 'addr', None) for name, inst in instruments.items()}
+
+    def connect(self, names=None):
+        # возвращает имена приборов, которые пришлось открыть заново;
+        # прибор, открытый другим процессом (GUI, консольный запуск, сервер измерений), не открывается и попадает в busy
+        opened = list()
+        self.busy = dict()
+        for name in names or self._factories.keys():
+            factory = self._factories[name]
+            inst = self.instruments.get(name)
+            if inst and self._addrs.get(name) == factory.addr:
+                continue
+            self._close(name)
+            if not mock_enabled:
+                lock = SessionLock(factory.addr)
+                if not lock.acquire():
+                    self.busy[name] = lock.owner()
+                    continue
+                self._locks[name] = lock
+            self.instruments[name] = tracing.instrument(name, factory.find())
+            self._addrs[name] = factory.addr
+            opened.append(name)
+        return opened
+
+    def check(self):
+        # возвращает (переоткрытые, так и не ответившие);
+        # сессия, которую не удалось очистить после брошенного запроса, тоже переоткрывается
+        dead = [name for name, inst in self.instruments.items() if not self._alive(name, inst) or stale(inst)]
+        if not dead:
+            return [], []
+
+        print(f'sessions lost: {dead}, reconnecting')
+        for name in dead:
+            self._addrs.pop(name, None)
+        self.connect(dead)
+
+        failed = [name for name in dead if not self._alive(name, self.instruments.get(name))]
+        return [name for name in dead if name not in failed], failed
+
+    def close(self):
+        for name in list(self.instruments.keys()):
+            self._close(name)
+
+    def _alive(self, name, inst):
+        if not inst:
+            return False
+        started = time.perf_counter()
+        try:
+            query(inst, self._probe, CancelEvent(), timeout=self._timeout)
+        except (Cancelled, TimeoutError) as ex:
+            print(f'{name} probe failed: {ex}')
+            return False
+        except Exception as ex:
+            print(f'{name} probe failed: {ex!r}')
+            return False
+        self.lastCheck[name] = time.perf_counter() - started
+        return True
+
+    def _close(self, name):
+        lock = self._locks.pop(name, None)
+        if lock is not None:
+            lock.release()
+        inst = self.instruments.pop(name, None)
+        if not inst:
+            return
+        forget(inst)
+        close = getattr(inst, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as ex:
+                print(f'{name} close error: {ex!r}')
+
+
+class SessionLock:
+    # адрес VISA открывает только один процесс; блокировку файла система снимает при выходе процесса,
+    # поэтому упавший процесс прибор не держит
+
+    def __init__(self, addr):
+        self.addr = addr
+        name = re.sub(r'[^\w.-]', '_', f'{addr}')
+        self.file_name = os.path.join(tempfile.gettempdir(), f'visa-{name}.lock')
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        f = open(self.file_name, mode='a+', encoding='utf-8')
+        try:
+            _lock_file(f)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f'{os.getpid()}')
+        f.flush()
+        self._file = f
+        return True
+
+    def owner(self):
+        try:
+            with open(self.file_name, mode='rt', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def release(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+
+
+def _lock_file(f):
+    if sys.platform == 'win32':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -0,0 +1,133 @@
+import random
+import time
+
+
+class SimulatedSupply:
+    # источник питания без железа: MEAS:CURR? и буфер показаний TRAC:*
+
+    def __init__(self, addr='SIM::SUPPLY', curr=2.2, noise=0.02, seed=None):
+        self.addr = addr
+        self.status = 'simulated'
+
+        self._curr = curr
+        self._noise = noise
+        self._random = random.Random(seed)
+
+        self._capacity = 0
+        self._source = 'IMM'
+        self._armed = False
+        self._buffer = list()
+
+        self.log = list()
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.addr})'
+
+    def _reading(self):
+        return self._curr + self._random.gauss(0, self._noise)
+
+    def _store(self):
+        if self._armed and len(self._buffer) < self._capacity:
+            self._buffer.append(self._reading())
+        self._armed = False
+
+    def send(self, cmd):
+        self.log.append(cmd)
+        header, _, arg = cmd.strip().partition(' ')
+        header = header.upper()
+
+        if header == '*RST':
+            self._capacity = 0
+            self._source = 'IMM'
+            self._armed = False
+            self._buffer.clear()
+        elif header == 'TRAC:CLE':
+            self._buffer.clear()
+        elif header == 'TRAC:POIN':
+            self._capacity = int(float(arg))
+        elif header == 'TRIG:SOUR':
+            self._source = arg.upper()
+        elif header == 'INIT':
+            self._armed = True
+            # внешний запуск приходит от импульса сразу после взвода
+            if self._source in ('IMM', 'EXT'):
+                self._store()
+        elif header == '*TRG':
+            if self._source == 'BUS':
+                self._store()
+
+    def query(self, question):
+        self.log.append(question)
+        header = question.strip().upper()
+
+        if header == '*IDN?':
+            return 'SIMULATED,SUPPLY,0,0\n'
+        if header == '*OPC?':
+            return '1\n'
+        if header == 'MEAS:CURR?':
+            return f'{self._reading()}\n'
+        if header == 'TRAC:DATA?':
+            return ','.join(f'{v}' for v in self._buffer) + '\n'
+        return '\n'
+
+
+class SimulatedGenerator:
+    # генератор без железа: запоминает момент снятия ВЧ, чтобы мерить задержку отмены
+
+    def __init__(self, addr='SIM::GEN'):
+        self.addr = addr
+        self.status = 'simulated'
+
+        self.output = False
+        self.offAt = None
+
+        self.log = list()
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.addr})'
+
+    def send(self, cmd):
+        self.log.append(cmd)
+        header, _, arg = cmd.strip().partition(' ')
+        if header.upper() == 'OUTP':
+            self.output = arg.upper() in ('ON', '1')
+            if not self.output:
+                self.offAt = time.perf_counter()
+
+    def query(self, question):
+        self.log.append(question)
+        if question.strip().upper() == '*IDN?':
+            return 'SIMULATED,GENERATOR,0,0\n'
+        return '\n'
+
+
+class SimulatedMeter:
+    # измеритель мощности без железа: FETCH? отвечает с задержкой, как медленное усреднение
+
+    def __init__(self, addr='SIM::METER', pow=10.0, noise=0.05, fetch_delay=0.5, seed=None):
+        self.addr = addr
+        self.status = 'simulated'
+
+        self._pow = pow
+        self._noise = noise
+        self._random = random.Random(seed)
+        self.fetchDelay = fetch_delay
+
+        self.log = list()
+
+    def __str__(self):
+        return f'{self.__class__.__name__}({self.addr})'
+
+    def send(self, cmd):
+        self.log.append(cmd)
+
+    def query(self, question):
+        self.log.append(question)
+        header = question.strip().upper()
+
+        if header == '*IDN?':
+            return 'SIMULATED,METER,0,0\n'
+        if header == 'FETCH?':
+            time.sleep(self.fetchDelay)
+            return f'{self._pow + self._random.gauss(0, self._noise)}\n'
+        return '\n'
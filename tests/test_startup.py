@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import HEADLESS_BUDGET, HEADLESS_FORBIDDEN, STARTUP_BUDGET, STARTUP_FORBIDDEN
+
+needs_qt = pytest.mark.skipif(importlib.util.find_spec('PyQt5') is None, reason='PyQt5 is not installed')
+# GUI и runner тянут контроллер, а тот -- закрытые пакеты стенда
+needs_bench = pytest.mark.skipif(
+    any(importlib.util.find_spec(name) is None for name in ('forgot_again', 'instr')),
+    reason='forgot_again or instr is not installed',
+)
+
+# импорт -- в чистом интерпретаторе, иначе модули, загруженные другими тестами, попадут в sys.modules
+IMPORT_SCRIPT = """
+import json
+import sys
+import time
+
+started = time.perf_counter()
+import {modules}
+print(json.dumps({{'elapsed': time.perf_counter() - started, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def _import(*modules):
+    proc = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(modules=', '.join(modules))],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        env={**os.environ, 'QT_QPA_PLATFORM': 'offscreen'},
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def _loaded(modules, names):
+    return sorted(name for name in names if any(m == name or m.startswith(f'{name}.') for m in modules))
+
+
+@needs_qt
+@needs_bench
+def test_gui_heavy_modules_load_on_first_use():
+    res = _import('main', 'mainwindow')
+    assert _loaded(res['modules'], STARTUP_FORBIDDEN) == []
+
+
+@needs_qt
+@needs_bench
+def test_gui_import_budget():
+    res = _import('main', 'mainwindow')
+    assert res['elapsed'] <= STARTUP_BUDGET
+
+
+@needs_bench
+def test_runner_imports_without_gui():
+    res = _import('runner')
+    assert _loaded(res['modules'], HEADLESS_FORBIDDEN) == []
+    assert res['elapsed'] <= HEADLESS_BUDGET
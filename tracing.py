@@ -0,0 +1,131 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+# таймлайн всего запуска в формате Chrome trace events (chrome://tracing, ui.perfetto.dev)
+# по умолчанию выключен, span() и traced() тогда почти ничего не стоят
+#   tracing.start('trace.json') ... tracing.stop()
+
+_events = None
+_started = 0.0
+_file_name = ''
+_threads = set()
+
+
+def enabled():
+    return _events is not None
+
+
+def start(file_name):
+    global _events, _started, _file_name
+    _events = list()
+    _started = time.perf_counter()
+    _file_name = file_name
+    _threads.clear()
+    _add({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0, 'args': {'name': os.path.basename(sys.argv[0]) or 'python'}})
+    atexit.register(stop)
+    print(f'tracing to {file_name}')
+
+
+def stop():
+    global _events
+    if _events is None:
+        return None
+    events, _events = _events, None
+    with open(_file_name, mode='wt', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    print(f'{len(events)} trace events written to {_file_name}')
+    return _file_name
+
+
+@contextmanager
+def span(name, cat='run', **args):
+    if _events is None:
+        yield
+        return
+    ts = _now()
+    try:
+        yield
+    finally:
+        _complete(name, cat, ts, args)
+
+
+def instant(name, cat='run', **args):
+    if _events is None:
+        return
+    _add({'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': _now(), 'pid': os.getpid(), 'tid': _tid(), 'args': args})
+
+
+def traced(name=None, cat='run', args=None):
+    # args -- функция от аргументов вызова, возвращает словарь для просмотрщика
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if _events is None:
+                return fn(*a, **kw)
+            ts = _now()
+            try:
+                return fn(*a, **kw)
+            finally:
+                _complete(label, cat, ts, args(*a, **kw) if args is not None else dict())
+        return wrapper
+    return decorator
+
+
+class TracingInstrument:
+    # каждая транзакция SCPI -- отдельный отрезок на таймлайне потока, из которого она вызвана
+
+    def __init__(self, name, inst):
+        self.name = name
+        self._inst = inst
+
+    def __getattr__(self, item):
+        return getattr(self._inst, item)
+
+    def __str__(self):
+        return f'{self._inst}'
+
+    def send(self, cmd):
+        with span(cmd, 'scpi', inst=self.name):
+            return self._inst.send(cmd)
+
+    def query(self, question):
+        with span(question, 'scpi', inst=self.name):
+            return self._inst.query(question)
+
+
+def instrument(name, inst):
+    if _events is None or not inst or isinstance(inst, TracingInstrument):
+        return inst
+    return TracingInstrument(name, inst)
+
+
+def _now():
+    return (time.perf_counter() - _started) * 1_000_000
+
+
+def _tid():
+    thread = threading.current_thread()
+    if thread.ident not in _threads:
+        _threads.add(thread.ident)
+        _add({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident, 'args': {'name': thread.name}})
+    return thread.ident
+
+
+def _complete(name, cat, ts, args):
+    _add({'name': name, 'cat': cat, 'ph': 'X', 'ts': ts, 'dur': _now() - ts, 'pid': os.getpid(), 'tid': _tid(), 'args': args})
+
+
+def _add(event):
+    # list.append под GIL атомарен, отдельная блокировка не нужна
+    events = _events
+    if events is not None:
+        events.append(event)
@@ -0,0 +1,82 @@
+import glob
+import hashlib
+import importlib.util
+import os
+import sys
+
+from PyQt5.QtCore import PYQT_VERSION_STR
+
+# формы .ui заранее переводятся в модули Python, при изменении формы модуль пересоздаётся:
+#   python uicache.py
+
+CACHE_DIR = 'uicache'
+# в сборке PyInstaller формы и кэш лежат в каталоге распаковки (install.py кладёт их туда), сборка их не пересоздаёт
+BASE_DIR = getattr(sys, '_MEIPASS', '')
+
+
+def load_ui(ui_file, baseinstance):
+    ui_file = os.path.join(BASE_DIR, ui_file)
+    try:
+        form = _compiled_form(ui_file)
+    except Exception as ex:
+        print(f'precompiled form for {ui_file} is unavailable: {ex}, loading at runtime')
+        from PyQt5 import uic
+        return uic.loadUi(ui_file, baseinstance)
+
+    ui = form()
+    ui.setupUi(baseinstance)
+    # как uic.loadUi: виджеты формы становятся атрибутами базового объекта
+    for name, value in vars(ui).items():
+        setattr(baseinstance, name, value)
+    return baseinstance
+
+
+def compile_all(pattern='*.ui'):
+    return [_compiled_path(ui_file) for ui_file in sorted(glob.glob(pattern))]
+
+
+def _module_name(ui_file):
+    with open(ui_file, mode='rb') as f:
+        digest = hashlib.sha1(f.read() + PYQT_VERSION_STR.encode('ascii')).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(ui_file))[0]
+    return stem, f'ui_{stem}_{digest}'
+
+
+def _compiled_path(ui_file):
+    stem, module = _module_name(ui_file)
+    path = os.path.join(BASE_DIR, CACHE_DIR, f'{module}.py')
+    if os.path.isfile(path):
+        return path
+    if getattr(sys, 'frozen', False):
+        raise FileNotFoundError(f'{path} is not bundled')
+
+    from PyQt5 import uic
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f'ui_{stem}_*.py')):
+        os.remove(stale)
+
+    tmp = f'{path}.tmp'
+    with open(tmp, mode='wt', encoding='utf-8') as out:
+        uic.compileUi(ui_file, out)
+    os.replace(tmp, path)
+    print(f'compiled {ui_file} -> {path}')
+    return path
+
+
+def _compiled_form(ui_file):
+    path = _compiled_path(ui_file)
+    _, module = _module_name(ui_file)
+
+    loaded = sys.modules.get(module)
+    if loaded is None:
+        spec = importlib.util.spec_from_file_location(module, path)
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+        sys.modules[module] = loaded
+
+    return next(getattr(loaded, name) for name in dir(loaded) if name.startswith('Ui_'))
+
+
+if __name__ == '__main__':
+    compile_all()